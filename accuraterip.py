@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+import wave
+import zlib
+from array import array
+from config import ACCURATERIP_DB_FILENAME
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SAMPLES_PER_FRAME = 588
+# AccurateRip ignores the first 5 frames (minus one sample) of the first track and
+# the last 5 frames of the last track, since drive offsets make them unreliable
+SKIP_SAMPLES = 5 * SAMPLES_PER_FRAME
+CHUNK_SAMPLES = 1024 * 1024
+
+def track_checksums(pcm, first_track=False, last_track=False):
+    """Compute CRC32 and AccurateRip v1/v2 checksums of 16-bit stereo PCM data.
+
+    Each stereo sample is read as one little-endian 32-bit word and multiplied by
+    its 1-based position; only positions inside the check window are summed."""
+    sample_count = len(pcm) // 4
+    check_from = SKIP_SAMPLES if first_track else 1
+    check_to = sample_count - SKIP_SAMPLES if last_track else sample_count
+    v1 = v2 = 0
+
+    if numpy is not None:
+        samples = numpy.frombuffer(pcm, dtype='<u4', count=sample_count)
+        for start in range(max(check_from, 1) - 1, check_to, CHUNK_SAMPLES):
+            end = min(start + CHUNK_SAMPLES, check_to)
+            products = samples[start:end].astype(numpy.uint64) * numpy.arange(start + 1, end + 1, dtype=numpy.uint64)
+            v1 += int(products.sum(dtype=numpy.uint64))
+            v2 += int((products & 0xFFFFFFFF).sum(dtype=numpy.uint64)) + int((products >> 32).sum(dtype=numpy.uint64))
+    else:
+        samples = array('I')
+        samples.frombytes(pcm[:sample_count * 4])
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        for position in range(max(check_from, 1), check_to + 1):
+            product = samples[position - 1] * position
+            v1 += product
+            v2 += (product & 0xFFFFFFFF) + (product >> 32)
+
+    return {"crc32": f"{zlib.crc32(pcm) & 0xFFFFFFFF:08x}",
+            "ar_v1": f"{v1 & 0xFFFFFFFF:08x}",
+            "ar_v2": f"{v2 & 0xFFFFFFFF:08x}"}
+
+def wav_checksums(path, first_track=False, last_track=False):
+    """Compute the checksums of a ripped WAV file (16-bit stereo, 44.1 kHz)."""
+    try:
+        with wave.open(path, 'rb') as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 2:
+                raise ValueError(f"{path} is not 16-bit stereo audio")
+            pcm = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"{path}: {e}")
+    return track_checksums(pcm, first_track, last_track)
+
+def disc_id(tracks):
+    """Return the AccurateRip disc identifier for a table of contents.
+
+    tracks is a sequence of (number, begin, length) tuples in CD frames, as
+    returned by audio_rip.read_toc."""
+    offsets = [begin for _, begin, _ in tracks]
+    leadout = tracks[-1][1] + tracks[-1][2]
+    id1 = sum(offsets) + leadout
+    id2 = sum(max(offset, 1) * number for number, offset, _ in tracks) + leadout * (len(tracks) + 1)
+
+    def digit_sum(value):
+        return sum(int(digit) for digit in str(value))
+    checksum = sum(digit_sum((offset + 150) // 75) for offset in offsets)
+    seconds = (leadout + 150) // 75 - (offsets[0] + 150) // 75
+    cddb = ((checksum % 0xFF) << 24) | (seconds << 8) | len(tracks)
+    return f"{len(tracks):03d}-{id1 & 0xFFFFFFFF:08x}-{id2 & 0xFFFFFFFF:08x}-{cddb:08x}"
+
+def default_db_path(rip_dir):
+    """The reference database lives next to the rip directories it describes."""
+    return os.path.join(os.path.dirname(os.path.abspath(rip_dir)), ACCURATERIP_DB_FILENAME)
+
+def load_reference_db(path):
+    """Load the local reference database: {disc_id: {track: [{"crc": hex, "confidence": n}, ...]}}."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def compare_track(checksums, references):
+    """Return (matched_version, confidence) for one track, or (None, 0) if nothing matches."""
+    for reference in references:
+        crc = reference["crc"].lower() if isinstance(reference, dict) else str(reference).lower()
+        confidence = reference.get("confidence", 1) if isinstance(reference, dict) else 1
+        if crc == checksums["ar_v2"]:
+            return "v2", confidence
+        if crc == checksums["ar_v1"]:
+            return "v1", confidence
+    return None, 0
+
+def compare_disc(identifier, checksums, db):
+    """Compare the checksums of all tracks ({track_number: checksums}) against the database.
+
+    Returns {track_number: (matched_version, confidence)}."""
+    disc = db.get(identifier, {})
+    return {number: compare_track(values, disc.get(str(number), [])) for number, values in checksums.items()}
+
+def record_disc(db_path, identifier, checksums):
+    """Add our own v2 checksums to the local database, raising the confidence of known ones."""
+    db = load_reference_db(db_path)
+    disc = db.setdefault(identifier, {})
+    for number, values in checksums.items():
+        references = disc.setdefault(str(number), [])
+        for reference in references:
+            if reference["crc"] == values["ar_v2"]:
+                reference["confidence"] = reference.get("confidence", 1) + 1
+                break
+        else:
+            references.append({"crc": values["ar_v2"], "confidence": 1})
+    with open(db_path + ".tmp", 'w') as f:
+        json.dump(db, f, indent=1, sort_keys=True)
+    os.replace(db_path + ".tmp", db_path)
+
+def format_results(checksums, results):
+    """Yield one human readable line per track."""
+    for number in sorted(checksums, key=int):
+        values = checksums[number]
+        version, confidence = results.get(number, (None, 0))
+        verdict = f"accurate ({version}, confidence {confidence})" if version else "not in database"
+        yield f"Track {int(number):2d}: CRC32 {values['crc32']}  AR v1 {values['ar_v1']}  AR v2 {values['ar_v2']}  {verdict}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify ripped audio tracks against a local AccurateRip-style database.")
+    parser.add_argument("rip_dir", help="Directory written by audio_rip.py (contains rip_state.json)")
+    parser.add_argument("--db", help=f"Local reference database (default: {ACCURATERIP_DB_FILENAME} next to rip_dir)")
+    parser.add_argument("--record", action="store_true", help="Add the checksums of this rip to the database")
+    args = parser.parse_args(argv)
+
+    from audio_rip import load_state
+    state = load_state(args.rip_dir)
+    if not state["toc"] or not state["checksums"]:
+        print("Error: no table of contents or checksums recorded for this rip", file=sys.stderr)
+        return 1
+    db_path = args.db or default_db_path(args.rip_dir)
+    identifier = disc_id(state["toc"])
+    results = compare_disc(identifier, state["checksums"], load_reference_db(db_path))
+    print(f"Disc {identifier}")
+    for line in format_results(state["checksums"], results):
+        print(line)
+    if args.record:
+        record_disc(db_path, identifier, state["checksums"])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
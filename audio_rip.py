@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import AUDIO_ENCODER, AUDIO_ENCODER_COMMANDS, AUDIO_ENCODER_WORKERS, AUDIO_KEEP_WAV
+from core_functions import check_tool_installed
+from iosched import imaging_preexec
+from accuraterip import wav_checksums
+
+# One audio track from the table of contents; lengths and offsets are in CD frames (1/75 s)
+Track = namedtuple('Track', ['number', 'begin', 'length'])
+
+STATE_FILENAME = "rip_state.json"
+TOC_LINE = re.compile(r'^\s*(\d+)\.\s+(\d+)\s+\[[^\]]*\]\s+(\d+)\s+\[')
+
+def read_toc(device):
+    """Read the audio table of contents once with cdparanoia -Q."""
+    result = subprocess.run(['cdparanoia', '-d', device, '-Q'], capture_output=True, text=True)
+    tracks = []
+    for line in result.stderr.splitlines():
+        match = TOC_LINE.match(line)
+        if match:
+            number, length, begin = (int(group) for group in match.groups())
+            tracks.append(Track(number, begin, length))
+    if not tracks:
+        raise RuntimeError(f"No audio tracks found on {device}: {result.stderr.strip()[-200:]}")
+    return tracks
+
+def wav_path(output_dir, number):
+    return os.path.join(output_dir, f"track{number:02d}.cdda.wav")
+
+def encoded_path(output_dir, number, encoder):
+    return os.path.join(output_dir, f"track{number:02d}.{encoder}")
+
+def load_state(output_dir):
+    """Return the ripped and encoded track numbers, the table of contents, the
+    per-track checksums and the tracks whose checksums went into the AccurateRip
+    database, as recorded in the output directory."""
+    try:
+        with open(os.path.join(output_dir, STATE_FILENAME), 'r') as f:
+            state = json.load(f)
+        return {"ripped": set(state.get("ripped", [])), "encoded": set(state.get("encoded", [])),
+                "toc": [Track(*track) for track in state.get("toc", [])], "checksums": state.get("checksums", {}),
+                "recorded": set(state.get("recorded", []))}
+    except (OSError, ValueError, TypeError):
+        return {"ripped": set(), "encoded": set(), "toc": [], "checksums": {}, "recorded": set()}
+
+def discard_state(output_dir, state):
+    """Remove the track files of an earlier rip and return an empty state."""
+    numbers = {track.number for track in state["toc"]} | state["ripped"] | state["encoded"]
+    numbers |= {int(number) for number in state["checksums"]}
+    for number in numbers:
+        paths = [wav_path(output_dir, number), wav_path(output_dir, number) + ".part"]
+        paths += [encoded_path(output_dir, number, encoder) for encoder in AUDIO_ENCODER_COMMANDS]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    return {"ripped": set(), "encoded": set(), "toc": [], "checksums": {}, "recorded": set()}
+
+def save_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILENAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump({key: sorted(value) if isinstance(value, set) else value for key, value in state.items()}, f)
+    os.replace(path + ".tmp", path)
+
+def checksum_track(output_dir, state, track, tracks):
+    """Compute the CRC32 and AccurateRip checksums of a ripped track while its WAV still exists."""
+    state["checksums"][str(track.number)] = wav_checksums(wav_path(output_dir, track.number),
+                                                          first_track=track is tracks[0], last_track=track is tracks[-1])
+
+def checksums_to_record(state, tracks):
+    """The checksums that may go into the AccurateRip database under the disc id of
+    tracks: only those of this table of contents, and each track only once."""
+    if state["toc"] != list(tracks):
+        return {}
+    numbers = {track.number for track in tracks}
+    return {number: values for number, values in state["checksums"].items()
+            if int(number) in numbers and int(number) not in state["recorded"]}
+
+def rip_track(device, output_dir, number, stop_event=None):
+    """Rip one track to WAV. The file only gets its final name once cdparanoia succeeded.
+
+    Returns False if the rip was stopped."""
+    final_path = wav_path(output_dir, number)
+    part_path = final_path + ".part"
+    process = subprocess.Popen(['cdparanoia', '-q', '-d', device, '-w', str(number), part_path],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True,
+                               preexec_fn=imaging_preexec)
+    try:
+        if stop_event is None:
+            process.wait()
+        while process.poll() is None:
+            if stop_event.wait(0.5):
+                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+                process.wait()
+                return False
+    finally:
+        stderr_output = process.stderr.read()
+        process.stderr.close()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr_output)
+    os.replace(part_path, final_path)
+    return True
+
+def encode_track(output_dir, number, encoder=AUDIO_ENCODER, keep_wav=AUDIO_KEEP_WAV):
+    """Encode a ripped WAV with the configured external encoder. Returns the track number."""
+    source = wav_path(output_dir, number)
+    target = encoded_path(output_dir, number, encoder)
+    command = [part.format(source=source, target=target) for part in AUDIO_ENCODER_COMMANDS[encoder]]
+    subprocess.run(command, check=True, capture_output=True)
+    if not keep_wav:
+        os.remove(source)
+    return number
+
+def rip_disc(device, output_dir, encoder=AUDIO_ENCODER, stop_event=None, on_progress=None, log=print, tracks=None):
+    """Rip an audio CD track by track while finished tracks are encoded in the background.
+
+    Finished tracks are recorded in a state file, so an interrupted rip resumes with
+    the first unfinished track. The state belongs to the table of contents it was
+    recorded with: a different disc in the same directory starts over. Encoders run as separate processes driven from a
+    thread pool, so the drive keeps reading while earlier tracks are encoded.
+    Checksums are computed right after each rip, before the WAV can be removed.
+    Returns the list of tracks and the state dict."""
+    os.makedirs(output_dir, exist_ok=True)
+    tracks = tracks or read_toc(device)
+    state = load_state(output_dir)
+    if state["toc"] != list(tracks) and (state["toc"] or state["ripped"] or state["encoded"] or state["checksums"]):
+        log(f"{output_dir} holds tracks of a different disc; they are removed and the rip starts over.")
+        state = discard_state(output_dir, state)
+    state["toc"] = list(tracks)
+    save_state(output_dir, state)
+    state["ripped"] = {n for n in state["ripped"] if n in state["encoded"] or os.path.exists(wav_path(output_dir, n))}
+    if encoder and not check_tool_installed(AUDIO_ENCODER_COMMANDS[encoder][0]):
+        log(f"{encoder} is not installed; tracks will only be saved as WAV.")
+        encoder = None
+    total = len(tracks)
+
+    def report():
+        if on_progress:
+            done = len(state["encoded"] if encoder else state["ripped"])
+            on_progress(done / total * 100)
+
+    def collect(futures, block):
+        finished, _ = wait(futures, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            futures.discard(future)
+            try:
+                state["encoded"].add(future.result())
+            except (OSError, subprocess.CalledProcessError) as e:
+                log(f"Encoding failed: {e}")
+        if finished:
+            save_state(output_dir, state)
+            report()
+
+    with ThreadPoolExecutor(max_workers=AUDIO_ENCODER_WORKERS) as encoders:
+        futures = set()
+        try:
+            for track in tracks:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                if track.number not in state["ripped"]:
+                    log(f"Ripping track {track.number} of {total}...")
+                    if not rip_track(device, output_dir, track.number, stop_event):
+                        break
+                    state["ripped"].add(track.number)
+                    save_state(output_dir, state)
+                    report()
+                if str(track.number) not in state["checksums"] and os.path.exists(wav_path(output_dir, track.number)):
+                    try:
+                        checksum_track(output_dir, state, track, tracks)
+                        save_state(output_dir, state)
+                    except (OSError, ValueError) as e:
+                        log(f"Could not checksum track {track.number}: {e}")
+                if encoder and track.number not in state["encoded"]:
+                    futures.add(encoders.submit(encode_track, output_dir, track.number, encoder))
+                collect(futures, block=False)
+        finally:
+            # Tracks already handed to the encoders are finished even if ripping failed
+            while futures:
+                collect(futures, block=True)
+    return tracks, state
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rip an audio CD track by track with resume and parallel encoding.")
+    parser.add_argument("device", help="Optical drive, e.g. /dev/sr0")
+    parser.add_argument("output_dir", help="Directory for the WAV and encoded files")
+    parser.add_argument("--encoder", choices=list(AUDIO_ENCODER_COMMANDS), default=AUDIO_ENCODER)
+    parser.add_argument("--wav-only", action="store_true", help="Do not encode")
+    args = parser.parse_args(argv)
+
+    stop_event = threading.Event()
+    try:
+        tracks, state = rip_disc(args.device, args.output_dir, None if args.wav_only else args.encoder, stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+        return 1
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Ripped {len(state['ripped'])} and encoded {len(state['encoded'])} of {len(tracks)} tracks")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import json
+import os
+import shlex
+import shutil
+from collections import namedtuple
+from config import (DDRESCUE_DEFAULT_OPTIONS, DD_BS_SIZE, SECTOR_SIZE, VIDEO_DVD_BACKUP, VIDEO_DVD_IMAGE,
+                    BACKEND_AUTO, BACKEND_DEFAULT_RATE, BACKEND_DEFAULT_DISC_SIZE, BACKEND_SPEED, BAD_SECTOR_SECONDS)
+from journal import parse_progress_line
+from mapfile import read_mapfile, FINISHED, BAD_SECTOR
+from throughput_profile import ddrescue_log_support, rates_log_path, reads_log_path, drive_profiles_path
+
+DATA = "Data CD/DVD"
+VIDEO = "Video/Music DVD"
+
+# What a job asks for: the ddrescue flags from the GUI, the domain mapfile of selected
+# files, the video DVD mode, and whether an earlier partial run is to be continued.
+ImagingOptions = namedtuple('ImagingOptions', ['n', 'r3', 'b', 'd', 'c', 'domain_mapfile', 'video_mode', 'resume'],
+                            defaults=[False, False, False, False, False, None, VIDEO_DVD_BACKUP, False])
+
+# What the cost model knows about the disc: its size in bytes (None if unknown), the bytes
+# rescued and known bad from an earlier run, and the drive's typical rate in bytes/s.
+DiscInfo = namedtuple('DiscInfo', ['size', 'rescued', 'bad', 'rate'], defaults=[None, 0, 0, None])
+
+class BackendError(Exception):
+    """Raised when the backend chosen by name cannot run."""
+
+class Backend:
+    """An imaging engine: how to run it, how to read its progress and what it costs.
+
+    Subclasses set the class attributes and implement commands(); register() makes
+    them available to select_backends() and the GUI."""
+    name = None
+    tools = ()              # executables that must be installed
+    resumable = False       # can continue an earlier partial run
+    handles_errors = False  # keeps going past unreadable sectors
+
+    def available(self):
+        return all(shutil.which(tool) for tool in self.tools)
+
+    def supports(self, media_type, options):
+        return False
+
+    def commands(self, device, output_path, options):
+        """Return the argv lists to try in order: the first choice, then fallbacks."""
+        raise NotImplementedError
+
+    def parse_progress(self, line, total_size=None):
+        """Throughput sample from one output line, with "percent" when it can be told."""
+        sample = parse_progress_line(line)
+        if "%" in line:
+            try:
+                sample["percent"] = float(line.split("%")[0].split()[-1])
+            except (ValueError, IndexError):
+                pass
+        elif total_size and "rescued_bytes" in sample:
+            sample["percent"] = min(100.0, sample["rescued_bytes"] / total_size * 100)
+        return sample
+
+    def estimate(self, disc, options):
+        """Expected seconds for the job, or None if this backend cannot do it."""
+        remaining = (disc.size or BACKEND_DEFAULT_DISC_SIZE) - (disc.rescued if options.resume else 0)
+        return max(0, remaining) / ((disc.rate or BACKEND_DEFAULT_RATE) * BACKEND_SPEED.get(self.name, 1.0))
+
+class DdBackend(Backend):
+    """Plain sequential copy: the fastest on intact discs, but it stops at the first read error."""
+    name = "dd"
+    tools = ("dd",)
+
+    def supports(self, media_type, options):
+        image = media_type == DATA or (media_type == VIDEO and options.video_mode == VIDEO_DVD_IMAGE)
+        return image and not options.domain_mapfile and not options.resume
+
+    def commands(self, device, output_path, options):
+        return [["sudo", "dd", f"if={device}", f"of={output_path}", f"bs={DD_BS_SIZE}", "status=progress"]]
+
+    def estimate(self, disc, options):
+        if disc.bad:
+            return None
+        return super().estimate(disc, options)
+
+class DdrescueBackend(Backend):
+    """GNU ddrescue with a mapfile: resumable, and rescues around bad areas."""
+    name = "ddrescue"
+    tools = ("ddrescue",)
+    resumable = True
+    handles_errors = True
+
+    def supports(self, media_type, options):
+        return media_type == DATA or (media_type == VIDEO and options.video_mode == VIDEO_DVD_IMAGE)
+
+    def commands(self, device, output_path, options):
+        arguments = list(DDRESCUE_DEFAULT_OPTIONS)
+        if options.n:
+            arguments.append("-n")
+        if options.r3:
+            arguments.append("-r3")
+        if options.b:
+            arguments += ["-b", str(SECTOR_SIZE)]
+        if options.d:
+            arguments.append("-d")
+        if options.c:
+            arguments.append("-C")
+        if options.domain_mapfile:
+            # Only rescue the areas marked finished in the domain mapfile (selected files and metadata)
+            arguments += ["-m", options.domain_mapfile]
+        if ddrescue_log_support():
+            arguments += [f"--log-rates={rates_log_path(output_path)}", f"--log-reads={reads_log_path(output_path)}"]
+        first = ["sudo", "ddrescue", *arguments, device, output_path, f"{output_path}.map"]
+        # Fall back to fewer retry passes, then to a run with the scraping phase
+        fallbacks = [[("-r1" if part == "-r3" else part) for part in first], [part for part in first if part != "-n"]]
+        commands = [first]
+        for command in fallbacks:
+            if command not in commands:
+                commands.append(command)
+        return commands
+
+    def estimate(self, disc, options):
+        seconds = super().estimate(disc, options)
+        passes = (0 if options.n else 1) + (3 if options.r3 else 0)
+        return seconds + disc.bad / SECTOR_SIZE * BAD_SECTOR_SECONDS * max(1, passes)
+
+class DvdbackupBackend(Backend):
+    """File-by-file copy of a video DVD with dvdbackup (handles CSS through libdvdcss)."""
+    name = "dvdbackup"
+    tools = ("dvdbackup",)
+
+    def supports(self, media_type, options):
+        return media_type == VIDEO and options.video_mode == VIDEO_DVD_BACKUP
+
+    def commands(self, device, output_path, options):
+        return [["dvdbackup", "-i", device, "-o", output_path, "-M"]]
+
+BACKENDS = {}
+
+def register(backend):
+    """Make a backend available by name. Registering a name again replaces the backend."""
+    BACKENDS[backend.name] = backend
+    return backend
+
+# Audio CDs are not imaged: iso_creation rips them track by track with audio_rip
+for _backend in (DdrescueBackend(), DdBackend(), DvdbackupBackend()):
+    register(_backend)
+
+def backend_for_command(argv):
+    """The registered backend whose executable runs argv (behind sudo or not)."""
+    for part in argv:
+        if os.path.basename(part) in BACKENDS:
+            return BACKENDS[os.path.basename(part)]
+    return None
+
+def describe_command(argv):
+    return shlex.join(argv)
+
+def device_size(device):
+    """Size of the disc in the drive (or of an image file) in bytes, or None."""
+    try:
+        fd = os.open(device, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return os.lseek(fd, 0, os.SEEK_END) or None
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+def disc_info(device, output_path, drive=None, profiles_path=None):
+    """Collect what the cost model uses: disc size, the state of an earlier run's
+    mapfile and the drive's median rate from its throughput profile (read from
+    profiles_path, by default the drive profiles next to output_path)."""
+    size = device_size(device)
+    rescued = bad = 0
+    mapfile = f"{output_path}.map"
+    if os.path.exists(mapfile):
+        for _, length, status in read_mapfile(mapfile)[2]:
+            if status == FINISHED:
+                rescued += length
+            elif status == BAD_SECTOR:
+                bad += length
+    rate = None
+    if drive:
+        try:
+            with open(profiles_path or drive_profiles_path(output_path), 'r') as f:
+                rate = json.load(f).get(drive, {}).get("median_rate") or None
+        except (OSError, ValueError):
+            pass
+    return DiscInfo(size, rescued, bad, rate)
+
+def select_backends(media_type, options, disc=None, method=BACKEND_AUTO):
+    """Order the backends for a job as [(backend, estimated seconds)], best first.
+
+    A backend chosen by name comes first if it can do the job. The others follow by
+    estimated cost, so a failed fast copy falls back to a slower but more robust one."""
+    disc = disc or DiscInfo()
+    ranked = []
+    for backend in BACKENDS.values():
+        if not backend.supports(media_type, options) or not backend.available():
+            continue
+        seconds = backend.estimate(disc, options)
+        if seconds is not None:
+            ranked.append((backend, seconds))
+    # Robust backends first among equals, then by cost
+    ranked.sort(key=lambda item: (item[1], not item[0].handles_errors))
+    chosen = BACKENDS.get(method)
+    if chosen is not None and chosen.available() and chosen.supports(media_type, options):
+        ranked = [(chosen, chosen.estimate(disc, options))] + [item for item in ranked if item[0] is not chosen]
+    return ranked
+
+def prepare_commands(media_type, device, output_path, options, disc=None, method=BACKEND_AUTO):
+    """Return (argv lists in the order to try them, plan) for a job; see select_backends.
+
+    Raises BackendError if the backend chosen by name is not installed."""
+    chosen = BACKENDS.get(method)
+    if chosen is not None and not chosen.available():
+        missing = [tool for tool in chosen.tools if not shutil.which(tool)]
+        raise BackendError(f"The {method} backend was chosen, but {', '.join(missing)} is not installed.")
+    plan = select_backends(media_type, options, disc, method)
+    if method != BACKEND_AUTO and plan and plan[0][0].name == method:
+        plan = plan[:1]  # an explicit choice only falls back within its own backend
+    commands = []
+    for backend, _ in plan:
+        commands.extend(backend.commands(device, output_path, options))
+    return commands, plan
+
+def format_plan(plan):
+    return ", ".join(f"{backend.name} ~{seconds / 60:.0f} min" if seconds is not None else backend.name
+                     for backend, seconds in plan)
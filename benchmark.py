@@ -0,0 +1,501 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from config import SECTOR_SIZE, JOB_EVENT_POLL_MS, JOB_EVENT_BATCH
+from durability import DURABILITY_LEVELS, DURABILITY_NONE
+from jobs import EventBus, Job, LogLine, Progress, Dialog, PROBING
+from mapfile import read_mapfile, write_mapfile, FINISHED, BAD_SECTOR, NON_TRIED, NON_TRIMMED
+from read_trace import TraceDrive, read_trace_header
+from synthetic_image import ImageBuilder, build_image, data_disc_files
+
+# Simulated drives: a source image plus a drive model read by the fake tools.
+#   size          bytes of files on the simulated disc (the image adds its file system structures)
+#   throughput    [[position fraction, bytes/s], ...] interpolated linearly (e.g. CAV: faster outside)
+#   latency       seconds added to every read command
+#   bad_sectors   [[first sector, count], ...] that never read (unless retry_success)
+#   bad_latency   seconds spent on every attempt to read a bad sector
+#   retry_success chance that a retry of a bad sector succeeds
+MIB = 1024 * 1024
+SCENARIOS = {
+    "intact": {"size": 64 * MIB, "throughput": [[0, 40e6], [1, 100e6]], "latency": 0.0002},
+    "damaged": {"size": 64 * MIB, "throughput": [[0, 40e6], [1, 100e6]], "latency": 0.0002,
+                "bad_sectors": [[4096, 32], [20000, 8], [30000, 64]], "bad_latency": 0.005, "retry_success": 0.3},
+    "slow_zone": {"size": 64 * MIB, "throughput": [[0, 60e6], [0.4, 60e6], [0.45, 4e6], [0.5, 60e6], [1, 60e6]],
+                  "latency": 0.0002},
+}
+# A recorded read trace (read_trace.py) replaces the drive model in "trace:<file name>" scenarios
+TRACE_PREFIX = "trace:"
+# Sources are synthetic file system images, so verification and cataloguing see real files
+SOURCE_FILES = 64
+METHODS = ["ddrescue", "dd"]
+MILESTONES = (50, 90, 99, 100)
+DRIVE_ENV = "ISO_RESCUE_BENCH_DRIVE"
+SHIMS = ("sudo", "ddrescue", "dd", "eject")
+CLUSTER_SIZE = 64 * 1024
+STATUS_INTERVAL = 0.25
+MONITOR_INTERVAL = 0.02
+REGRESSION_THRESHOLD = 0.10
+# The simulated discs take seconds, not the hour a real one can take: sync more often to match
+BENCH_SYNC_INTERVAL = 0.5
+
+class SimulatedDrive:
+    """Reads a source image with the timing and defects of a drive model."""
+
+    def __init__(self, source, model):
+        self.model = model
+        self.size = model["size"]
+        self.fd = os.open(source, os.O_RDONLY)
+        self.bad = set()
+        for first, count in model.get("bad_sectors", []):
+            self.bad.update(range(first, first + count))
+        self.random = random.Random(model.get("seed", 0))
+
+    def rate_at(self, pos):
+        points = self.model["throughput"]
+        fraction = pos / self.size
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            if fraction <= x1:
+                return y0 + (y1 - y0) * ((fraction - x0) / (x1 - x0) if x1 > x0 else 0)
+        return points[-1][1]
+
+    def read(self, pos, length, retry=False):
+        """Return (data, bad_sectors). data is None if any sector in the range is unreadable."""
+        first, last = pos // SECTOR_SIZE, (pos + length - 1) // SECTOR_SIZE
+        bad = [sector for sector in range(first, last + 1) if sector in self.bad]
+        if retry:
+            bad = [sector for sector in bad if self.random.random() >= self.model.get("retry_success", 0)]
+            for sector in (set(range(first, last + 1)) & self.bad) - set(bad):
+                self.bad.discard(sector)
+        delay = self.model.get("latency", 0) + length / self.rate_at(pos) + len(bad) * self.model.get("bad_latency", 0)
+        time.sleep(delay)
+        if bad:
+            return None, bad
+        return os.pread(self.fd, length, pos), []
+
+def load_drive():
+    with open(os.environ[DRIVE_ENV], 'r') as f:
+        config = json.load(f)
+    if "trace" in config:
+        return TraceDrive(config["source"], config["trace"])
+    return SimulatedDrive(config["source"], config["model"])
+
+def _status_blocks(statuses):
+    """Run-length encode per-sector status characters into mapfile blocks."""
+    blocks = []
+    start = 0
+    for index in range(1, len(statuses) + 1):
+        if index == len(statuses) or statuses[index] != statuses[start]:
+            blocks.append((start * SECTOR_SIZE, (index - start) * SECTOR_SIZE, chr(statuses[start])))
+            start = index
+    return blocks
+
+def shim_ddrescue(args):
+    """Minimal ddrescue: pass 1 by clusters, trimming/scraping by sectors, then -r retries."""
+    if "--help" in args or "-h" in args:
+        print("Usage: ddrescue [options] infile outfile [mapfile]\n  -n, --no-scrape\n  -r, --retry-passes=<n>\n"
+              "  -m, --domain-mapfile=<file>\n      --log-rates=<file>\n      --log-reads=<file>")
+        return 0
+    positional, options = [], {}
+    tokens = iter(args)
+    for token in tokens:
+        if token in ("-b", "-m", "-c"):
+            options[token] = next(tokens)
+        elif token.startswith("-r") and token[2:].isdigit():
+            options["-r"] = int(token[2:])
+        elif token.startswith("--log-rates=") or token.startswith("--log-reads="):
+            name, value = token.split("=", 1)
+            options[name] = value
+        elif token.startswith("-"):
+            options[token] = True
+        else:
+            positional.append(token)
+    _, output, mapfile = positional
+    drive = load_drive()
+    sectors = drive.size // SECTOR_SIZE
+    statuses = bytearray(NON_TRIED.encode()) * sectors
+    if os.path.exists(mapfile) and os.path.getsize(mapfile):
+        for pos, size, status in read_mapfile(mapfile)[2]:
+            statuses[pos // SECTOR_SIZE:(pos + size) // SECTOR_SIZE] = status.encode() * (size // SECTOR_SIZE)
+    wanted = bytearray(b'\x01') * sectors
+    if "-m" in options:
+        wanted = bytearray(sectors)
+        for pos, size, status in read_mapfile(options["-m"])[2]:
+            if status == FINISHED:
+                wanted[pos // SECTOR_SIZE:(pos + size) // SECTOR_SIZE] = b'\x01' * (size // SECTOR_SIZE)
+    out_fd = os.open(output, os.O_WRONLY | os.O_CREAT, 0o644)
+    rates_log = open(options["--log-rates"], 'w') if "--log-rates" in options else None
+    reads_log = open(options["--log-reads"], 'w') if "--log-reads" in options else None
+    started = last_status = time.time()
+    last_rescued = 0
+    errors = 0
+    finished_byte, bad_byte = ord(FINISHED), ord(BAD_SECTOR)
+
+    def status(pos, force=False):
+        nonlocal last_status, last_rescued
+        now = time.time()
+        if not force and now - last_status < STATUS_INTERVAL:
+            return
+        rescued = statuses.count(finished_byte) * SECTOR_SIZE
+        rate = (rescued - last_rescued) / max(now - last_status, 1e-6)
+        average = rescued / max(now - started, 1e-6)
+        bad_size = statuses.count(bad_byte) * SECTOR_SIZE
+        print(f"     ipos: {pos // 1000000:6d} MB, non-trimmed: 0 B,  current rate: {rate / 1000:8.0f} kB/s\n"
+              f"  rescued: {rescued / 1e6:8.2f} MB,  bad-sector: {bad_size} B,  average rate: {average / 1000:8.0f} kB/s\n"
+              f"pct rescued: {rescued / drive.size * 100:6.2f}%, read errors: {errors:6d},  remaining time: n/a", flush=True)
+        if rates_log:
+            rates_log.write(f"{now - started:6.0f}  0x{pos:010X}  {rate:10.0f}  {average:10.0f}  0  {bad_size}\n")
+        write_mapfile(mapfile, _status_blocks(statuses), pos)
+        last_status, last_rescued = now, rescued
+
+    def attempt(first, count, retry=False):
+        nonlocal errors
+        pos = first * SECTOR_SIZE
+        data, bad = drive.read(pos, count * SECTOR_SIZE, retry)
+        if reads_log:
+            reads_log.write(f"{time.time() - started:.6f}  0x{pos:010X}  {count * SECTOR_SIZE}  {0 if data is None else len(data)}  {len(bad) * SECTOR_SIZE}\n")
+        if data is None:
+            errors += 1
+            return False
+        os.pwrite(out_fd, data, pos)
+        statuses[first:first + count] = FINISHED.encode() * count
+        return True
+
+    try:
+        cluster = CLUSTER_SIZE // SECTOR_SIZE
+        for first in range(0, sectors, cluster):
+            count = min(cluster, sectors - first)
+            todo = [s for s in range(first, first + count) if wanted[s] and statuses[s] == ord(NON_TRIED)]
+            if len(todo) == count:
+                if not attempt(first, count):
+                    statuses[first:first + count] = NON_TRIMMED.encode() * count
+            else:
+                for sector in todo:
+                    if not attempt(sector, 1):
+                        statuses[sector] = bad_byte
+            status(first * SECTOR_SIZE)
+        if "-n" not in options:
+            for sector in range(sectors):
+                if statuses[sector] == ord(NON_TRIMMED) and not attempt(sector, 1):
+                    statuses[sector] = bad_byte
+                status(sector * SECTOR_SIZE)
+        for _ in range(options.get("-r", 0)):
+            for sector in range(sectors):
+                if statuses[sector] == bad_byte:
+                    attempt(sector, 1, retry=True)
+                    status(sector * SECTOR_SIZE)
+        status(drive.size, force=True)
+        print("Finished", flush=True)
+    finally:
+        os.close(out_fd)
+        for log in (rates_log, reads_log):
+            if log:
+                log.close()
+    return 0
+
+def shim_dd(args):
+    """Minimal dd: sequential reads, aborts on the first unreadable sector like dd without conv=noerror."""
+    options = dict(arg.split("=", 1) for arg in args if "=" in arg)
+    units = {"K": 1024, "M": MIB, "G": 1024 * MIB}
+    bs = options.get("bs", "512")
+    block_size = int(bs[:-1]) * units[bs[-1]] if bs[-1] in units else int(bs)
+    drive = load_drive()
+    started = last_status = time.time()
+    copied = 0
+    with open(options["of"], 'wb') as out:
+        while copied < drive.size:
+            data, _ = drive.read(copied, min(block_size, drive.size - copied))
+            if data is None:
+                print(f"dd: error reading '{options['if']}': Input/output error", file=sys.stderr)
+                return 1
+            out.write(data)
+            copied += len(data)
+            now = time.time()
+            if options.get("status") == "progress" and now - last_status >= 1:
+                print(f"{copied} bytes ({copied / 1e6:.0f} MB) copied, {now - started:.0f} s, "
+                      f"{copied / (now - started) / 1e6:.1f} MB/s", end="\r", file=sys.stderr, flush=True)
+                last_status = now
+    elapsed = max(time.time() - started, 1e-6)
+    records = -(-copied // block_size)
+    print(f"{records}+0 records in\n{records}+0 records out\n{copied} bytes ({copied / 1e6:.0f} MB) copied, "
+          f"{elapsed:.3f} s, {copied / elapsed / 1e6:.1f} MB/s", file=sys.stderr)
+    return 0
+
+def shim_main(name, args):
+    if name == "sudo":
+        os.execvp(args[0], args)
+    if name == "eject":
+        return 0
+    return {"ddrescue": shim_ddrescue, "dd": shim_dd}[name](args)
+
+def install_shims(bin_dir):
+    """Put fake sudo, ddrescue, dd and eject first on PATH."""
+    os.makedirs(bin_dir, exist_ok=True)
+    for name in SHIMS:
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" shim {name} "$@"\n')
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+
+class HeadlessView:
+    """Stands in for the job view: renders bus events the way the GUI does, counting
+    the widget updates, and answers dialogs like a user who never ejects."""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.events = 0
+        self._lines = 0
+        bus.subscribe(self.on_event)
+
+    def on_event(self, event):
+        if isinstance(event, LogLine):
+            self._lines += 1
+        elif isinstance(event, Progress):
+            self.events += 1
+        elif isinstance(event, Dialog) and event.reply is not None:
+            event.reply.set(None if event.kind == "choice" else False)
+
+    def poll(self):
+        """One GUI tick: take the waiting events and append the log lines in one insert."""
+        self.bus.dispatch(JOB_EVENT_BATCH)
+        if self._lines:
+            self.events += 1
+            self._lines = 0
+
+def write_source(path, size):
+    """Write a synthetic ISO9660/UDF disc holding about size bytes of files. Returns its size."""
+    builder = ImageBuilder(data_disc_files(size, SOURCE_FILES), volume_id="BENCHMARK", seed=1)
+    build_image(path, builder)
+    return builder.size
+
+def run_case(scenario, method, workdir, trace=None, trace_image=None, durability=DURABILITY_NONE,
+             sync_interval=BENCH_SYNC_INTERVAL):
+    """Run one scenario with one copy method and durability level through iso_creation.run_command
+    and measure it.
+
+    Trace scenarios replay trace over trace_image (random data of the traced size if not given)."""
+    import iso_creation
+    from journal import open_journal, read_journal
+    from backends import ImagingOptions, prepare_commands
+
+    source = os.path.join(workdir, "disc.bin")
+    drive = {"source": source}
+    if scenario.startswith(TRACE_PREFIX):
+        model = {"size": read_trace_header(trace)["size"]}
+        drive["trace"] = os.path.abspath(trace)
+        if trace_image:
+            source = drive["source"] = os.path.abspath(trace_image)
+        else:
+            write_source(source, model["size"])
+    else:
+        model = dict(SCENARIOS[scenario])
+        model["size"] = write_source(source, model["size"])
+    drive["model"] = model
+    drive_config = os.path.join(workdir, "drive.json")
+    with open(drive_config, 'w') as f:
+        json.dump(drive, f)
+    os.environ[DRIVE_ENV] = drive_config
+    install_shims(os.path.join(workdir, "bin"))
+
+    iso_path = os.path.join(workdir, "out.iso")
+    mapfile = iso_path + ".map"
+    commands, _ = prepare_commands("Data CD/DVD", source, iso_path, ImagingOptions(r3=True, b=True), method=method)
+    bus = EventBus()
+    view = HeadlessView(bus)
+    job = Job(bus, source, iso_path)
+    job.transition(PROBING)
+    journal = open_journal(iso_path, device=source, drive=f"simulated {scenario}", method=method)
+
+    milestones = {}
+    done = threading.Event()
+
+    def monitor():
+        next_tick = 0
+        while not done.is_set():
+            if time.time() >= next_tick:
+                view.poll()
+                next_tick = time.time() + JOB_EVENT_POLL_MS / 1000
+            try:
+                if method == "ddrescue":
+                    blocks = read_mapfile(mapfile)[2]
+                    rescued = sum(size for _, size, status in blocks if status == FINISHED)
+                else:
+                    rescued = os.path.getsize(iso_path)
+            except (OSError, ValueError):
+                rescued = 0
+            percent = rescued / model["size"] * 100
+            for milestone in MILESTONES:
+                if percent >= milestone and milestone not in milestones:
+                    milestones[milestone] = round(time.time() - started, 3)
+            done.wait(MONITOR_INTERVAL)
+
+    usage_self, usage_children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.time()
+    watcher = threading.Thread(target=monitor, daemon=True)
+    watcher.start()
+    iso_creation.run_command(commands, job, journal=journal, total_size=model["size"], durability=durability,
+                             sync_interval=sync_interval)
+    wall = time.time() - started
+    done.set()
+    watcher.join()
+    view.poll()
+    after_self, after_children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    records = read_journal(journal.path)
+    copy_time = sum(record["duration"] for record in records
+                    if record.get("event") == "span" and record.get("phase") == "copy")
+    syncs = [record for record in records if record.get("event") == "durability"]
+    if os.path.exists(mapfile):
+        rescued = sum(size for _, size, status in read_mapfile(mapfile)[2] if status == FINISHED)
+    elif os.path.exists(iso_path):
+        rescued = min(os.path.getsize(iso_path), model["size"])
+    else:
+        rescued = 0
+    gui_events = view.events
+    return {
+        "scenario": scenario, "method": method, "durability": durability, "outcome": job.outcome or "none",
+        "wall_seconds": round(wall, 3), "copy_seconds": round(copy_time, 3),
+        "throughput_mb_s": round(rescued / copy_time / 1e6, 2) if copy_time else 0,
+        "rescued_percent": round(rescued / model["size"] * 100, 3),
+        "time_to_percent": {str(milestone): seconds for milestone, seconds in sorted(milestones.items())},
+        "cpu_seconds": round(after_self.ru_utime + after_self.ru_stime - usage_self.ru_utime - usage_self.ru_stime, 3),
+        "tool_cpu_seconds": round(after_children.ru_utime + after_children.ru_stime
+                                  - usage_children.ru_utime - usage_children.ru_stime, 3),
+        "peak_rss_kb": after_self.ru_maxrss, "tool_peak_rss_kb": after_children.ru_maxrss,
+        "gui_events": gui_events, "gui_events_per_second": round(gui_events / wall, 1) if wall else 0,
+        "syncs": sum(record["syncs"] for record in syncs),
+        "sync_seconds": round(sum(record["sync_seconds"] for record in syncs), 4),
+    }
+
+def run_benchmarks(scenarios, methods, repeat=1, keep=False, trace=None, trace_image=None, durabilities=(DURABILITY_NONE,),
+                   sync_interval=BENCH_SYNC_INTERVAL):
+    """Run every scenario/method/durability combination in a fresh process, so peak RSS and CPU are per case.
+
+    With a trace, a replay of it is run as one more scenario."""
+    results = []
+    extra = []
+    if trace:
+        scenarios = list(scenarios) + [TRACE_PREFIX + os.path.basename(trace)]
+        extra = ["--trace", os.path.abspath(trace)] + (["--trace-image", os.path.abspath(trace_image)] if trace_image else [])
+    cases = [(scenario, method, durability) for scenario in scenarios for method in methods for durability in durabilities]
+    for scenario, method, durability in cases:
+        for _ in range(repeat):
+            # The shims' bin directory goes on PATH, which cannot contain ':'
+            workdir = tempfile.mkdtemp(prefix=f"bench-{scenario.replace(':', '-')}-{method}-{durability}-")
+            result_path = os.path.join(workdir, "result.json")
+            try:
+                subprocess.run([sys.executable, os.path.abspath(__file__), "case", scenario, method, workdir, result_path,
+                                "--durability", durability, "--sync-interval", str(sync_interval)]
+                               + extra, check=True, stdout=subprocess.DEVNULL)
+                with open(result_path, 'r') as f:
+                    result = json.load(f)
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                result = {"scenario": scenario, "method": method, "durability": durability,
+                          "outcome": f"harness error: {e}"}
+            finally:
+                if not keep:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            print(format_result(result))
+            results.append(result)
+    return results
+
+def format_result(result):
+    durability = result.get("durability", DURABILITY_NONE)
+    if "wall_seconds" not in result:
+        return f"{result['scenario']:<10} {result['method']:<9} {durability:<10} {result['outcome']}"
+    milestones = " ".join(f"{key}%:{value:.2f}s" for key, value in result["time_to_percent"].items())
+    return (f"{result['scenario']:<10} {result['method']:<9} {durability:<10} {result['outcome']:<8} "
+            f"{result['throughput_mb_s']:7.2f} MB/s "
+            f"{result['rescued_percent']:7.3f}% wall {result['wall_seconds']:6.2f}s cpu {result['cpu_seconds']:5.2f}s "
+            f"rss {result['peak_rss_kb'] // 1024} MB gui {result['gui_events_per_second']:.0f}/s "
+            f"sync {result.get('syncs', 0)}x {result.get('sync_seconds', 0):.2f}s  {milestones}")
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare_results(baseline, results, threshold=REGRESSION_THRESHOLD):
+    """Yield (key, message, regressed) for every case present in both result sets.
+
+    Results from before durability levels existed count as "none"."""
+    old = {(r["scenario"], r["method"], r.get("durability", DURABILITY_NONE)): r
+           for r in baseline["results"] if "throughput_mb_s" in r}
+    for result in results:
+        key = (result["scenario"], result["method"], result.get("durability", DURABILITY_NONE))
+        if key not in old or "throughput_mb_s" not in result or not old[key]["throughput_mb_s"]:
+            continue
+        change = result["throughput_mb_s"] / old[key]["throughput_mb_s"] - 1
+        regressed = change < -threshold
+        yield key, f"{'/'.join(key)}: throughput {change * 100:+.1f}%, wall {old[key]['wall_seconds']:.2f}s -> {result['wall_seconds']:.2f}s", regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the copy paths against simulated drives.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run the benchmark suite")
+    run_parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    run_parser.add_argument("--methods", nargs="+", choices=METHODS, default=METHODS)
+    run_parser.add_argument("--durability", nargs="+", choices=DURABILITY_LEVELS, default=list(DURABILITY_LEVELS),
+                            help="Durability levels to compare (default: all)")
+    run_parser.add_argument("--sync-interval", type=float, default=BENCH_SYNC_INTERVAL,
+                            help=f"Seconds between syncs (default: {BENCH_SYNC_INTERVAL})")
+    run_parser.add_argument("--repeat", type=int, default=1)
+    run_parser.add_argument("--output", help="Write the results as JSON")
+    run_parser.add_argument("--compare", help="Earlier results to compare against; exits 1 on a throughput regression")
+    run_parser.add_argument("--keep", action="store_true", help="Keep the work directories")
+    run_parser.add_argument("--trace", help="Also replay this read trace (see read_trace.py)")
+    run_parser.add_argument("--trace-image", help="Image to serve during the trace replay (default: random data)")
+    case_parser = subparsers.add_parser("case", help=argparse.SUPPRESS)
+    case_parser.add_argument("scenario")
+    case_parser.add_argument("method")
+    case_parser.add_argument("workdir")
+    case_parser.add_argument("result")
+    case_parser.add_argument("--trace")
+    case_parser.add_argument("--trace-image")
+    case_parser.add_argument("--durability", default=DURABILITY_NONE)
+    case_parser.add_argument("--sync-interval", type=float, default=BENCH_SYNC_INTERVAL)
+    shim_parser = subparsers.add_parser("shim", help=argparse.SUPPRESS)
+    shim_parser.add_argument("name", choices=SHIMS)
+    shim_parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.command == "shim":
+        return shim_main(args.name, args.args)
+    if args.command == "case":
+        result = run_case(args.scenario, args.method, args.workdir, args.trace, args.trace_image, args.durability,
+                          args.sync_interval)
+        with open(args.result, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    results = run_benchmarks(args.scenarios, args.methods, args.repeat, args.keep, args.trace, args.trace_image,
+                             args.durability, args.sync_interval)
+    report = {"revision": git_revision(), "python": platform.python_version(), "created": time.time(),
+              "scenarios": {name: SCENARIOS[name] for name in args.scenarios}, "trace": args.trace,
+              "sync_interval": args.sync_interval, "results": results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = 0
+        for _, message, regressed in compare_results(baseline, results):
+            print(message + ("  REGRESSION" if regressed else ""))
+            regressions += regressed
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
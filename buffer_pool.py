@@ -0,0 +1,119 @@
+import mmap
+import threading
+from contextlib import contextmanager
+from config import BUFFER_POOL_CEILING, BUFFER_POOL_MIN_SIZE
+
+class BufferPoolError(Exception):
+    """Raised when a buffer larger than the pool's ceiling is requested."""
+
+def size_class(size, min_size=BUFFER_POOL_MIN_SIZE):
+    """Round size up to a power of two of at least min_size, so freed buffers fit later requests."""
+    rounded = max(min_size, mmap.PAGESIZE)
+    while rounded < size:
+        rounded *= 2
+    return rounded
+
+class BufferPool:
+    """Reusable page-aligned buffers for every job in the process, under one memory ceiling.
+
+    Buffers are anonymous mmaps, so they are aligned for O_DIRECT and go back to
+    the system as soon as they are dropped. Free buffers are kept for reuse and
+    count against the ceiling like buffers in use; when a new one would not fit,
+    free buffers of other sizes are dropped first, and only then does acquire()
+    wait for another consumer to release one. usage() reports current and peak
+    bytes per consumer."""
+
+    def __init__(self, ceiling=BUFFER_POOL_CEILING, min_size=BUFFER_POOL_MIN_SIZE):
+        self.ceiling = ceiling
+        self.min_size = min_size
+        self._cond = threading.Condition()
+        self._free = {}         # size -> [mmap]
+        self._owners = {}       # id(mmap) -> consumer
+        self._allocated = 0     # bytes in use or free
+        self._in_use = {}       # consumer -> bytes
+        self._peak = {}         # consumer -> bytes
+        self.peak = 0
+        self.waits = 0
+
+    def acquire(self, size, consumer, block=True):
+        """A buffer of at least size bytes for consumer, or None if block is False and
+        the pool is exhausted. Give it back with release()."""
+        size = size_class(size, self.min_size)
+        if size > self.ceiling:
+            raise BufferPoolError(f"A {size} byte buffer does not fit the {self.ceiling} byte buffer pool")
+        with self._cond:
+            waited = False
+            while True:
+                free = self._free.get(size)
+                if free:
+                    buffer = free.pop()
+                    break
+                if self._make_room(size):
+                    buffer = mmap.mmap(-1, size)
+                    self._allocated += size
+                    break
+                if not block:
+                    return None
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                self._cond.wait()
+            self._owners[id(buffer)] = consumer
+            self._in_use[consumer] = self._in_use.get(consumer, 0) + size
+            self._peak[consumer] = max(self._peak.get(consumer, 0), self._in_use[consumer])
+            self.peak = max(self.peak, sum(self._in_use.values()))
+            return buffer
+
+    def _make_room(self, size):
+        """Drop free buffers until size more bytes fit under the ceiling. Returns True if they do."""
+        for free in self._free.values():
+            while free and self._allocated + size > self.ceiling:
+                buffer = free.pop()
+                self._allocated -= len(buffer)
+                buffer.close()
+        return self._allocated + size <= self.ceiling
+
+    def release(self, buffer):
+        with self._cond:
+            consumer = self._owners.pop(id(buffer))
+            self._in_use[consumer] -= len(buffer)
+            self._free.setdefault(len(buffer), []).append(buffer)
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, size, consumer):
+        """A memoryview of exactly size bytes of a pooled buffer for the duration of the block."""
+        buffer = self.acquire(size, consumer)
+        view = memoryview(buffer)[:size]
+        try:
+            yield view
+        finally:
+            view.release()
+            self.release(buffer)
+
+    def usage(self):
+        """{consumer: (bytes in use, peak bytes in use)}."""
+        with self._cond:
+            return {consumer: (self._in_use[consumer], self._peak[consumer]) for consumer in self._in_use}
+
+    def allocated(self):
+        """Bytes held by the pool, in use or free."""
+        with self._cond:
+            return self._allocated
+
+    def trim(self):
+        """Give all free buffers back to the system."""
+        with self._cond:
+            for free in self._free.values():
+                while free:
+                    buffer = free.pop()
+                    self._allocated -= len(buffer)
+                    buffer.close()
+
+def format_usage(pool):
+    usage = pool.usage()
+    parts = [f"{consumer} {current / 1e6:.0f}/{peak / 1e6:.0f} MB" for consumer, (current, peak) in sorted(usage.items())]
+    return (f"Buffer pool: {pool.allocated() / 1e6:.0f} of {pool.ceiling / 1e6:.0f} MB allocated, "
+            f"peak {pool.peak / 1e6:.0f} MB in use" + (f" ({', '.join(parts)}, current/peak)" if parts else ""))
+
+pool = BufferPool()
@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config import CATALOG_FILENAME, CHUNKED_IMAGE_EXTENSION
+from iso_filesystem import open_image, read_filesystem, FilesystemError
+from fingerprint import compute_fingerprint
+from damage_report import unrescued_ranges, classify_file
+from mapfile import read_mapfile, mapfile_size, FINISHED
+from iosched import scheduler, background, HASH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS discs (
+    id INTEGER PRIMARY KEY,
+    image_path TEXT NOT NULL UNIQUE,
+    device TEXT,
+    drive TEXT,
+    started REAL,
+    finished REAL,
+    duration REAL,
+    method TEXT,
+    rescued_percent REAL,
+    size INTEGER,
+    sha256 TEXT,
+    fingerprint TEXT,
+    volume_id TEXT,
+    fs_type TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    disc_id INTEGER NOT NULL REFERENCES discs(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    size INTEGER,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files(name);
+CREATE INDEX IF NOT EXISTS files_disc ON files(disc_id);
+CREATE INDEX IF NOT EXISTS discs_fingerprint ON discs(fingerprint);
+CREATE INDEX IF NOT EXISTS discs_volume_id ON discs(volume_id);
+"""
+
+IMAGE_EXTENSIONS = (".iso", CHUNKED_IMAGE_EXTENSION)
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+def connect(catalog_path):
+    """Open (and create if needed) a catalog database."""
+    conn = sqlite3.connect(catalog_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def default_catalog_path(image_path):
+    """The catalog lives next to the images it describes."""
+    return os.path.join(os.path.dirname(os.path.abspath(image_path)), CATALOG_FILENAME)
+
+def image_sha256(image_path):
+    """SHA-256 of the raw image data (decompressed for chunked images)."""
+    digest = hashlib.sha256()
+    data = open_image(image_path)
+    try:
+        with background(HASH):
+            for offset in range(0, len(data), HASH_BLOCK_SIZE):
+                scheduler.take(HASH, min(HASH_BLOCK_SIZE, len(data) - offset))
+                digest.update(data[offset:offset + HASH_BLOCK_SIZE])
+    finally:
+        data.close()
+    return digest.hexdigest()
+
+def describe_image(image_path, mapfile=None, compute_hash=True, log=None):
+    """Collect everything the catalog stores that can be read from the image itself.
+
+    The file listing comes from the in-process ISO9660/UDF walker; with a mapfile
+    every file is also classified as intact, partial or lost. log(message, level=...)
+    is told when the image has no readable file system."""
+    info = {"size": None, "sha256": None, "fingerprint": None, "volume_id": None, "fs_type": None,
+            "rescued_percent": None, "files": []}
+    data = open_image(image_path)
+    try:
+        info["size"] = len(data)
+        try:
+            listing = read_filesystem(data)
+        except FilesystemError as e:
+            if log is not None:
+                log(f"No file listing for {image_path}: {e}", level="WARNING")
+            listing = None
+    finally:
+        data.close()
+    info["fingerprint"] = compute_fingerprint(image_path)
+    if compute_hash:
+        info["sha256"] = image_sha256(image_path)
+
+    ranges = None
+    if mapfile and os.path.exists(mapfile):
+        _, _, blocks = read_mapfile(mapfile)
+        total = mapfile_size(blocks)
+        if total:
+            info["rescued_percent"] = sum(size for _, size, status in blocks if status == FINISHED) / total * 100
+        ranges = unrescued_ranges(blocks)
+    if listing is not None:
+        info["volume_id"], info["fs_type"] = listing.volume_id, listing.fs_type
+        for entry in listing.files:
+            status = classify_file(entry, ranges)[0] if ranges else None
+            info["files"].append((entry.path, entry.size, status))
+    return info
+
+def record_disc(conn, image_path, info, device=None, drive=None, method=None, started=None, finished=None):
+    """Insert (or replace) a disc and its file listing in one transaction. Returns the disc id."""
+    duration = finished - started if started and finished else None
+    with conn:
+        conn.execute("DELETE FROM discs WHERE image_path = ?", (image_path,))
+        cursor = conn.execute(
+            "INSERT INTO discs (image_path, device, drive, started, finished, duration, method, rescued_percent, "
+            "size, sha256, fingerprint, volume_id, fs_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (image_path, device, drive, started, finished, duration, method, info["rescued_percent"],
+             info["size"], info["sha256"], info["fingerprint"], info["volume_id"], info["fs_type"]))
+        disc_id = cursor.lastrowid
+        conn.executemany("INSERT INTO files (disc_id, path, name, size, status) VALUES (?, ?, ?, ?, ?)",
+                         ((disc_id, path, path.rsplit('/', 1)[-1], size, status) for path, size, status in info["files"]))
+    return disc_id
+
+def search_files(conn, name, limit=100):
+    """Find files by name. A trailing '*' makes it a prefix search; both use the name index."""
+    query = ("SELECT discs.image_path, discs.volume_id, files.path, files.size, files.status "
+             "FROM files JOIN discs ON discs.id = files.disc_id WHERE ")
+    if name.endswith('*'):
+        prefix = name[:-1].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return conn.execute(query + "files.name LIKE ? ESCAPE '\\' LIMIT ?", (prefix + '%', limit)).fetchall()
+    return conn.execute(query + "files.name = ? LIMIT ?", (name, limit)).fetchall()
+
+def find_discs(conn, fingerprint=None, volume_id=None):
+    """Return (image_path, volume_id, finished, rescued_percent) rows matching the given keys."""
+    query = "SELECT image_path, volume_id, finished, rescued_percent FROM discs"
+    if fingerprint:
+        return conn.execute(query + " WHERE fingerprint = ? ORDER BY finished", (fingerprint,)).fetchall()
+    if volume_id:
+        return conn.execute(query + " WHERE volume_id = ? ORDER BY finished", (volume_id,)).fetchall()
+    return conn.execute(query + " ORDER BY finished").fetchall()
+
+def _describe_for_reindex(image_path, compute_hash):
+    # Chunked images keep the mapfile of the raw image they were converted from
+    mapfile = os.path.splitext(image_path)[0] + ".iso.map"
+    # Runs in a worker process: messages go back with the result
+    messages = []
+    info = describe_image(image_path, mapfile, compute_hash,
+                          log=lambda message, level="INFO": messages.append((message, level)))
+    return image_path, info, os.path.getmtime(image_path), messages
+
+def reindex(catalog_path, directory, compute_hash=False, workers=None, log=None):
+    """Fill the catalog from a directory of existing images.
+
+    Images are read in a process pool; the results are inserted by this process
+    so only one writer touches the database. Skipped images and other warnings go
+    to log(message, level=...). Returns the number of images indexed."""
+    images = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(IMAGE_EXTENSIONS))
+    conn = connect(catalog_path)
+    indexed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_describe_for_reindex, path, compute_hash) for path in images]
+            for future in as_completed(futures):
+                try:
+                    image_path, info, mtime, messages = future.result()
+                except (OSError, FilesystemError) as e:
+                    if log is not None:
+                        log(f"Skipping image: {e}", level="WARNING")
+                    continue
+                if log is not None:
+                    for message, level in messages:
+                        log(message, level=level)
+                record_disc(conn, os.path.abspath(image_path), info, method="reindex", finished=mtime)
+                indexed += 1
+    finally:
+        conn.close()
+    return indexed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Catalog of rescued disc images and the files they contain.")
+    parser.add_argument("catalog", help="Path to the catalog database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    search_parser = subparsers.add_parser("search", help="Find which disc holds a file (use NAME* for a prefix search)")
+    search_parser.add_argument("name")
+    search_parser.add_argument("--limit", type=int, default=100)
+    discs_parser = subparsers.add_parser("discs", help="List catalogued discs")
+    discs_parser.add_argument("--volume-id")
+    discs_parser.add_argument("--fingerprint")
+    reindex_parser = subparsers.add_parser("reindex", help="Catalog all images in a directory")
+    reindex_parser.add_argument("directory")
+    reindex_parser.add_argument("--hash", action="store_true", help="Also compute the SHA-256 of every image")
+    reindex_parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "reindex":
+            started = time.time()
+            count = reindex(args.catalog, args.directory, args.hash, args.workers,
+                            log=lambda message, level="INFO": print(message))
+            print(f"Indexed {count} images in {time.time() - started:.1f} s")
+            return 0
+        conn = connect(args.catalog)
+        try:
+            if args.command == "search":
+                started = time.perf_counter()
+                rows = search_files(conn, args.name, args.limit)
+                for image_path, volume_id, path, size, status in rows:
+                    print(f"{image_path} [{volume_id}] {path} ({size} bytes{', ' + status if status else ''})")
+                print(f"{len(rows)} matches in {(time.perf_counter() - started) * 1000:.1f} ms")
+            else:
+                for image_path, volume_id, finished, rescued in find_discs(conn, args.fingerprint, args.volume_id):
+                    when = time.strftime('%Y-%m-%d %H:%M', time.localtime(finished)) if finished else "unknown"
+                    rescued_text = f"{rescued:.2f}%" if rescued is not None else "n/a"
+                    print(f"{when}  {rescued_text:>8}  [{volume_id}] {image_path}")
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import lzma
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from config import CHUNKED_IMAGE_CHUNK_SIZE, CHUNKED_IMAGE_CODEC, CHUNKED_IMAGE_WORKERS
+from iosched import scheduler, background, advise_sequential, advise_done, COMPRESS
+from buffer_pool import pool
+from iso_filesystem import FilesystemError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File layout:
+#   header  MAGIC, version, codec, chunk size, image size
+#   chunks  independently compressed, in image order
+#   index   one entry per chunk: file offset, stored length, codec, CRC32 of the raw data
+#   footer  index offset, chunk count, INDEX_MAGIC
+MAGIC = b'ISOZCHNK'
+INDEX_MAGIC = b'ISOZINDX'
+VERSION = 1
+HEADER = struct.Struct('<8sHBxIQ')
+INDEX_ENTRY = struct.Struct('<QIBI')
+FOOTER = struct.Struct('<QQ8s')
+
+CODEC_STORED = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_ZSTD = 3
+CODECS = {"zlib": CODEC_ZLIB, "lzma": CODEC_LZMA, "zstd": CODEC_ZSTD}
+
+CACHE_CHUNKS = 16
+DECOMPRESS_ERRORS = (zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+class ChunkedImageError(FilesystemError):
+    """Raised when a chunked image is malformed or a chunk fails its checksum or does
+    not decompress. A FilesystemError, so callers skipping unreadable images skip these too."""
+
+def is_chunked_image(path):
+    """Return True if the file starts with the chunked image magic."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def _compress(data, codec, level):
+    if codec == CODEC_ZLIB:
+        compressed = zlib.compress(data, level)
+    elif codec == CODEC_LZMA:
+        compressed = lzma.compress(data, preset=level)
+    elif codec == CODEC_ZSTD:
+        compressed = zstandard.ZstdCompressor(level=level).compress(data)
+    else:
+        compressed = data
+    # Incompressible chunks (already compressed video, random data) are stored as-is
+    if len(compressed) >= len(data):
+        return data, CODEC_STORED, zlib.crc32(data)
+    return compressed, codec, zlib.crc32(data)
+
+def _decompress(data, codec):
+    if codec == CODEC_STORED:
+        return data
+    try:
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        if codec == CODEC_LZMA:
+            return lzma.decompress(data)
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ChunkedImageError("zstd-compressed image, but the zstandard module is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+    except DECOMPRESS_ERRORS as e:
+        raise ChunkedImageError(f"Corrupt chunk: {e}")
+    raise ChunkedImageError(f"Unknown chunk codec {codec}")
+
+class ChunkedImageWriter:
+    """Write an image as independently compressed fixed-size chunks.
+
+    Chunks are compressed on a thread pool (zlib, lzma and zstd release the GIL)
+    while a bounded number of results is kept in flight, so memory use does not
+    grow with the image size. Chunk buffers come from the shared buffer pool.
+    Data is written in image order."""
+
+    def __init__(self, path, codec=CHUNKED_IMAGE_CODEC, chunk_size=CHUNKED_IMAGE_CHUNK_SIZE, level=None, workers=CHUNKED_IMAGE_WORKERS):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}, expected one of {', '.join(CODECS)}")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("The zstandard module is not installed")
+        self.codec = CODECS[codec]
+        self.level = level if level is not None else {"zlib": 3, "lzma": 1, "zstd": 3}[codec]
+        self.chunk_size = chunk_size
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.codec, chunk_size, 0))
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = workers * 2
+        self.pending = deque()      # (future, buffer) in image order
+        self.buffer = None          # pooled buffer being filled
+        self.view = None
+        self.filled = 0
+        self.index = []
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        self.sha256.update(data)
+        data = memoryview(data)
+        while data:
+            if self.buffer is None:
+                self._acquire()
+            take = min(len(data), self.chunk_size - self.filled)
+            self.view[self.filled:self.filled + take] = data[:take]
+            self.filled += take
+            data = data[take:]
+            if self.filled == self.chunk_size:
+                self._submit()
+
+    def _acquire(self):
+        # Waiting for the pool with chunks in flight could wait for ourselves: write those out first
+        while True:
+            self.buffer = pool.acquire(self.chunk_size, COMPRESS, block=not self.pending)
+            if self.buffer is not None:
+                break
+            self._write_next()
+        self.view = memoryview(self.buffer)
+        self.filled = 0
+
+    def _submit(self):
+        chunk = self.view[:self.filled]
+        self.view.release()
+        self.pending.append((self.executor.submit(_compress, chunk, self.codec, self.level), self.buffer, chunk))
+        self.buffer = self.view = None
+        while len(self.pending) >= self.max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        future, buffer, chunk = self.pending.popleft()
+        try:
+            compressed, codec, crc = future.result()
+            self.index.append((self.file.tell(), len(compressed), codec, crc))
+            self.file.write(compressed)
+        finally:
+            chunk.release()
+            pool.release(buffer)
+
+    def _release_buffers(self):
+        for _, buffer, chunk in self.pending:
+            chunk.release()
+            pool.release(buffer)
+        self.pending.clear()
+        if self.buffer is not None:
+            self.view.release()
+            pool.release(self.buffer)
+            self.buffer = self.view = None
+
+    def close(self):
+        """Flush the remaining chunks and write the index and footer."""
+        if self.buffer is not None:
+            if self.filled:
+                self._submit()
+            else:
+                self._release_buffers()
+        while self.pending:
+            self._write_next()
+        self.executor.shutdown()
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), INDEX_MAGIC))
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.codec, self.chunk_size, self.size))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """Give up: release the buffers and remove the partial file, which has no index
+        and would make every later reader fail."""
+        # Running compressions still read their buffers: wait for them before releasing
+        self.executor.shutdown(cancel_futures=True)
+        self._release_buffers()
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+            return
+        try:
+            self.close()
+        except BaseException:
+            self.abort()
+            raise
+
+class ChunkedImage:
+    """Random-access reader for chunked images.
+
+    Supports len() and byte slicing like the mmap returned by iso_filesystem.open_image,
+    decompressing only the chunks a slice touches. Recently used chunks are cached.
+    Safe to use from several threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        try:
+            self._read_index()
+        except BaseException:
+            os.close(self.fd)
+            raise
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _read_index(self):
+        path = self.path
+        header = os.pread(self.fd, HEADER.size, 0)
+        if len(header) < HEADER.size:
+            raise ChunkedImageError(f"Not a chunked image: {path}")
+        magic, version, self.codec, self.chunk_size, self.size = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ChunkedImageError(f"Not a chunked image: {path}")
+        file_size = os.fstat(self.fd).st_size
+        footer = os.pread(self.fd, FOOTER.size, max(file_size - FOOTER.size, 0))
+        if len(footer) < FOOTER.size or footer[-len(INDEX_MAGIC):] != INDEX_MAGIC:
+            raise ChunkedImageError(f"Chunked image has no index (incomplete write?): {path}")
+        index_offset, chunk_count, _ = FOOTER.unpack(footer)
+        raw_index = os.pread(self.fd, chunk_count * INDEX_ENTRY.size, index_offset)
+        if len(raw_index) < chunk_count * INDEX_ENTRY.size:
+            raise ChunkedImageError(f"Chunked image index is truncated: {path}")
+        self.index = [INDEX_ENTRY.unpack_from(raw_index, i * INDEX_ENTRY.size) for i in range(chunk_count)]
+
+    def __len__(self):
+        return self.size
+
+    def chunk(self, number):
+        """Return the decompressed contents of one chunk."""
+        with self.lock:
+            if number in self.cache:
+                self.cache.move_to_end(number)
+                return self.cache[number]
+        offset, length, codec, crc = self.index[number]
+        data = _decompress(os.pread(self.fd, length, offset), codec)
+        if zlib.crc32(data) != crc:
+            raise ChunkedImageError(f"Checksum mismatch in chunk {number} of {self.path}")
+        with self.lock:
+            self.cache[number] = data
+            if len(self.cache) > CACHE_CHUNKS:
+                self.cache.popitem(last=False)
+        return data
+
+    def read(self, offset, length):
+        """Read length bytes starting at offset; shorter at the end of the image."""
+        end = min(offset + length, self.size)
+        parts = []
+        while offset < end:
+            number, chunk_offset = divmod(offset, self.chunk_size)
+            data = self.chunk(number)[chunk_offset:chunk_offset + end - offset]
+            parts.append(data)
+            offset += len(data)
+        return b''.join(parts)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self.read(index, 1)[0]
+        start, stop, _ = index.indices(self.size)
+        return self.read(start, stop - start) if stop > start else b''
+
+    def close(self):
+        os.close(self.fd)
+
+def compress_image(source, destination, codec=CHUNKED_IMAGE_CODEC, chunk_size=CHUNKED_IMAGE_CHUNK_SIZE, level=None, workers=CHUNKED_IMAGE_WORKERS):
+    """Convert a raw image into a chunked image. Returns the SHA-256 of the raw data."""
+    with background(COMPRESS), open(source, 'rb') as src, \
+            ChunkedImageWriter(destination, codec, chunk_size, level, workers) as writer:
+        advise_sequential(src.fileno())
+        offset = 0
+        with pool.lease(chunk_size, COMPRESS) as buffer:
+            while True:
+                count = src.readinto(buffer)
+                if not count:
+                    break
+                scheduler.take(COMPRESS, count)
+                writer.write(buffer[:count])
+                advise_done(src.fileno(), offset, count)
+                offset += count
+    return writer.sha256.hexdigest()
+
+def decompress_image(source, destination):
+    """Restore the raw image from a chunked image. Returns the SHA-256 of the raw data."""
+    image = ChunkedImage(source)
+    sha256 = hashlib.sha256()
+    try:
+        with open(destination, 'wb') as dst:
+            for number in range(len(image.index)):
+                data = image.chunk(number)
+                sha256.update(data)
+                dst.write(data)
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+    finally:
+        image.close()
+    return sha256.hexdigest()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert between raw and chunked (seekable, compressed) images.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compress_parser = subparsers.add_parser("compress", help="Write a raw image as a chunked image")
+    compress_parser.add_argument("source")
+    compress_parser.add_argument("destination")
+    compress_parser.add_argument("--codec", choices=list(CODECS), default=CHUNKED_IMAGE_CODEC)
+    compress_parser.add_argument("--level", type=int)
+    compress_parser.add_argument("--chunk-size", type=int, default=CHUNKED_IMAGE_CHUNK_SIZE)
+    compress_parser.add_argument("--workers", type=int, default=CHUNKED_IMAGE_WORKERS)
+    decompress_parser = subparsers.add_parser("decompress", help="Restore the raw image")
+    decompress_parser.add_argument("source")
+    decompress_parser.add_argument("destination")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "compress":
+            digest = compress_image(args.source, args.destination, args.codec, args.chunk_size, args.level, args.workers)
+            ratio = os.path.getsize(args.destination) / max(os.path.getsize(args.source), 1)
+            print(f"Wrote {args.destination} ({ratio:.1%} of original), sha256 {digest}")
+        else:
+            print(f"Wrote {args.destination}, sha256 {decompress_image(args.source, args.destination)}")
+    except (OSError, ValueError, ChunkedImageError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,5 @@
 import os
 
-# Global variables
-process = None
-stop_event = None
-
 # Constants
 DEFAULT_DVD_DEVICES = ["/dev/sr0", "/dev/sr1", "/dev/cdrom", "/dev/dvd"]
 DDRESCUE_DEFAULT_OPTIONS = ['--force']
@@ -27,6 +23,137 @@ DVDISASTER_NOT_INSTALLED = "dvdisaster is not installed. Some recovery options a
 ISO_CREATION_SUCCESS = "ISO image successfully created at {}"
 EJECT_PROMPT = "ISO successfully created. Would you like to eject the DVD?"
 
-# Command templates
-DDRESCUE_COMMAND_TEMPLATE = "sudo /usr/bin/ddrescue {options} {device} {iso_path} {mapfile}"
-DD_COMMAND_TEMPLATE = "sudo dd if={device} of={iso_path} bs={bs_size} status=progress"
\ No newline at end of file
+# Disc geometry
+SECTOR_SIZE = 2048
+
+# Sector map
+SECTOR_MAP_COLUMNS = 64
+SECTOR_MAP_ROWS = 12
+SECTOR_MAP_CELL_SIZE = 6
+SECTOR_MAP_POLL_MS = 1000
+SECTOR_MAP_COLORS = {
+    '?': '#a0a0a0',  # non-tried
+    '*': '#e0c000',  # non-trimmed
+    '/': '#4060e0',  # non-scraped
+    '-': '#e02020',  # bad sector
+    '+': '#20b020',  # finished
+}
+
+# Chunked (seekable, compressed) image output
+CHUNKED_IMAGE_CHUNK_SIZE = 1024 * 1024
+CHUNKED_IMAGE_CODEC = "zlib"
+CHUNKED_IMAGE_WORKERS = os.cpu_count() or 2
+CHUNKED_IMAGE_EXTENSION = ".isoz"
+
+# Deduplicating image store
+IMAGE_STORE_DIR_NAME = "image_store"
+IMAGE_STORE_CHUNKING = "cdc"
+IMAGE_STORE_CHUNK_SIZE = 1024 * 1024
+IMAGE_STORE_AVG_SECTORS = 128
+IMAGE_STORE_MIN_SECTORS = 16
+IMAGE_STORE_MAX_SECTORS = 1024
+
+# Output storage formats
+STORAGE_RAW = "Raw image (.iso)"
+STORAGE_CHUNKED = "Compressed, seekable (.isoz)"
+STORAGE_DEDUP = "Deduplicating image store"
+STORAGE_FORMATS = [STORAGE_RAW, STORAGE_CHUNKED, STORAGE_DEDUP]
+
+# Duplicate disc detection
+FINGERPRINT_SAMPLES = 8
+
+# Catalog of rescued images
+CATALOG_FILENAME = "catalog.sqlite"
+
+# Audio CD ripping
+AUDIO_ENCODER = "flac"
+AUDIO_ENCODER_COMMANDS = {
+    "flac": ["flac", "--silent", "--force", "-o", "{target}", "{source}"],
+    "ogg": ["oggenc", "--quiet", "-o", "{target}", "{source}"],
+    "mp3": ["lame", "--quiet", "-V2", "{source}", "{target}"],
+}
+AUDIO_ENCODER_WORKERS = os.cpu_count() or 2
+AUDIO_KEEP_WAV = True
+
+# Local AccurateRip-style reference database, kept next to the rip directories
+ACCURATERIP_DB_FILENAME = "accuraterip.json"
+
+# Video DVD handling: copy the files with dvdbackup, or image the disc once and extract VIDEO_TS from the image
+VIDEO_DVD_BACKUP = "dvdbackup (file by file)"
+VIDEO_DVD_IMAGE = "Image first, then extract VIDEO_TS"
+VIDEO_DVD_MODES = [VIDEO_DVD_IMAGE, VIDEO_DVD_BACKUP]
+
+# JSON-lines job journals, kept in a directory next to the images
+JOURNAL_DIR_NAME = "journals"
+JOURNAL_SAMPLE_INTERVAL = 5  # seconds between throughput samples
+
+# Optional Prometheus-style metrics endpoint (http://METRICS_HOST:METRICS_PORT/metrics)
+METRICS_ENABLED = False
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+
+# Throughput profiles from ddrescue --log-rates/--log-reads
+THROUGHPUT_PROFILE_BINS = 256
+THROUGHPUT_TIME_POINTS = 512
+SLOW_ZONE_FRACTION = 0.5    # position bins slower than this fraction of the median rate are slow zones
+WEAK_DRIVE_FRACTION = 0.6   # drives slower than this fraction of the station median are flagged
+DRIVE_PROFILES_FILENAME = "drive_profiles.json"
+THROUGHPUT_CURVE_WIDTH = 384
+THROUGHPUT_CURVE_HEIGHT = 48
+
+# Convert the ddrescue read log of every job into a binary read trace (IMAGE.trace) for replay in benchmark.py
+RECORD_READ_TRACES = False
+
+# Imaging backends (backends.py). "auto" picks the cheapest backend that can handle the disc.
+BACKEND_AUTO = "auto"
+BACKEND_DEFAULT_RATE = 8e6                        # bytes/s for drives without a throughput profile
+BACKEND_DEFAULT_DISC_SIZE = 4700000000            # bytes when the disc size cannot be read
+BACKEND_SPEED = {"dd": 1.0, "ddrescue": 0.8, "dvdbackup": 0.7}  # relative to the drive's rate
+BAD_SECTOR_SECONDS = 2.0                          # time a drive spends on one unreadable sector per pass
+
+# Job events (jobs.py): the GUI takes up to JOB_EVENT_BATCH waiting events every JOB_EVENT_POLL_MS
+JOB_EVENT_POLL_MS = 50
+JOB_EVENT_BATCH = 2000
+
+# Full job logs in rotating segments with a line index (job_log.py), kept in a directory next to the images
+JOB_LOG_DIR_NAME = "logs"
+JOB_LOG_SEGMENT_BYTES = 16 * 1024 * 1024
+JOB_LOG_MAX_SEGMENTS = 64         # oldest segments beyond this are deleted (1 GiB per job)
+LOG_VIEW_POLL_MS = 500            # how often an open log viewer looks for new lines
+
+# Spool mode (spool.py): jobs write to fast local storage and finished jobs are moved to the output directory
+SPOOL_ENABLED = False
+SPOOL_DIR = "/var/tmp/iso_rescue_spool"
+SPOOL_BANDWIDTH = 0                # bytes/s for moving to the destination, 0 for no limit
+SPOOL_RETRIES = 5
+SPOOL_RETRY_DELAY = 30             # seconds, times the attempt number
+SPOOL_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Shared I/O scheduler (iosched.py). While imaging jobs run, the background classes share what is left of
+# IO_TOTAL_BANDWIDTH after the rates the imaging engines report (at least IO_BACKGROUND_MIN_RATE); with
+# IO_TOTAL_BANDWIDTH 0 they share IO_BACKGROUND_MIN_RATE. Without imaging jobs they run unthrottled.
+IO_TOTAL_BANDWIDTH = 0              # bytes/s the output storage sustains, 0 if unknown
+IO_BACKGROUND_MIN_RATE = 20e6       # bytes/s background work always gets
+IO_BURST_SECONDS = 0.25             # token bucket depth in seconds of the rate
+# Per-class (ioprio class, level): lower levels are served first, also by the shared token bucket.
+# ioprio is a hint for the kernel's BFQ scheduler and is ignored by others.
+IO_CLASSES = {"imaging": ("best-effort", 0), "verify": ("best-effort", 4), "hash": ("best-effort", 5),
+              "compress": ("best-effort", 6), "transfer": ("best-effort", 7)}
+IO_CLASS_RATES = {}                 # optional fixed cap per background class in bytes/s, e.g. {"transfer": 50e6}
+IO_PRIORITY_HINTS = True            # set ioprio on background threads and imaging processes (Linux)
+IO_FADVISE_HINTS = True             # sequential read-ahead and dropping background reads from the page cache
+
+# Buffer pool (buffer_pool.py) shared by the copy, hash and compress loops of all jobs. Free buffers are
+# kept for reuse within the ceiling; when it is reached, consumers wait for buffers to be released.
+BUFFER_POOL_CEILING = 256 * 1024 * 1024
+BUFFER_POOL_MIN_SIZE = 64 * 1024    # buffers are powers of two from this size up
+
+# Durability of the image data (durability.py):
+#   "none"        leave writeback to the kernel
+#   "periodic"    start writeback of the image every DURABILITY_WRITEBACK_INTERVAL and fdatasync it every
+#                 DURABILITY_INTERVAL; the ddrescue mapfile may still claim data written after the last sync
+#   "checkpoint"  as periodic, but every sync first snapshots the mapfile and then writes it atomically
+#                 to IMAGE.map.checkpoint, which a resume after a power cut starts from
+DURABILITY_LEVEL = "checkpoint"
+DURABILITY_INTERVAL = 30            # seconds between syncs
+DURABILITY_WRITEBACK_INTERVAL = 1   # seconds between writeback starts (sync_file_range, no waiting)
@@ -0,0 +1,95 @@
+import argparse
+import bisect
+import sys
+from iso_filesystem import open_image, read_filesystem, FilesystemError
+from mapfile import read_mapfile, mapfile_size, FINISHED
+
+INTACT = "intact"
+PARTIAL = "partial"
+LOST = "lost"
+
+def unrescued_ranges(blocks):
+    """Return sorted (start, end) byte ranges that are not marked finished in the mapfile.
+
+    Everything past the end of the mapfile counts as unrescued as well."""
+    ranges = [(pos, pos + size) for pos, size, status in sorted(blocks) if status != FINISHED and size > 0]
+    ranges.append((mapfile_size(blocks), float('inf')))
+    return ranges
+
+def damaged_bytes(extents, ranges, range_starts=None):
+    """Count how many bytes of the given extents fall into unrescued ranges."""
+    if range_starts is None:
+        range_starts = [start for start, _ in ranges]
+    damaged = 0
+    for offset, length in extents:
+        if offset is None:
+            continue  # sparse extent, nothing to read
+        end = offset + length
+        index = max(bisect.bisect_right(range_starts, offset) - 1, 0)
+        while index < len(ranges) and ranges[index][0] < end:
+            overlap = min(end, ranges[index][1]) - max(offset, ranges[index][0])
+            if overlap > 0:
+                damaged += overlap
+            index += 1
+    return damaged
+
+def classify_file(entry, ranges, range_starts=None):
+    """Return (status, damaged_bytes) for a FileEntry."""
+    damaged = damaged_bytes(entry.extents, ranges, range_starts)
+    if damaged == 0:
+        return INTACT, 0
+    recorded = sum(length for offset, length in entry.extents if offset is not None)
+    return (LOST if damaged >= recorded else PARTIAL), damaged
+
+def file_damage_report(image_path, mapfile):
+    """Map every file of the image onto the mapfile.
+
+    Returns the file system listing and a list of (entry, status, damaged_bytes)
+    tuples in path order. Nothing is mounted; only the directory structures are read."""
+    _, _, blocks = read_mapfile(mapfile)
+    ranges = unrescued_ranges(blocks)
+    range_starts = [start for start, _ in ranges]
+    data = open_image(image_path)
+    try:
+        listing = read_filesystem(data)
+    finally:
+        data.close()
+    report = []
+    for entry in listing.files:
+        status, damaged = classify_file(entry, ranges, range_starts)
+        report.append((entry, status, damaged))
+    return listing, report
+
+def summarize_report(report):
+    """Return a dict with file counts and byte totals per status."""
+    summary = {status: {"files": 0, "bytes": 0} for status in (INTACT, PARTIAL, LOST)}
+    for entry, status, _ in report:
+        summary[status]["files"] += 1
+        summary[status]["bytes"] += entry.size
+    return summary
+
+def format_summary(summary):
+    return ", ".join(f"{status}: {counts['files']} files ({counts['bytes'] // (1024 * 1024)} MB)"
+                     for status, counts in summary.items())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report which files of a rescued image are intact, partial or lost.")
+    parser.add_argument("image", help="Path to the rescued ISO image")
+    parser.add_argument("mapfile", nargs="?", help="ddrescue mapfile (default: <image>.map)")
+    parser.add_argument("--all", action="store_true", help="List intact files as well")
+    args = parser.parse_args(argv)
+
+    try:
+        listing, report = file_damage_report(args.image, args.mapfile or args.image + ".map")
+    except (OSError, FilesystemError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"File system: {listing.fs_type}, volume: {listing.volume_id}")
+    for entry, status, damaged in report:
+        if args.all or status != INTACT:
+            print(f"{status:8} {damaged:>12} / {entry.size:<12} {entry.path}")
+    print(format_summary(summarize_report(report)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
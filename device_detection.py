@@ -21,3 +21,15 @@ def detect_dvd_devices():
     if not dvd_devices:
         dvd_devices.append("No DVD device found")
     return dvd_devices
+
+def get_drive_model(device):
+    """Return the vendor and model of an optical drive as reported by sysfs, or None."""
+    name = os.path.basename(os.path.realpath(device))
+    parts = []
+    for attribute in ("vendor", "model"):
+        try:
+            with open(f"/sys/block/{name}/device/{attribute}", 'r') as f:
+                parts.append(f.read().strip())
+        except OSError:
+            continue
+    return " ".join(part for part in parts if part) or None
@@ -0,0 +1,164 @@
+import ctypes
+import os
+import sys
+import threading
+import time
+from config import DURABILITY_LEVEL, DURABILITY_INTERVAL, DURABILITY_WRITEBACK_INTERVAL
+from mapfile import read_mapfile, write_mapfile, FINISHED
+
+DURABILITY_NONE = "none"
+DURABILITY_PERIODIC = "periodic"
+DURABILITY_CHECKPOINT = "checkpoint"
+DURABILITY_LEVELS = (DURABILITY_NONE, DURABILITY_PERIODIC, DURABILITY_CHECKPOINT)
+CHECKPOINT_SUFFIX = ".checkpoint"
+SYNC_FILE_RANGE_WRITE = 2
+fdatasync = getattr(os, "fdatasync", os.fsync)
+
+_libc = ctypes.CDLL(None, use_errno=True) if sys.platform.startswith("linux") else None
+if _libc is not None and hasattr(_libc, "sync_file_range"):
+    _libc.sync_file_range.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_uint]
+
+def start_writeback(fd):
+    """Start writing the dirty pages of a file to disk without waiting for them, so
+    the next fdatasync has little left to do. Returns False if not supported."""
+    if _libc is None or not hasattr(_libc, "sync_file_range"):
+        return False
+    return _libc.sync_file_range(fd, 0, 0, SYNC_FILE_RANGE_WRITE) == 0
+
+def sync_filesystem(path):
+    """Flush everything written to the file system holding path (syncfs, or sync elsewhere)."""
+    if _libc is not None and hasattr(_libc, "syncfs"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if _libc.syncfs(fd) == 0:
+                return
+        finally:
+            os.close(fd)
+    os.sync()
+
+def sync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def checkpoint_path(mapfile):
+    return mapfile + CHECKPOINT_SUFFIX
+
+def rescued_bytes(blocks):
+    return sum(size for _, size, status in blocks if status == FINISHED)
+
+def restore_checkpoint(mapfile, level=DURABILITY_LEVEL):
+    """Before resuming, replace the engine's mapfile with the last checkpoint, which only
+    claims data that was on disk. Returns (checkpointed, claimed) bytes, or None without
+    a checkpoint. Outside checkpoint mode the checkpoint is removed once restored, as
+    nothing would keep it current."""
+    checkpoint = checkpoint_path(mapfile)
+    if not os.path.exists(checkpoint) or not os.path.exists(mapfile):
+        return None
+    claimed = rescued_bytes(read_mapfile(mapfile)[2])
+    current_pos, current_status, blocks = read_mapfile(checkpoint)
+    write_mapfile(mapfile, blocks, current_pos, current_status, sync=True)
+    if level != DURABILITY_CHECKPOINT:
+        os.remove(checkpoint)
+    return rescued_bytes(blocks), claimed
+
+def remove_checkpoint(mapfile):
+    try:
+        os.remove(checkpoint_path(mapfile))
+    except FileNotFoundError:
+        pass
+
+class DurabilityWatcher:
+    """Background thread that gets a running engine's image to disk according to the
+    durability level, while the engine (an external process) keeps writing.
+
+    Every writeback_interval it starts writeback of the image; every interval it
+    syncs it. In checkpoint mode each sync is ordered: the mapfile is read first, the
+    image synced next and the snapshot written to IMAGE.map.checkpoint last. The
+    engine writes data before it records it in its mapfile, so every sector the
+    checkpoint claims was written before the sync. stop() does a last sync."""
+
+    def __init__(self, image_path, mapfile=None, level=DURABILITY_LEVEL, interval=DURABILITY_INTERVAL,
+                 writeback_interval=DURABILITY_WRITEBACK_INTERVAL, log=None):
+        self.image_path = image_path
+        self.mapfile = mapfile
+        self.level = level
+        self.interval = interval
+        self.writeback_interval = writeback_interval
+        self.log = log
+        self.syncs = 0
+        self.sync_seconds = 0.0
+        self._fd = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.level == DURABILITY_NONE:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and sync a last time. Returns False if that sync failed."""
+        if self._thread is None:
+            return True
+        self._stop_event.set()
+        self._thread.join()
+        try:
+            return self.sync()
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _open(self):
+        # The engine creates the image; a directory (dvdbackup) is left alone
+        if self._fd is None and os.path.isfile(self.image_path):
+            self._fd = os.open(self.image_path, os.O_WRONLY)
+        return self._fd
+
+    def sync(self):
+        """Get the image to disk, with a checkpoint in checkpoint mode. Returns True on success."""
+        started = time.monotonic()
+        try:
+            fd = self._open()
+            if fd is None:
+                return True
+            snapshot = None
+            if self.level == DURABILITY_CHECKPOINT and self.mapfile and os.path.exists(self.mapfile):
+                snapshot = read_mapfile(self.mapfile)
+            fdatasync(fd)
+            if snapshot is not None and snapshot[2]:
+                write_mapfile(checkpoint_path(self.mapfile), snapshot[2], snapshot[0], snapshot[1],
+                              comment=f"Checkpoint of {os.path.basename(self.mapfile)}: "
+                                      f"every rescued block here was synced to disk", sync=True)
+        except OSError as e:
+            if self.log is not None:
+                self.log(f"Could not sync {self.image_path}: {e}", "WARNING")
+            return False
+        self.syncs += 1
+        self.sync_seconds += time.monotonic() - started
+        return True
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while not self._stop_event.wait(min(self.writeback_interval, self.interval)):
+            if time.monotonic() - last_sync >= self.interval:
+                self.sync()
+                last_sync = time.monotonic()
+                continue
+            try:
+                fd = self._open()
+            except OSError:
+                continue
+            if fd is not None:
+                start_writeback(fd)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,94 @@
+import argparse
+import sys
+from config import SECTOR_SIZE
+from iso_filesystem import open_image, read_filesystem, list_metadata_extents, FilesystemError
+from mapfile import write_mapfile, merge_blocks, FINISHED, NON_TRIED
+
+def read_disc_listing(source):
+    """Read the file listing and the metadata extents of every file system on a disc or image.
+
+    Returns (listing, metadata_extents, size)."""
+    data = open_image(source)
+    try:
+        listing = read_filesystem(data)
+        return listing, list_metadata_extents(data), len(data)
+    finally:
+        data.close()
+
+def select_files(files, selected_paths):
+    """Return the files matching the selection; a directory path selects everything below it."""
+    prefixes = [path.rstrip('/') + '/' for path in selected_paths]
+    wanted = set(selected_paths)
+    return [entry for entry in files if entry.path in wanted or any(entry.path.startswith(p) for p in prefixes)]
+
+def domain_blocks(extents, total_size):
+    """Build mapfile blocks marking the given extents finished and everything else non-tried.
+
+    Extents are widened to whole sectors, sorted and merged so ddrescue reads each
+    sector at most once."""
+    ranges = []
+    for offset, length in extents:
+        if offset is None or length <= 0:
+            continue
+        start = offset // SECTOR_SIZE * SECTOR_SIZE
+        end = min(-(-(offset + length) // SECTOR_SIZE) * SECTOR_SIZE, total_size)
+        if start < end:
+            ranges.append((start, end))
+    ranges.sort()
+
+    blocks = []
+    pos = 0
+    for start, end in ranges:
+        if end <= pos:
+            continue
+        start = max(start, pos)
+        if start > pos:
+            blocks.append((pos, start - pos, NON_TRIED))
+        blocks.append((start, end - start, FINISHED))
+        pos = end
+    if pos < total_size:
+        blocks.append((pos, total_size - pos, NON_TRIED))
+    return merge_blocks(blocks)
+
+def write_domain_mapfile(source, selected_paths, domain_mapfile):
+    """Write a ddrescue domain mapfile (-m) covering the selected files plus file system metadata.
+
+    Returns the list of selected FileEntry objects."""
+    listing, metadata_extents, total_size = read_disc_listing(source)
+    selected = select_files(listing.files, selected_paths)
+    extents = list(metadata_extents)
+    for entry in selected:
+        extents.extend(entry.extents)
+    blocks = domain_blocks(extents, total_size)
+    write_mapfile(domain_mapfile, blocks, comment=f"Domain mapfile for {len(selected)} selected files on {source}")
+    return selected
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescue only selected files from a disc using a ddrescue domain mapfile.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="List the files on a disc or image")
+    list_parser.add_argument("source", help="Optical drive or (partial) image")
+    domain_parser = subparsers.add_parser("domain", help="Write a domain mapfile for the selected files")
+    domain_parser.add_argument("source", help="Optical drive or (partial) image")
+    domain_parser.add_argument("domain_mapfile", help="Path of the domain mapfile to write")
+    domain_parser.add_argument("paths", nargs="+", help="Files or directories to rescue, e.g. /VIDEO_TS")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            listing, _, _ = read_disc_listing(args.source)
+            print(f"File system: {listing.fs_type}, volume: {listing.volume_id}")
+            for entry in listing.files:
+                print(f"{entry.size:>12} {entry.path}")
+        else:
+            selected = write_domain_mapfile(args.source, args.paths, args.domain_mapfile)
+            size = sum(entry.size for entry in selected)
+            print(f"Wrote {args.domain_mapfile} for {len(selected)} files ({size // (1024 * 1024)} MB)")
+            print(f"Use it with: ddrescue -m {args.domain_mapfile} <device> <image> <mapfile>")
+    except (OSError, FilesystemError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+from config import SECTOR_SIZE, FINGERPRINT_SAMPLES, CHUNKED_IMAGE_EXTENSION
+from iso_filesystem import open_image, FilesystemError
+
+FINGERPRINT_SUFFIX = ".fp.json"
+IMAGE_EXTENSIONS = (".iso", CHUNKED_IMAGE_EXTENSION)
+DESCRIPTOR_SECTORS = range(16, 32)
+UDF_ANCHOR_SECTOR = 256
+VERIFY_BLOCK_SIZE = 1024 * 1024
+
+def volume_size(data):
+    """Return the size recorded in the ISO9660 primary volume descriptor, or the raw size."""
+    descriptor = data[16 * SECTOR_SIZE:17 * SECTOR_SIZE]
+    if descriptor[0:1] == b'\x01' and descriptor[1:6] == b'CD001':
+        blocks = struct.unpack_from('<I', descriptor, 80)[0]
+        block_size = struct.unpack_from('<H', descriptor, 128)[0] or SECTOR_SIZE
+        if blocks:
+            return blocks * block_size
+    return len(data)
+
+def compute_fingerprint(source, samples=FINGERPRINT_SAMPLES):
+    """Fingerprint a disc or image from its volume descriptors, size and a few sampled sectors.
+
+    Only a handful of sectors are read, so this takes well under a second even on
+    an optical drive. Unreadable sectors are hashed as a marker, so a damaged disc
+    simply will not match its image instead of failing."""
+    data = open_image(source)
+    try:
+        size = volume_size(data)
+        total_sectors = size // SECTOR_SIZE
+        digest = hashlib.sha256(str(size).encode())
+        sectors = list(DESCRIPTOR_SECTORS) + [UDF_ANCHOR_SECTOR]
+        if total_sectors > 0:
+            sectors += [total_sectors * (i + 1) // (samples + 1) for i in range(samples)]
+        for sector in sectors:
+            if sector >= total_sectors:
+                continue
+            try:
+                digest.update(hashlib.sha256(data[sector * SECTOR_SIZE:(sector + 1) * SECTOR_SIZE]).digest())
+            except (OSError, FilesystemError):
+                digest.update(b'unreadable')
+        return digest.hexdigest()
+    finally:
+        data.close()
+
+def sidecar_path(image_path):
+    return image_path + FINGERPRINT_SUFFIX
+
+def image_fingerprint(image_path, log=None):
+    """Return the fingerprint of an image, using the cached sidecar file when it is still valid.
+
+    log(message, level=...) receives a warning if the sidecar cannot be written."""
+    stat = os.stat(image_path)
+    sidecar = sidecar_path(image_path)
+    try:
+        with open(sidecar, 'r') as f:
+            cached = json.load(f)
+        if cached.get("size") == stat.st_size and cached.get("mtime") == stat.st_mtime_ns:
+            return cached["fingerprint"]
+    except (OSError, ValueError, KeyError):
+        pass
+    fingerprint = compute_fingerprint(image_path)
+    try:
+        with open(sidecar, 'w') as f:
+            json.dump({"fingerprint": fingerprint, "size": stat.st_size, "mtime": stat.st_mtime_ns}, f)
+    except OSError as e:
+        if log is not None:
+            log(f"Could not write fingerprint sidecar {sidecar}: {e}", level="WARNING")
+    return fingerprint
+
+def find_duplicates(fingerprint, directory, exclude=None, log=None):
+    """Return the images in directory whose fingerprint matches.
+
+    Images that cannot be read (damaged, truncated, foreign formats) are reported
+    through log(message, level=...) and skipped: looking for duplicates must never
+    stop a rescue."""
+    matches = []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return matches
+    for name in names:
+        path = os.path.join(directory, name)
+        if not name.endswith(IMAGE_EXTENSIONS) or path == exclude or not os.path.isfile(path):
+            continue
+        try:
+            if image_fingerprint(path, log) == fingerprint:
+                matches.append(path)
+        except Exception as e:
+            if log is not None:
+                log(f"Skipping {path}, could not fingerprint it: {e}", level="WARNING")
+    return matches
+
+def link_image(existing, target):
+    """Make target refer to an existing image, with a hard link if possible."""
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(existing, target)
+    except OSError:
+        os.symlink(os.path.abspath(existing), target)
+
+def verify_against_image(source, image_path):
+    """Compare a disc with an existing image. Returns the number of differing or unreadable sectors."""
+    disc, image = open_image(source), open_image(image_path)
+    try:
+        size = max(volume_size(disc), len(image))
+        differing = 0
+        for offset in range(0, size, VERIFY_BLOCK_SIZE):
+            expected = image[offset:offset + VERIFY_BLOCK_SIZE]
+            try:
+                actual = disc[offset:offset + VERIFY_BLOCK_SIZE]
+            except (OSError, FilesystemError):
+                differing += -(-min(VERIFY_BLOCK_SIZE, size - offset) // SECTOR_SIZE)
+                continue
+            if actual != expected:
+                for pos in range(0, max(len(actual), len(expected)), SECTOR_SIZE):
+                    if actual[pos:pos + SECTOR_SIZE] != expected[pos:pos + SECTOR_SIZE]:
+                        differing += 1
+        return differing
+    finally:
+        disc.close()
+        image.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint a disc and look for images of it that already exist.")
+    parser.add_argument("source", help="Optical drive or image")
+    parser.add_argument("directory", nargs="?", help="Directory with existing images to compare against")
+    args = parser.parse_args(argv)
+
+    try:
+        fingerprint = compute_fingerprint(args.source)
+    except (OSError, FilesystemError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(fingerprint)
+    if args.directory:
+        for path in find_duplicates(fingerprint, args.directory, exclude=args.source,
+                                    log=lambda message, level="INFO": print(message, file=sys.stderr)):
+            print(f"Duplicate: {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
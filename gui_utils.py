@@ -73,13 +73,69 @@ def update_progress(progress_bar, value):
 
 def update_log(log_text, message, level="INFO"):
     """Update the log text widget with the given message and log level."""
-    log_message = f"[{level}] {message}"
-    log_text.insert(tk.END, log_message + '\n')
+    append_log(log_text, [f"[{level}] {message}"])
+    log_text.update_idletasks()
+
+def append_log(log_text, lines, max_lines=1000):
+    """Append formatted lines to the log text widget in one insert, keeping the last max_lines."""
+    log_text.insert(tk.END, "\n".join(lines) + '\n')
     log_text.see(tk.END)
-    
-    # Limit the number of lines to 1000
+
     lines = int(log_text.index('end-1c').split('.')[0])
-    if lines > 1000:
-        log_text.delete('1.0', f'{lines-1000}.0')
-    
-    log_text.update_idletasks()
+    if lines > max_lines:
+        log_text.delete('1.0', f'{lines-max_lines}.0')
+
+def ask_file_selection(parent, files):
+    """Show a modal dialog listing the files on the disc and return the selected paths.
+
+    Returns None if the dialog is cancelled."""
+    dialog = tk.Toplevel(parent)
+    dialog.title("Select Files to Rescue")
+    dialog.transient(parent)
+
+    list_frame = tk.Frame(dialog)
+    list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+    scrollbar = tk.Scrollbar(list_frame)
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    listbox = tk.Listbox(list_frame, selectmode=tk.EXTENDED, width=80, height=20, yscrollcommand=scrollbar.set)
+    listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    scrollbar.config(command=listbox.yview)
+    for entry in files:
+        listbox.insert(tk.END, f"{entry.path}  ({entry.size // 1024} KB)")
+
+    result = []
+    def confirm():
+        result.append([files[index].path for index in listbox.curselection()])
+        dialog.destroy()
+
+    button_frame = tk.Frame(dialog)
+    button_frame.pack(pady=(0, 10))
+    tk.Button(button_frame, text="Rescue Selected", command=confirm).pack(side=tk.LEFT, padx=5)
+    tk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+    dialog.grab_set()
+    parent.wait_window(dialog)
+    return result[0] if result else None
+
+def ask_choice(parent, title, message, choices):
+    """Show a modal dialog with one button per choice and return the chosen one.
+
+    Returns None if the dialog is closed without choosing."""
+    dialog = tk.Toplevel(parent)
+    dialog.title(title)
+    dialog.transient(parent)
+    tk.Label(dialog, text=message, justify=tk.LEFT, wraplength=400).pack(padx=10, pady=10)
+
+    result = []
+    def choose(choice):
+        result.append(choice)
+        dialog.destroy()
+
+    button_frame = tk.Frame(dialog)
+    button_frame.pack(pady=(0, 10))
+    for choice in choices:
+        tk.Button(button_frame, text=choice, command=lambda c=choice: choose(c)).pack(side=tk.LEFT, padx=5)
+
+    dialog.grab_set()
+    parent.wait_window(dialog)
+    return result[0] if result else None
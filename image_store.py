@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+from contextlib import closing
+from config import SECTOR_SIZE, IMAGE_STORE_CHUNKING, IMAGE_STORE_CHUNK_SIZE, IMAGE_STORE_AVG_SECTORS, IMAGE_STORE_MIN_SECTORS, IMAGE_STORE_MAX_SECTORS
+from iosched import scheduler, background, advise_sequential, advise_done, HASH
+from buffer_pool import pool
+
+# Store layout:
+#   <store>/chunks/<first two hex digits>/<sha256>   chunk contents
+#   <store>/manifests/<name>.json                    ordered chunk list of one image
+CHUNKS_DIR = "chunks"
+MANIFESTS_DIR = "manifests"
+READ_SIZE = 8 * 1024 * 1024
+
+class ImageStoreError(Exception):
+    """Raised when a manifest is missing or a restored image does not match its checksum."""
+
+def fixed_chunks(f, chunk_size=IMAGE_STORE_CHUNK_SIZE):
+    """Yield fixed-size chunks from a file object."""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+def content_defined_chunks(f, avg_sectors=IMAGE_STORE_AVG_SECTORS, min_sectors=IMAGE_STORE_MIN_SECTORS, max_sectors=IMAGE_STORE_MAX_SECTORS):
+    """Yield chunks whose boundaries depend on content and always fall on sector boundaries.
+
+    A chunk ends after a sector whose CRC32 matches a bit mask, so the same file
+    stored at different positions on two discs is cut at the same places and
+    deduplicates even when the surrounding layout differs."""
+    mask = avg_sectors - 1
+    chunk = bytearray()
+    sectors = 0
+    with pool.lease(READ_SIZE, HASH) as buffer:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            for pos in range(0, count, SECTOR_SIZE):
+                sector = buffer[pos:min(pos + SECTOR_SIZE, count)]
+                chunk += sector
+                sectors += 1
+                if sectors >= max_sectors or (sectors >= min_sectors and zlib.crc32(sector) & mask == mask):
+                    yield bytes(chunk)
+                    chunk = bytearray()
+                    sectors = 0
+    if chunk:
+        yield bytes(chunk)
+
+def chunk_path(store, digest):
+    return os.path.join(store, CHUNKS_DIR, digest[:2], digest)
+
+def manifest_path(store, name):
+    return os.path.join(store, MANIFESTS_DIR, name + ".json")
+
+def unique_name(store, name):
+    """name, or name with a timestamp (and a counter) if an image of that name is already stored."""
+    if not os.path.exists(manifest_path(store, name)):
+        return name
+    base = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}"
+    candidate, number = base, 1
+    while os.path.exists(manifest_path(store, candidate)):
+        number += 1
+        candidate = f"{base}-{number}"
+    return candidate
+
+def add_image(store, image_path, name=None, chunking=IMAGE_STORE_CHUNKING, unique=False):
+    """Split an image into chunks, store the chunks not yet present and write its manifest.
+
+    An existing manifest is never replaced: if name is taken, the image gets a
+    unique name with unique, and ImageStoreError is raised otherwise.
+    Returns the manifest dict, including its name and how many bytes were actually new."""
+    name = name or os.path.splitext(os.path.basename(image_path))[0]
+    os.makedirs(os.path.join(store, MANIFESTS_DIR), exist_ok=True)
+    if unique:
+        name = unique_name(store, name)
+    elif os.path.exists(manifest_path(store, name)):
+        raise ImageStoreError(f"An image named {name} is already stored in {store}")
+    image_hash = hashlib.sha256()
+    chunks = []
+    size = new_bytes = 0
+    with background(HASH), open(image_path, 'rb') as f:
+        advise_sequential(f.fileno())
+        chunker = content_defined_chunks(f) if chunking == "cdc" else fixed_chunks(f)
+        # Closed explicitly, so the chunker's pooled buffer is returned even after an error
+        with closing(chunker):
+            for chunk in chunker:
+                scheduler.take(HASH, len(chunk))
+                advise_done(f.fileno(), size, len(chunk))
+                digest = hashlib.sha256(chunk).hexdigest()
+                image_hash.update(chunk)
+                path = chunk_path(store, digest)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.tmp{os.getpid()}"
+                    with open(tmp_path, 'wb') as out:
+                        out.write(chunk)
+                    os.replace(tmp_path, path)
+                    new_bytes += len(chunk)
+                chunks.append([digest, len(chunk)])
+                size += len(chunk)
+
+    while True:
+        manifest = {"name": name, "source": os.path.basename(image_path), "size": size,
+                    "sha256": image_hash.hexdigest(), "chunking": chunking, "new_bytes": new_bytes, "chunks": chunks}
+        path = manifest_path(store, name)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        # link() fails if another job took the name in the meantime, where a rename would replace its manifest
+        try:
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                raise
+            except OSError:
+                # No hard links on this file system: a rename after a check is the next best thing
+                if os.path.exists(path):
+                    raise FileExistsError(path)
+                os.replace(tmp_path, path)
+            return manifest
+        except FileExistsError:
+            if not unique:
+                raise ImageStoreError(f"An image named {name} is already stored in {store}")
+            name = unique_name(store, name)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def load_manifest(store, name):
+    try:
+        with open(manifest_path(store, name), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ImageStoreError(f"No image named {name} in {store}")
+
+def restore_image(store, name, output):
+    """Stream an image back out of the store and check it against the recorded SHA-256."""
+    manifest = load_manifest(store, name)
+    image_hash = hashlib.sha256()
+    with open(output, 'wb') as out:
+        for digest, length in manifest["chunks"]:
+            with open(chunk_path(store, digest), 'rb') as f:
+                chunk = f.read()
+            if len(chunk) != length:
+                raise ImageStoreError(f"Chunk {digest} has {len(chunk)} bytes, expected {length}")
+            image_hash.update(chunk)
+            out.write(chunk)
+    if image_hash.hexdigest() != manifest["sha256"]:
+        raise ImageStoreError(f"Restored image {output} does not match the stored checksum")
+    return manifest
+
+def list_images(store):
+    directory = os.path.join(store, MANIFESTS_DIR)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+
+def store_stats(store):
+    """Return logical size of all images, bytes actually stored and the resulting dedup ratio."""
+    images = list_images(store)
+    logical = sum(load_manifest(store, name)["size"] for name in images)
+    stored = chunks = 0
+    for root, _, files in os.walk(os.path.join(store, CHUNKS_DIR)):
+        for filename in files:
+            if ".tmp" not in filename:
+                stored += os.path.getsize(os.path.join(root, filename))
+                chunks += 1
+    return {"images": len(images), "chunks": chunks, "logical_bytes": logical, "stored_bytes": stored,
+            "dedup_ratio": logical / stored if stored else 0.0}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content-addressed, deduplicating store for disc images.")
+    parser.add_argument("store", help="Store directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_parser = subparsers.add_parser("add", help="Add an image to the store")
+    add_parser.add_argument("image")
+    add_parser.add_argument("--name", help="Name in the store (default: file name without extension); must not be taken")
+    add_parser.add_argument("--chunking", choices=["cdc", "fixed"], default=IMAGE_STORE_CHUNKING)
+    restore_parser = subparsers.add_parser("restore", help="Write an image back out")
+    restore_parser.add_argument("name")
+    restore_parser.add_argument("output")
+    subparsers.add_parser("list", help="List stored images")
+    subparsers.add_parser("stats", help="Show store-wide deduplication statistics")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "add":
+            manifest = add_image(args.store, args.image, args.name, args.chunking)
+            print(f"Added {manifest['name']}: {manifest['size']} bytes, {manifest['new_bytes']} new, {len(manifest['chunks'])} chunks")
+        elif args.command == "restore":
+            restore_image(args.store, args.name, args.output)
+            print(f"Restored {args.name} to {args.output}")
+        elif args.command == "list":
+            for name in list_images(args.store):
+                print(name)
+        else:
+            stats = store_stats(args.store)
+            print(f"{stats['images']} images, {stats['chunks']} chunks, "
+                  f"{stats['logical_bytes'] // (1024 * 1024)} MB logical, {stats['stored_bytes'] // (1024 * 1024)} MB stored, "
+                  f"dedup ratio {stats['dedup_ratio']:.2f}")
+    except (OSError, ImageStoreError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
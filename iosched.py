@@ -0,0 +1,217 @@
+import ctypes
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from config import (IO_TOTAL_BANDWIDTH, IO_BACKGROUND_MIN_RATE, IO_BURST_SECONDS, IO_CLASSES, IO_CLASS_RATES,
+                    IO_PRIORITY_HINTS, IO_FADVISE_HINTS)
+
+# I/O classes. Imaging is done by external engines (ddrescue, dd, ...), which cannot be
+# throttled from here: they only get an I/O priority and report their rate. Everything
+# that reads or writes images in this process is background work and asks the shared
+# scheduler for every chunk, so it gets the bandwidth the imaging jobs leave over.
+IMAGING = "imaging"
+VERIFY = "verify"
+HASH = "hash"
+COMPRESS = "compress"
+TRANSFER = "transfer"
+
+# ioprio_set(2): there is no wrapper in the standard library
+IOPRIO_SYSCALLS = {"x86_64": 251, "aarch64": 30, "i686": 289, "armv7l": 314, "ppc64le": 273}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+# Loaded here rather than on first use: imaging_preexec() runs in a forked child
+_libc = ctypes.CDLL(None, use_errno=True) if sys.platform.startswith("linux") else None
+
+def _ioprio_syscall(name, *args):
+    number = IOPRIO_SYSCALLS.get(platform.machine())
+    if number is None or _libc is None:
+        return -1
+    if name == "get":
+        number += 1     # ioprio_get follows ioprio_set on every listed architecture
+    return _libc.syscall(number, *args)
+
+def set_ioprio(io_class):
+    """Give the calling thread (or a freshly forked process) the ioprio of io_class.
+
+    Returns the previous value for restore_ioprio(), or None if it could not be set."""
+    if not IO_PRIORITY_HINTS or io_class not in IO_CLASSES:
+        return None
+    kind, level = IO_CLASSES[io_class]
+    previous = _ioprio_syscall("get", IOPRIO_WHO_PROCESS, 0)
+    if previous < 0:
+        return None
+    value = IOPRIO_CLASSES[kind] << IOPRIO_CLASS_SHIFT | (0 if kind == "idle" else min(level, 7))
+    if _ioprio_syscall("set", IOPRIO_WHO_PROCESS, 0, value) < 0:
+        return None
+    return previous
+
+def restore_ioprio(previous):
+    if previous is not None:
+        _ioprio_syscall("set", IOPRIO_WHO_PROCESS, 0, previous)
+
+def advise_sequential(fd):
+    """Ask for aggressive read-ahead on a file read from start to end."""
+    if IO_FADVISE_HINTS and hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+def advise_done(fd, offset, length):
+    """Drop a range that background work has read from the page cache, so it does not
+    push out the pages of the live jobs."""
+    if IO_FADVISE_HINTS and hasattr(os, "posix_fadvise") and length > 0:
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+class TokenBucket:
+    """Tokens are bytes that refill at rate bytes/s up to burst (no limit for rate 0).
+
+    A request may take the bucket below zero, so chunks larger than the burst
+    still pass; the next request then waits until the debt is paid."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate * IO_BURST_SECONDS
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.burst = rate * IO_BURST_SECONDS
+            self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a request can be taken, 0 if now."""
+        with self._lock:
+            self._refill()
+            if not self.rate or self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def consume(self, count):
+        with self._lock:
+            self._refill()
+            if self.rate:
+                self.tokens -= count
+
+    def take(self, count):
+        """Wait until count bytes may pass."""
+        while True:
+            delay = self.wait_time()
+            if not delay:
+                break
+            time.sleep(delay)
+        self.consume(count)
+
+class IOScheduler:
+    """Shares the output storage between the imaging jobs and background work.
+
+    Background I/O goes through take(), which waits on one token bucket shared by
+    all background classes; when several classes wait, the one with the lowest
+    IO_CLASSES level goes first. The bucket's rate follows the imaging jobs: none
+    running means no limit, otherwise what IO_TOTAL_BANDWIDTH leaves after their
+    reported rates, but never less than IO_BACKGROUND_MIN_RATE."""
+
+    def __init__(self, total_bandwidth=IO_TOTAL_BANDWIDTH, min_rate=IO_BACKGROUND_MIN_RATE, class_rates=None):
+        self.total_bandwidth = total_bandwidth
+        self.min_rate = min_rate
+        self.shared = TokenBucket(0)
+        self.caps = {io_class: TokenBucket(rate) for io_class, rate in (class_rates or IO_CLASS_RATES).items() if rate}
+        self._imaging = {}      # key -> latest reported rate in bytes/s
+        self._waiting = {}      # level -> number of threads waiting at it
+        self._cond = threading.Condition()
+        self.moved = {}         # io_class -> bytes passed, for reports
+
+    def background_rate(self):
+        """The current rate of the shared bucket in bytes/s, 0 for no limit."""
+        return self.shared.rate
+
+    def _rebalance(self):
+        if not self._imaging:
+            rate = 0
+        elif self.total_bandwidth:
+            rate = max(self.min_rate, self.total_bandwidth - sum(self._imaging.values()))
+        else:
+            rate = self.min_rate
+        if rate != self.shared.rate:
+            self.shared.set_rate(rate)
+        self._cond.notify_all()
+
+    @contextmanager
+    def imaging(self, key):
+        """Register a running imaging job for the duration of the block."""
+        with self._cond:
+            self._imaging[key] = 0
+            self._rebalance()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._imaging.pop(key, None)
+                self._rebalance()
+
+    def report(self, key, rate):
+        """Record the current rate of an imaging job in bytes/s."""
+        with self._cond:
+            if key in self._imaging:
+                self._imaging[key] = rate
+                self._rebalance()
+
+    def take(self, io_class, count):
+        """Wait until count bytes of io_class may be read or written."""
+        cap = self.caps.get(io_class)
+        if cap is not None:
+            cap.take(count)
+        level = IO_CLASSES.get(io_class, ("best-effort", 7))[1]
+        with self._cond:
+            self._waiting[level] = self._waiting.get(level, 0) + 1
+            try:
+                while True:
+                    first = not any(n for other, n in self._waiting.items() if other < level)
+                    delay = self.shared.wait_time()
+                    if first and not delay:
+                        break
+                    self._cond.wait(delay or 0.05)
+                self.shared.consume(count)
+                self.moved[io_class] = self.moved.get(io_class, 0) + count
+            finally:
+                self._waiting[level] -= 1
+                self._cond.notify_all()
+
+    def throttle(self, io_class):
+        """A callable taking byte counts, for loops that report what they moved."""
+        return lambda count: self.take(io_class, count)
+
+@contextmanager
+def background(io_class):
+    """Run the block with the ioprio of io_class on the calling thread."""
+    previous = set_ioprio(io_class)
+    try:
+        yield
+    finally:
+        restore_ioprio(previous)
+
+def imaging_preexec():
+    """preexec_fn for imaging engines: own process group (so Stop can kill the whole
+    group) and the imaging ioprio."""
+    os.setsid()
+    set_ioprio(IMAGING)
+
+scheduler = IOScheduler()
@@ -1,26 +1,50 @@
-import sys
 import shutil
 import os
 import subprocess
-import threading
-from tkinter import messagebox, filedialog  # filedialog hinzugefügt
+import sqlite3
+import time
 import signal
-import tkinter as tk
-from config import process, stop_event, DDRESCUE_DEFAULT_OPTIONS, DD_BS_SIZE, DDRESCUE_COMMAND_TEMPLATE, DD_COMMAND_TEMPLATE, NO_DVD_DEVICE, DDRESCUE_NOT_INSTALLED, ISO_CREATION_SUCCESS, EJECT_PROMPT
+from config import NO_DVD_DEVICE, ISO_CREATION_SUCCESS, EJECT_PROMPT, CHUNKED_IMAGE_EXTENSION, IMAGE_STORE_DIR_NAME, STORAGE_RAW, STORAGE_CHUNKED, STORAGE_DEDUP, VIDEO_DVD_IMAGE, RECORD_READ_TRACES, DURABILITY_LEVEL, DURABILITY_INTERVAL
 from core_functions import check_tool_installed, check_writable_directory
-from gui_utils import disable_gui_elements, reset_gui_state, update_progress, update_log
-from iso_utils import try_mount_iso, attempt_iso_recovery
-from media_detection import detect_media_type, prepare_command
+from media_detection import detect_media_type
+from backends import BackendError, disc_info, prepare_commands, backend_for_command, describe_command, format_plan
+from iso_filesystem import FilesystemError
+from file_rescue import write_domain_mapfile
+from chunked_image import compress_image
+from audio_rip import rip_disc, save_state, checksums_to_record
+from accuraterip import disc_id, default_db_path, load_reference_db, compare_disc, record_disc as record_accuraterip, format_results
+from catalog import connect, default_catalog_path, describe_image, record_disc
+from device_detection import get_drive_model
+from fingerprint import compute_fingerprint, find_duplicates, link_image, verify_against_image
+from image_store import add_image, manifest_path, ImageStoreError
+from zero_scan import write_suspect_mapfile, format_scan_summary
+from video_dvd import extract_video_ts
+from journal import open_journal, span
+from jobs import PROBING, COPYING, VERIFYING
+from job_log import open_job_log
+from spool import final_path
+from iosched import scheduler, imaging_preexec
+from buffer_pool import pool, format_usage
+from durability import DurabilityWatcher, restore_checkpoint, remove_checkpoint, sync_file, sync_filesystem, DURABILITY_NONE
+from throughput_profile import rates_log_path, reads_log_path, profile_from_logs, save_profile, update_drive_profile, drive_profiles_path, format_profile
+from read_trace import record_trace, read_trace, summarize_trace
+from mapfile import read_mapfile, mapfile_size, FINISHED
+from damage_report import file_damage_report, summarize_report, format_summary, INTACT
 
 def handle_mapfile(iso_path, c_option):
     """
-    Handle the mapfile for ddrescue before starting the process.
+    Handle the mapfile for ddrescue before starting a fresh copy.
+
+    Removes the mapfile of an earlier run, so only call it when that run is not
+    resumed: start_job keeps the mapfile (and restores its checkpoint) when the
+    user chooses to resume, which is what lets ddrescue continue where it stopped.
     
     Args:
     iso_path (str): Path to the ISO file
     c_option (bool): Whether the -C option is selected
     """
     mapfile = iso_path + ".map"
+    remove_checkpoint(mapfile)
     if os.path.exists(mapfile):
         try:
             os.remove(mapfile)
@@ -35,151 +59,423 @@ def handle_mapfile(iso_path, c_option):
         except OSError as e:
             print(f"Error creating mapfile: {e}")
 
-def create_iso(dvd_device_var, output_path_var, method_var, n_option_var, r3_option_var, b_option_var, d_option_var, c_option_var, log_text, app, stop_button, progress_bar):
-    global process, stop_event
-    stop_event = threading.Event()
+def create_iso(job, method, options, selected_files=None, storage=STORAGE_RAW, mover=None):
+    """
+    Run one job from the checks to the finished image.
 
-    iso_path = output_path_var.get()
-    if not iso_path:
-        iso_path = filedialog.asksaveasfilename(defaultextension=".iso", filetypes=[("ISO files", "*.iso")])
-        if not iso_path:
-            messagebox.showerror("Error", "Please specify an output path for the ISO file.")
-            return
-        output_path_var.set(iso_path)
+    Runs on the job's worker thread and reaches the GUI only through the job's events.
 
-    if not check_writable_directory(iso_path):
-        messagebox.showerror("Error", "The target directory is not writable. Please choose a different directory.")
-        return
+    Args:
+    job (jobs.Job): The job, with the device and output path
+    method (str): Backend name or config.BACKEND_AUTO
+    options (backends.ImagingOptions): ddrescue flags and video mode chosen in the GUI
+    selected_files (list): Paths to rescue instead of the whole disc
+    storage (str): Output storage format, one of config.STORAGE_FORMATS
+    mover (spool.SpoolMover): Moves the results of a job spooled to job.output to job.destination, or None
+    """
+    job.transition(PROBING)
+    try:
+        job.log_file = open_job_log(job.output)
+    except OSError as e:
+        job.log(f"Could not open the job log: {e}", level="WARNING")
+    try:
+        journal = open_journal(job.output, device=job.device, drive=get_drive_model(job.device),
+                               method=method, storage=storage, video_mode=options.video_mode,
+                               log=job.log_file.base if job.log_file is not None else None)
+    except OSError as e:
+        job.log(f"Could not start the job journal: {e}", level="WARNING")
+        journal = None
+
+    started = False
+    try:
+        started = start_job(job, journal, method, options, selected_files, storage)
+    except Exception as e:
+        job.log(f"Unexpected error: {e}", level="ERROR")
+        job.show("error", "Error", "An unexpected error occurred. See the log for details.")
+    finally:
+        if not started and journal is not None:
+            journal.finish("aborted")
+        if not job.finished:
+            job.finish("aborted")
+        if job.log_file is not None:
+            job.log_file.write("DEBUG", format_usage(pool))
+            job.log_file.close()
+
+    staging, destination_dir = os.path.dirname(job.output), os.path.dirname(job.destination)
+    if mover is not None and staging != destination_dir:
+        if job.outcome == "success":
+            job.log(f"Moving the results from {staging} to {destination_dir} in the background")
+            mover.submit(staging, destination_dir, os.path.basename(job.output), job.log)
+        elif os.path.isdir(staging):
+            job.log(f"The partial results stay in {staging}; start the job again to resume it.")
+
+def start_job(job, journal, method, options, selected_files, storage):
+    """Run the checks that precede a job, then the job itself.
+
+    Returns True if the copy or rip was started; it then owns the journal."""
+    iso_path, dvd_device = job.output, job.device
+    with span(journal, "device_check") as fields:
+        if not check_writable_directory(iso_path) or not check_writable_directory(job.destination):
+            job.show("error", "Error", "The target directory is not writable. Please choose a different directory.")
+            fields["outcome"] = "not_writable"
+            return False
 
-    if os.path.exists(iso_path):
-        if not messagebox.askyesno("Confirm Overwrite", f"The file {iso_path} already exists. Overwrite?"):
-            return
+        resume = False
+        if os.path.exists(iso_path) or os.path.exists(job.destination):
+            rescued = sum(size for _, size, status in read_mapfile(iso_path + ".map")[2] if status == FINISHED) \
+                if os.path.exists(iso_path + ".map") else 0
+            if rescued and job.ask("yesno", "Resume Rescue", f"An earlier rescue of {iso_path} stopped after "
+                                   f"{rescued / 1e6:.0f} MB. Resume it?"):
+                resume = True
+            elif not job.ask("yesno", "Confirm Overwrite", f"The file {job.destination} already exists. Overwrite?"):
+                fields["outcome"] = "cancelled"
+                job.finish("cancelled")
+                return False
 
-    dvd_device = dvd_device_var.get().split()[0]
-    if dvd_device == "No DVD device found":
-        messagebox.showerror("Error", NO_DVD_DEVICE)
-        return
+        if dvd_device == "No":
+            job.show("error", "Error", NO_DVD_DEVICE)
+            fields["outcome"] = "no_device"
+            return False
+
+    with span(journal, "duplicate_check") as fields:
+        if not check_duplicate_disc(job):
+            fields["outcome"] = "skipped"
+            job.finish("skipped")
+            return False
 
-    media_type = detect_media_type(dvd_device, log_text)
+    with span(journal, "media_detection") as fields:
+        media_type = detect_media_type(dvd_device, job.log, journal)
+        fields["media_type"] = media_type
     if media_type == "Unknown":
-        messagebox.showerror("Error", "Unsupported or unknown media type detected.")
-        return
+        job.show("error", "Error", "Unsupported or unknown media type detected.")
+        return False
 
-    command = prepare_command(media_type, dvd_device, iso_path, 
-                              n_option_var.get(), r3_option_var.get(), 
-                              b_option_var.get(), d_option_var.get(), 
-                              c_option_var.get())
-    if not command:
-        return
+    if media_type == "Audio CD":
+        output_dir = os.path.splitext(iso_path)[0]
+        job.log(f"Ripping audio CD track by track to {output_dir}...")
+        run_audio_rip(job, output_dir, journal)
+        return True
 
-    if not check_free_space(iso_path, 8 * 1024 * 1024 * 1024):
-        messagebox.showerror("Error", "Insufficient free space in the output directory.")
-        return
+    with span(journal, "preflight") as fields:
+        domain_mapfile = None
+        if selected_files and media_type == "Data CD/DVD":
+            domain_mapfile = iso_path + ".domain.map"
+            try:
+                selected = write_domain_mapfile(dvd_device, selected_files, domain_mapfile)
+            except (OSError, FilesystemError) as e:
+                job.show("error", "Error", f"Could not read the file list from the disc: {e}")
+                fields["outcome"] = "no_listing"
+                return False
+            job.log(f"Rescuing {len(selected)} selected files using domain mapfile {domain_mapfile}")
+
+        options = options._replace(domain_mapfile=domain_mapfile, resume=resume)
+        disc = disc_info(dvd_device, iso_path, get_drive_model(dvd_device), drive_profiles_path(job.destination))
+        try:
+            commands, plan = prepare_commands(media_type, dvd_device, iso_path, options, disc, method)
+        except BackendError as e:
+            job.show("error", "Error", str(e))
+            fields["outcome"] = "backend_missing"
+            return False
+        if not commands:
+            job.show("error", "Error", f"No installed imaging backend can handle this {media_type}.")
+            fields["outcome"] = "no_command"
+            return False
+        fields["backend"] = plan[0][0].name
+        job.log(f"Imaging backends: {format_plan(plan)}")
+        extract_video = media_type == "Video/Music DVD" and options.video_mode == VIDEO_DVD_IMAGE
+        if extract_video:
+            job.log("Imaging the video DVD in one pass; VIDEO_TS will be extracted from the image afterwards.")
+
+        if not check_free_space(iso_path, 8 * 1024 * 1024 * 1024):
+            job.show("error", "Error", "Insufficient free space in the output directory.")
+            fields["outcome"] = "no_space"
+            return False
+
+        if resume:
+            restored = restore_checkpoint(iso_path + ".map")
+            if restored is not None:
+                job.log(f"Resuming from the last checkpoint: {restored[0] / 1e6:.0f} MB synced to disk "
+                        f"of {restored[1] / 1e6:.0f} MB in {iso_path}.map")
+            else:
+                job.log(f"Resuming from {iso_path}.map")
+        else:
+            handle_mapfile(iso_path, options.c)
 
-    handle_mapfile(iso_path, c_option_var.get())
+    job.log("Starting ISO creation process...")
+    job.log(f"Executing command: {describe_command(commands[0])}")
+    run_command(commands, job, storage, extract_video, journal, disc.size)
+    return True
 
-    disable_gui_elements(app.winfo_children())
-    stop_button.config(state=tk.NORMAL, bg='red')
-    app.update_idletasks()
 
-    update_log(log_text, "Starting ISO creation process...")
-    update_log(log_text, f"Executing command: {command}")
+def destination_of(job, path):
+    """Where a file the job wrote ends up: in spool mode files are moved from the
+    directory of job.output to that of job.destination afterwards."""
+    return final_path(path, os.path.dirname(job.output), os.path.dirname(job.destination))
 
-    threading.Thread(target=run_command, args=(command, log_text, app, iso_path, dvd_device, stop_button, progress_bar)).start()
+def check_duplicate_disc(job):
+    """Look for an existing image of the inserted disc in the output directory.
 
+    Offers to skip, link or verify instead of imaging again. Returns True if the
+    disc should be imaged."""
+    dvd_device = job.device
+    # Nothing here may stop the rescue: any failure means imaging the disc as usual
+    try:
+        fingerprint = compute_fingerprint(dvd_device)
+        duplicates = find_duplicates(fingerprint, os.path.dirname(job.destination) or '.', exclude=job.destination,
+                                     log=job.log)
+    except Exception as e:
+        job.log(f"Could not check for an existing image of the disc: {e}", level="WARNING")
+        return True
+    if not duplicates:
+        return True
 
-def check_media_present(device):
+    existing = duplicates[0]
+    job.log(f"Disc fingerprint matches existing image {existing}", level="WARNING")
+    choice = job.ask("choice", "Disc Already Archived",
+                     f"This disc appears to be archived already as:\n{existing}\n\nWhat would you like to do?",
+                     ["Skip", "Link Existing", "Verify", "Image Anyway"])
+    if choice == "Image Anyway":
+        return True
+    if choice == "Link Existing":
+        try:
+            link_image(existing, job.destination)
+            job.log(f"Linked {job.destination} to {existing}")
+        except OSError as e:
+            job.show("error", "Error", f"Could not link the existing image: {e}")
+    elif choice == "Verify":
+        job.log(f"Verifying disc against {existing}...")
+        try:
+            differing = verify_against_image(dvd_device, existing)
+        except Exception as e:
+            job.log(f"Could not verify against {existing}, imaging the disc instead: {e}", level="WARNING")
+            return True
+        if differing:
+            job.log(f"{differing} sectors differ from or could not be compared with {existing}", level="WARNING")
+            job.show("warning", "Verification", f"{differing} sectors differ from the existing image.")
+        else:
+            job.log(f"Disc matches {existing}")
+            job.show("info", "Verification", "The disc matches the existing image.")
+    else:
+        job.log("Imaging skipped, disc already archived.")
+    return False
+
+def check_media_present(device, job):
     while True:
         try:
             result = subprocess.run(['dd', 'if=' + device, 'of=/dev/null', 'count=1'], 
                                     check=True, stderr=subprocess.DEVNULL)
             return True
         except subprocess.CalledProcessError:
-            if not messagebox.askyesno("No Media Detected", "No media detected in the drive. Would you like to try again?"):
+            if not job.ask("yesno", "No Media Detected", "No media detected in the drive. Would you like to try again?"):
                 return False
 
-def run_command(command_list, log_text, app, iso_path, dvd_device, stop_button, progress_bar):
+def run_audio_rip(job, output_dir, journal=None):
+    """Rip an audio CD track by track, encoding finished tracks in the background."""
+    def on_progress(value):
+        job.progress(value)
+        if journal is not None:
+            journal.sample(percent=value)
+
+    job.transition(COPYING)
+    try:
+        with span(journal, "rip") as fields, scheduler.imaging(job):
+            tracks, state = rip_disc(job.device, output_dir, stop_event=job.stop_event, on_progress=on_progress,
+                                     log=job.log)
+            fields.update(tracks=len(tracks), ripped=len(state["ripped"]), encoded=len(state["encoded"]))
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        job.log(f"Audio rip failed: {e}. Start again to resume with the first unfinished track.", level="ERROR")
+        job.show("error", "Error", "Ripping the audio CD failed. See the log for details.")
+        outcome = "failed"
+    else:
+        if job.stop_event.is_set():
+            job.log("Operation stopped. Start again to resume with the first unfinished track.", level="WARNING")
+            outcome = "stopped"
+        else:
+            job.log(f"Ripped {len(state['ripped'])} and encoded {len(state['encoded'])} of {len(tracks)} tracks")
+            job.transition(VERIFYING)
+            with span(journal, "verification"):
+                log_accuraterip(output_dir, tracks, state, job)
+            job.show("info", "Success", f"Audio CD successfully ripped to {destination_of(job, output_dir)}")
+            if job.ask("yesno", "Audio CD Ripped", "Audio CD successfully ripped. Would you like to eject the disc?"):
+                with span(journal, "eject"):
+                    eject_media(job.device)
+            outcome = "success"
+    if journal is not None:
+        journal.finish(outcome)
+    job.finish(outcome)
+
+def log_accuraterip(output_dir, tracks, state, job):
+    """Log the per-track checksums and how they compare to the local reference database.
+
+    Only checksums of this table of contents are compared, and each track is added
+    to the database once, however often the rip is resumed."""
+    numbers = {track.number for track in tracks}
+    checksums = {number: values for number, values in state["checksums"].items()
+                 if state["toc"] == list(tracks) and int(number) in numbers}
+    if not checksums:
+        return
+    db_path = default_db_path(destination_of(job, output_dir))
+    identifier = disc_id(tracks)
+    try:
+        results = compare_disc(identifier, checksums, load_reference_db(db_path))
+        for line in format_results(checksums, results):
+            job.log(line)
+        new = checksums_to_record(state, tracks)
+        if new:
+            record_accuraterip(db_path, identifier, new)
+            state["recorded"] |= {int(number) for number in new}
+            save_state(output_dir, state)
+    except (OSError, ValueError) as e:
+        job.log(f"AccurateRip check failed: {e}", level="WARNING")
+        return
+    accurate = sum(1 for version, _ in results.values() if version)
+    job.log(f"AccurateRip ({identifier}): {accurate} of {len(results)} tracks match the reference database")
+
+def run_command(command_list, job, storage=STORAGE_RAW, extract_video=False, journal=None, total_size=None,
+                durability=DURABILITY_LEVEL, sync_interval=DURABILITY_INTERVAL):
     """
-    Execute the ddrescue command and handle its output.
+    Run the imaging commands in turn until one succeeds and handle their output.
 
     Args:
-    command_list (list): List of ddrescue commands to try
-    log_text (tk.Text): Text widget for logging
-    app (tk.Tk): Main application window
-    iso_path (str): Path to the output ISO file
-    dvd_device (str): Path to the DVD device
-    stop_button (tk.Button): Button to stop the process
-    progress_bar (ttk.Progressbar): Progress bar widget
+    command_list (list): argv lists to try in order (see backends.prepare_commands)
+    job (jobs.Job): The job, with the device and output path; receives log lines, progress and state changes
+    storage (str): Output storage format, one of config.STORAGE_FORMATS
+    extract_video (bool): Extract VIDEO_TS/AUDIO_TS from the finished image
+    journal (journal.Journal): Job journal to record spans and throughput samples in, or None
+    total_size (int): Disc size in bytes, for progress of backends that only report bytes copied
+    durability (str): When the image reaches the disk, one of durability.DURABILITY_LEVELS
+    sync_interval (float): Seconds between syncs for the periodic and checkpoint levels
     """
-    global process, stop_event
+    iso_path, dvd_device, stop_event = job.output, job.device, job.stop_event
+
+    def cleanup(outcome):
+        if journal is not None:
+            journal.finish(outcome)
+        job.progress(0)
+        job.finish(outcome)
 
-    def cleanup():
-        """Reset the GUI elements after process completion or termination."""
-        update_progress(progress_bar, 0)
-        reset_gui_state(app.winfo_children())
-        stop_button.config(state=tk.DISABLED)
+    started = time.time()
+    job.transition(COPYING)
 
-    for command in command_list:
+    for attempt, argv in enumerate(command_list, 1):
+        backend = backend_for_command(argv)
+        engine_mapfile = iso_path + ".map" if backend is not None and backend.resumable else None
         try:
-            # Split the command string into a list
-            cmd_parts = command.split()
-            
-            # Start the process
-            process = subprocess.Popen(cmd_parts, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-                                       universal_newlines=True, preexec_fn=os.setsid)
-            
-            while process.poll() is None and not stop_event.is_set():
-                output = process.stdout.readline()
-                if output:
-                    if "%" in output:
-                        try:
-                            progress = float(output.split("%")[0].split()[-1])
-                            update_progress(progress_bar, progress)
-                        except ValueError:
-                            pass
-                    update_log(log_text, output.strip())
+            with span(journal, "copy", attempt=attempt, command=describe_command(argv),
+                      backend=backend.name if backend else argv[0], durability=durability) as copy_fields, \
+                    scheduler.imaging(job), DurabilityWatcher(iso_path, engine_mapfile, durability, sync_interval, log=job.log) as watcher:
+                # stderr is merged into stdout: dd reports its progress there, and an unread
+                # pipe would block the tool once it fills up
+                process = job.process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                         universal_newlines=True, preexec_fn=imaging_preexec)
+
+                # ddrescue spreads its status over several lines; samples carry the latest value of each field
+                status = {}
+                last_line = ""
+
+                def handle_output(output):
+                    nonlocal last_line
+                    if not output.strip():
+                        return
+                    last_line = output.strip()
+                    sample = backend.parse_progress(output, total_size) if backend else {}
+                    if "percent" in sample:
+                        job.progress(sample["percent"])
+                    if "rate" in sample:
+                        scheduler.report(job, sample["rate"])
+                    if sample and journal is not None:
+                        status.update(sample)
+                        journal.sample(**status)
+                    job.log(last_line)
+
+                while process.poll() is None and not stop_event.is_set():
+                    handle_output(process.stdout.readline())
+                if not stop_event.is_set():
+                    for output in process.stdout:
+                        handle_output(output)
+
+                if stop_event.is_set():
+                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+                    try:
+                        process.wait(timeout=30)    # ddrescue saves its mapfile on the way out
+                    except subprocess.TimeoutExpired:
+                        pass
+                    copy_fields["outcome"] = "stopped"
+                else:
+                    copy_fields["returncode"] = process.returncode
+                    if process.returncode != 0:
+                        copy_fields["outcome"] = "failed"
+            if watcher.syncs:
+                job.log(f"Synced the image to disk {watcher.syncs} times ({durability}), "
+                        f"{watcher.sync_seconds:.1f} s in total", level="DEBUG")
+                if journal is not None:
+                    journal.event("durability", level=durability, syncs=watcher.syncs,
+                                  sync_seconds=round(watcher.sync_seconds, 4))
 
             if stop_event.is_set():
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                update_log(log_text, "Operation stopped.", level="WARNING")
-                stop_button.config(state=tk.DISABLED)
-                cleanup()
+                job.log("Operation stopped.", level="WARNING")
+                cleanup("stopped")
                 return
 
-            stderr_output = process.stderr.read().strip()
-            if stderr_output:
-                update_log(log_text, f"Error output: {stderr_output}", level="ERROR")
-
             if process.returncode == 0:
                 if os.path.getsize(iso_path) > 0:
-                    messagebox.showinfo("Success", ISO_CREATION_SUCCESS.format(iso_path))
-                    if messagebox.askyesno("ISO Created", EJECT_PROMPT):
-                        eject_media(dvd_device)
-                    cleanup()
+                    job.transition(VERIFYING)
+                    mapfile = iso_path + ".map"
+                    is_dd = backend is not None and backend.name == "dd"
+                    with span(journal, "verification"):
+                        if is_dd:
+                            # The suspect map only marks zero-filled sectors: it is no rescue map
+                            # and must not count as one for the profile, trace or catalog
+                            log_zero_scan(iso_path, job)
+                            mapfile = None
+                        elif os.path.exists(mapfile):
+                            log_damage_report(iso_path, mapfile, job)
+                        if os.path.exists(rates_log_path(iso_path)):
+                            log_throughput_profile(iso_path, mapfile, dvd_device, job)
+                        if RECORD_READ_TRACES and os.path.exists(reads_log_path(iso_path)):
+                            log_read_trace(iso_path, mapfile, job)
+                        if extract_video:
+                            log_video_extraction(iso_path, mapfile, job)
+                        catalog_info = describe_for_catalog(iso_path, mapfile, job)
+                        if is_dd and catalog_info is not None:
+                            # dd stops with an error at the first unreadable sector, so it read them all
+                            catalog_info["rescued_percent"] = 100.0
+                    with span(journal, "storage", storage=storage):
+                        if storage == STORAGE_CHUNKED:
+                            output_path = compress_output(iso_path, job)
+                        elif storage == STORAGE_DEDUP:
+                            output_path = store_output(iso_path, job)
+                        else:
+                            output_path = iso_path
+                    method = backend.name if backend else argv[0]
+                    with span(journal, "catalog"):
+                        record_in_catalog(destination_of(job, output_path), catalog_info, dvd_device, method, started, job)
+                    job.show("info", "Success", ISO_CREATION_SUCCESS.format(destination_of(job, output_path)))
+                    if job.ask("yesno", "ISO Created", EJECT_PROMPT):
+                        with span(journal, "eject"):
+                            eject_media(dvd_device)
+                    cleanup("success")
                     return
                 else:
-                    messagebox.showerror("Error", "The ISO file is 0 bytes in size. Please check the DVD and try again.")
-                    cleanup()
+                    job.show("error", "Error", "The ISO file is 0 bytes in size. Please check the DVD and try again.")
+                    cleanup("empty_image")
                     return
             else:
-                raise subprocess.CalledProcessError(process.returncode, command)
+                if last_line:
+                    job.log(f"Error output: {last_line}", level="ERROR")
+                raise subprocess.CalledProcessError(process.returncode, describe_command(argv))
 
         except subprocess.CalledProcessError as e:
-            update_log(log_text, f"Command failed with error: {e}. Trying next configuration...", level="ERROR")
+            job.log(f"Command failed with error: {e}. Trying next configuration...", level="ERROR")
             continue
         except Exception as e:
-            update_log(log_text, f"Unexpected error: {e}", level="ERROR")
-            messagebox.showerror("Error", "An unexpected error occurred. See the log for details.")
-            cleanup()
+            job.log(f"Unexpected error: {e}", level="ERROR")
+            job.show("error", "Error", "An unexpected error occurred. See the log for details.")
+            cleanup("error")
             return
 
-    messagebox.showerror("Error", "All command configurations failed. See the log for details.")
-    cleanup()
-
-def update_progress(progress_bar, value):
-    """Update the progress bar with the given value."""
-    progress_bar['value'] = value
-    progress_bar.update_idletasks()
+    job.show("error", "Error", "All command configurations failed. See the log for details.")
+    cleanup("failed")
 
 
 def check_free_space(file_path, required_space):
@@ -199,99 +495,169 @@ def check_free_space(file_path, required_space):
     total, used, free = shutil.disk_usage(directory)
     return free > required_space
 
-def stop_process():
-    """Stop the current ISO creation process."""
-    global stop_event
-    if stop_event:
-        stop_event.set()
-
-def attempt_iso_recovery(iso_path, log_text):
+def attempt_iso_recovery(iso_path, job):
     """Attempt to recover or analyze the ISO file."""
     if check_tool_installed("dvdisaster"):
         recovery_command = f"dvdisaster -r -i {iso_path} -o {iso_path.replace('.iso', '-recovered.iso')}"
     else:
-        messagebox.showwarning("dvdisaster not installed", "dvdisaster is not installed. Attempting recovery with iso-read instead.")
+        job.show("warning", "dvdisaster not installed", "dvdisaster is not installed. Attempting recovery with iso-read instead.")
         recovery_command = f"iso-read -i {iso_path} -o {iso_path.replace('.iso', '-recovered.iso')}"
     
     try:
-        update_log(log_text, f"Attempting ISO recovery with command: {recovery_command}")
+        job.log(f"Attempting ISO recovery with command: {recovery_command}")
         subprocess.run(recovery_command, shell=True, check=True)
-        messagebox.showinfo("Recovery", "ISO recovery completed. Check the recovered ISO.")
+        job.show("info", "Recovery", "ISO recovery completed. Check the recovered ISO.")
     except subprocess.CalledProcessError as e:
-        update_log(log_text, f"ISO recovery failed with error: {e}")
-        messagebox.showerror("Error", "ISO recovery failed. See the log for details.")
+        job.log(f"ISO recovery failed with error: {e}")
+        job.show("error", "Error", "ISO recovery failed. See the log for details.")
 
-def verify_iso_integrity(iso_path, log_text):
+def verify_iso_integrity(iso_path, job):
     try:
         result = subprocess.run(['isoinfo', '-i', iso_path, '-d'], capture_output=True, text=True, check=True)
         if "Volume size is" in result.stdout:
-            update_log(log_text, f"ISO integrity verified: {iso_path}")
+            job.log(f"ISO integrity verified: {iso_path}")
             return True
         else:
-            update_log(log_text, f"ISO integrity check failed: {iso_path}", level="ERROR")
+            job.log(f"ISO integrity check failed: {iso_path}", level="ERROR")
             return False
     except subprocess.CalledProcessError:
-        update_log(log_text, f"ISO integrity check failed: {iso_path}", level="ERROR")
+        job.log(f"ISO integrity check failed: {iso_path}", level="ERROR")
         return False
 
+def describe_for_catalog(iso_path, mapfile, job):
+    """Read what the catalog needs from the raw image before it is converted or moved."""
+    try:
+        return describe_image(iso_path, mapfile, log=job.log)
+    except (OSError, FilesystemError) as e:
+        job.log(f"Could not describe the image for the catalog: {e}", level="WARNING")
+        return None
+
+def record_in_catalog(output_path, info, dvd_device, method, started, job):
+    """Record a finished job in the catalog next to the output image."""
+    if info is None:
+        return
+    catalog_path = default_catalog_path(output_path)
+    try:
+        conn = connect(catalog_path)
+        try:
+            record_disc(conn, os.path.abspath(output_path), info, dvd_device, get_drive_model(dvd_device),
+                        method, started, time.time())
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        job.log(f"Could not update the catalog {catalog_path}: {e}", level="WARNING")
+        return
+    job.log(f"Recorded {len(info['files'])} files in catalog {catalog_path}")
+
+def compress_output(iso_path, job):
+    """Convert the finished raw image into a chunked image and remove the raw file.
+
+    Returns the path of the image that was kept."""
+    chunked_path = os.path.splitext(iso_path)[0] + CHUNKED_IMAGE_EXTENSION
+    job.log(f"Compressing image to {chunked_path}...")
+    try:
+        digest = compress_image(iso_path, chunked_path)
+        if DURABILITY_LEVEL != DURABILITY_NONE:
+            sync_file(chunked_path)     # the raw image is the only other copy
+        os.remove(iso_path)
+    except (OSError, ValueError) as e:
+        job.log(f"Compression failed, keeping the raw image: {e}", level="ERROR")
+        return iso_path
+    job.log(f"Compressed image written to {chunked_path} (sha256 of raw data: {digest})")
+    return chunked_path
+
+def store_output(iso_path, job):
+    """Add the finished raw image to the deduplicating store next to it and remove the raw file.
+
+    Returns the path of the manifest, or of the raw image if storing failed."""
+    store = os.path.join(os.path.dirname(job.destination), IMAGE_STORE_DIR_NAME)
+    job.log(f"Adding image to store {store}...")
+    try:
+        # Every disc imaged to the same output path has the same name: never replace an earlier one
+        manifest = add_image(store, iso_path, unique=True)
+        if DURABILITY_LEVEL != DURABILITY_NONE:
+            sync_filesystem(store)
+        os.remove(iso_path)
+    except (OSError, ImageStoreError) as e:
+        job.log(f"Adding to the image store failed, keeping the raw image: {e}", level="ERROR")
+        return iso_path
+    job.log(f"Stored {manifest['name']}: {manifest['new_bytes'] // (1024 * 1024)} MB new of {manifest['size'] // (1024 * 1024)} MB")
+    return manifest_path(store, manifest['name'])
+
+def log_zero_scan(iso_path, job):
+    """Scan a dd image for zero-filled or filler sectors that dd accepted without complaint."""
+    suspect_mapfile = iso_path + ".suspect.map"
+    try:
+        summary = write_suspect_mapfile(iso_path, suspect_mapfile)
+    except OSError as e:
+        job.log(f"Sector scan failed: {e}", level="WARNING")
+        return
+    level = "WARNING" if summary["zero"] + summary["filler"] else "INFO"
+    job.log(f"Sector scan: {format_scan_summary(summary)}. Suspect areas written to {suspect_mapfile}", level=level)
+    log_damage_report(iso_path, suspect_mapfile, job)
+
+def log_damage_report(iso_path, mapfile, job):
+    """Log which files of the rescued image touch areas the mapfile marks as unrescued."""
+    try:
+        _, report = file_damage_report(iso_path, mapfile)
+    except (OSError, FilesystemError) as e:
+        job.log(f"File damage report unavailable: {e}", level="WARNING")
+        return
+    for entry, status, damaged in report:
+        if status != INTACT:
+            job.log(f"{status}: {entry.path} ({damaged} of {entry.size} bytes unreadable)", level="WARNING")
+    job.log(f"File damage report: {format_summary(summarize_report(report))}")
+
+def log_throughput_profile(iso_path, mapfile, dvd_device, job):
+    """Store the throughput profile from the ddrescue logs with the image and add it to the drive's profile."""
+    try:
+        size = mapfile_size(read_mapfile(mapfile)[2]) if mapfile and os.path.exists(mapfile) else None
+        profile = profile_from_logs(iso_path, size)
+        if profile is None:
+            return
+        save_profile(iso_path, profile)
+        drive = get_drive_model(dvd_device) or dvd_device
+        entry = update_drive_profile(drive_profiles_path(job.destination), drive, profile)
+    except (OSError, ValueError) as e:
+        job.log(f"Throughput profile unavailable: {e}", level="WARNING")
+        return
+    for line in format_profile(profile).splitlines():
+        job.log(line)
+    job.log(f"Drive {drive}: median {entry['median_rate'] / 1e6:.2f} MB/s over {entry['jobs']} jobs")
+
+def log_read_trace(iso_path, mapfile, job):
+    """Keep the reads of this job as a binary trace, so the disc's damage can be replayed later."""
+    try:
+        size = mapfile_size(read_mapfile(mapfile)[2]) if mapfile and os.path.exists(mapfile) else None
+        path = record_trace(iso_path, size)
+        if path is None:
+            return
+        summary = summarize_trace(*read_trace(path))
+    except (OSError, ValueError) as e:
+        job.log(f"Read trace unavailable: {e}", level="WARNING")
+        return
+    job.log(f"Read trace {path}: {summary['reads']} reads, {summary['failed_reads']} failed")
+
+def log_video_extraction(iso_path, mapfile, job):
+    """Extract VIDEO_TS and AUDIO_TS from the finished image into a directory next to it."""
+    job.log("Extracting VIDEO_TS/AUDIO_TS from the image...")
+    try:
+        destination, results, scrambled = extract_video_ts(iso_path, mapfile=mapfile if mapfile and os.path.exists(mapfile) else None)
+    except (OSError, FilesystemError) as e:
+        job.log(f"VIDEO_TS extraction failed, the image is kept: {e}", level="ERROR")
+        return
+    for entry, _, error in results:
+        if error is not None:
+            job.log(f"Error extracting {entry.path}: {error}", level="ERROR")
+    extracted = sum(1 for _, _, error in results if error is None)
+    job.log(f"Extracted {extracted} of {len(results)} files to {destination}")
+    if scrambled:
+        job.log("The title VOBs are CSS-encrypted and were extracted as stored on the disc; "
+                "use the dvdbackup mode to get decrypted files.", level="WARNING")
+
 def eject_media(dvd_device):
     try:
         subprocess.run(['eject', dvd_device], check=True)
         return True
     except subprocess.CalledProcessError:
         return False
-
-def prepare_data_cd_dvd_command(dvd_device, output_path, n_option, r3_option, b_option, d_option, c_option):
-    """
-    Prepare the ddrescue command for data CD/DVD with fallback options.
-
-    Args:
-    dvd_device (str): Path to the DVD device
-    output_path (str): Path for the output ISO file
-    n_option (bool): Whether to use the -n option
-    r3_option (bool): Whether to use the -r3 option
-    b_option (bool): Whether to use the -b 2048 option
-    d_option (bool): Whether to use the -d option
-    c_option (bool): Whether to use the -C option
-
-    Returns:
-    list: A list of ddrescue commands with fallback options
-    """
-    ddrescue_options = ['--force']
-    if n_option:
-        ddrescue_options.append("-n")
-    if r3_option:
-        ddrescue_options.append("-r3")
-    if b_option:
-        ddrescue_options.append("-b 2048")
-    if d_option:
-        ddrescue_options.append("-d")
-    if c_option:
-        if os.path.exists(f"{output_path}.map"):
-            ddrescue_options.append("-C")
-        else:
-            print("Mapfile does not exist. Ignoring -C option.")
-    
-    mapfile = f"{output_path}.map"
-    
-    # Use a list to store the command parts
-    base_command = [
-        "sudo",
-        "ddrescue",
-        *ddrescue_options,
-        dvd_device,
-        output_path,
-        mapfile
-    ]
-    
-    # Join the command parts with spaces
-    command = " ".join(base_command)
-
-    # Add fallback logic: try less aggressive options if the initial command fails
-    fallback_commands = [
-        command,
-        command.replace("-r3", "-r1"),
-        command.replace("-n", "")
-    ]
-
-    return fallback_commands
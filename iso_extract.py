@@ -0,0 +1,172 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from iso_filesystem import open_image, read_filesystem, FilesystemError
+from chunked_image import ChunkedImage
+from file_rescue import select_files
+from damage_report import unrescued_ranges, damaged_bytes
+from mapfile import read_mapfile
+from iosched import scheduler, background, VERIFY
+
+# What to do with parts of a file that lie in unrescued areas of the image
+UNRESCUED_COPY = "copy"   # copy whatever the image contains there
+UNRESCUED_ZERO = "zero"   # leave zero-filled holes in the extracted file
+UNRESCUED_SKIP = "skip"   # do not extract files with unrescued parts at all
+
+DEFAULT_WORKERS = 4
+COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+def copy_range(src_fd, dst_fd, src_offset, dst_offset, length, data=None):
+    """Copy length bytes between two file descriptors without passing them through Python.
+
+    Uses copy_file_range, then sendfile, and finally falls back to slicing the
+    image object (mmap or chunked image). With src_fd None only slicing is used.
+    Returns the number of bytes copied, which is smaller than length if the image
+    ends early."""
+    copied = 0
+    if src_fd is None:
+        pass
+    elif hasattr(os, 'copy_file_range'):
+        try:
+            while copied < length:
+                scheduler.take(VERIFY, min(length - copied, COPY_CHUNK_SIZE))
+                count = os.copy_file_range(src_fd, dst_fd, min(length - copied, COPY_CHUNK_SIZE),
+                                           src_offset + copied, dst_offset + copied)
+                if count == 0:
+                    return copied
+                copied += count
+            return copied
+        except OSError:
+            pass  # e.g. EXDEV on older kernels or unsupported file systems
+    try:
+        if src_fd is None:
+            raise OSError("No file descriptor for the image")
+        os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+        while copied < length:
+            scheduler.take(VERIFY, min(length - copied, COPY_CHUNK_SIZE))
+            count = os.sendfile(dst_fd, src_fd, src_offset + copied, min(length - copied, COPY_CHUNK_SIZE))
+            if count == 0:
+                return copied
+            copied += count
+        return copied
+    except OSError:
+        if data is None:
+            raise
+    while copied < length:
+        scheduler.take(VERIFY, min(length - copied, COPY_CHUNK_SIZE))
+        chunk = data[src_offset + copied:src_offset + min(length, copied + COPY_CHUNK_SIZE)]
+        if not chunk:
+            break
+        os.pwrite(dst_fd, chunk, dst_offset + copied)
+        copied += len(chunk)
+    return copied
+
+def split_extent(offset, length, ranges):
+    """Split an extent into (offset, length, rescued) pieces along the unrescued ranges."""
+    pieces = []
+    end = offset + length
+    pos = offset
+    for start, stop in ranges:
+        if stop <= pos or start >= end:
+            continue
+        if start > pos:
+            pieces.append((pos, start - pos, True))
+        bad_end = min(stop, end)
+        pieces.append((max(start, pos), bad_end - max(start, pos), False))
+        pos = bad_end
+    if pos < end:
+        pieces.append((pos, end - pos, True))
+    return pieces
+
+def target_path(destination, entry_path):
+    """Return the output path for a file, refusing names that would escape the destination."""
+    relative = os.path.normpath(entry_path.lstrip('/'))
+    if relative.startswith('..') or os.path.isabs(relative):
+        raise ValueError(f"Refusing to extract outside the destination: {entry_path}")
+    return os.path.join(destination, relative)
+
+def extract_file(src_fd, data, entry, destination, ranges=None, unrescued=UNRESCUED_COPY):
+    """Extract one FileEntry. Returns the number of bytes copied, or None if the file was skipped."""
+    if ranges and unrescued == UNRESCUED_SKIP and damaged_bytes(entry.extents, ranges):
+        return None
+    path = target_path(destination, entry.path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dst_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    copied = 0
+    try:
+        dst_offset = 0
+        for offset, length in entry.extents:
+            if offset is None:
+                dst_offset += length  # sparse extent, left as a hole
+                continue
+            if ranges and unrescued == UNRESCUED_ZERO:
+                pieces = split_extent(offset, length, ranges)
+            else:
+                pieces = [(offset, length, True)]
+            for piece_offset, piece_length, rescued in pieces:
+                if rescued:
+                    copied += copy_range(src_fd, dst_fd, piece_offset, dst_offset, piece_length, data)
+                dst_offset += piece_length
+        os.ftruncate(dst_fd, entry.size)
+    finally:
+        os.close(dst_fd)
+    return copied
+
+def extract_files(image_path, destination, paths=None, mapfile=None, unrescued=UNRESCUED_COPY, workers=DEFAULT_WORKERS):
+    """Extract files from an image in parallel.
+
+    paths selects files or directories (all files if empty). mapfile, if given,
+    marks the unrescued areas handled according to unrescued. Returns a list of
+    (entry, bytes_copied_or_None, error_or_None) tuples."""
+    ranges = unrescued_ranges(read_mapfile(mapfile)[2]) if mapfile else None
+    data = open_image(image_path)
+    # Chunked images have to be decompressed, so their extents are copied via slices
+    src_fd = None if isinstance(data, ChunkedImage) else os.open(image_path, os.O_RDONLY)
+    try:
+        listing = read_filesystem(data)
+        files = select_files(listing.files, paths) if paths else listing.files
+
+        def extract(entry):
+            try:
+                with background(VERIFY):
+                    return entry, extract_file(src_fd, data, entry, destination, ranges, unrescued), None
+            except (OSError, ValueError) as e:
+                return entry, None, e
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(extract, files))
+    finally:
+        if src_fd is not None:
+            os.close(src_fd)
+        data.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract files from an ISO9660/UDF image without mounting it.")
+    parser.add_argument("image", help="Path to the ISO image")
+    parser.add_argument("destination", help="Directory to extract into")
+    parser.add_argument("paths", nargs="*", help="Files or directories to extract (default: everything)")
+    parser.add_argument("--mapfile", help="ddrescue mapfile describing the unrescued areas")
+    parser.add_argument("--unrescued", choices=[UNRESCUED_COPY, UNRESCUED_ZERO, UNRESCUED_SKIP], default=UNRESCUED_COPY,
+                        help="How to treat unrescued areas: copy as-is, zero-fill, or skip affected files")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of parallel copy threads")
+    args = parser.parse_intermixed_args(argv)
+
+    try:
+        results = extract_files(args.image, args.destination, args.paths, args.mapfile, args.unrescued, args.workers)
+    except (OSError, FilesystemError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    errors = 0
+    for entry, copied, error in results:
+        if error is not None:
+            errors += 1
+            print(f"Error extracting {entry.path}: {error}", file=sys.stderr)
+        elif copied is None:
+            print(f"Skipped {entry.path} (unrescued areas)")
+    extracted = sum(1 for _, copied, error in results if copied is not None and error is None)
+    print(f"Extracted {extracted} of {len(results)} files to {args.destination}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
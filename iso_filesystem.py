@@ -0,0 +1,495 @@
+import mmap
+import os
+import stat
+import struct
+from collections import namedtuple
+from config import SECTOR_SIZE
+
+# A regular file on the disc. extents is a list of (offset, length) tuples in bytes
+# relative to the start of the image; offset is None for sparse (unrecorded) extents.
+FileEntry = namedtuple('FileEntry', ['path', 'size', 'extents'])
+
+# Result of reading a file system: all regular files plus the byte ranges holding
+# file system structures (descriptors, path tables, directories, file entries).
+Listing = namedtuple('Listing', ['fs_type', 'volume_id', 'files', 'metadata_extents'])
+
+ISO_STANDARD_ID = b'CD001'
+JOLIET_ESCAPES = (b'%/@', b'%/C', b'%/E')
+
+UDF_ANCHOR_SECTOR = 256
+UDF_TAG_PARTITION = 5
+UDF_TAG_LOGICAL_VOLUME = 6
+UDF_TAG_TERMINATOR = 8
+UDF_TAG_FILE_SET = 256
+UDF_TAG_FILE_IDENTIFIER = 257
+UDF_TAG_ALLOCATION_EXTENT = 258
+UDF_TAG_FILE_ENTRY = 261
+UDF_TAG_EXTENDED_FILE_ENTRY = 266
+UDF_FILE_TYPE_DIRECTORY = 4
+
+class FilesystemError(Exception):
+    """Raised when an image does not contain a readable ISO9660 or UDF file system."""
+
+def open_image(path):
+    """Open a disc image, a chunked image or an optical drive read-only.
+
+    Returns an object supporting len() and byte slicing, so the readers below never
+    copy more than the structures they actually look at."""
+    # Imported here: chunked_image imports FilesystemError from this module
+    from chunked_image import ChunkedImage, MAGIC as CHUNKED_IMAGE_MAGIC
+    with open(path, 'rb') as f:
+        if stat.S_ISBLK(os.fstat(f.fileno()).st_mode):
+            return DeviceReader(path)
+        if os.fstat(f.fileno()).st_size == 0:
+            raise FilesystemError(f"Image is empty: {path}")
+        if f.read(len(CHUNKED_IMAGE_MAGIC)) == CHUNKED_IMAGE_MAGIC:
+            return ChunkedImage(path)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class DeviceReader:
+    """Slice-able view of a block device using pread.
+
+    Devices are not memory-mapped: a read error on a damaged disc would raise
+    SIGBUS instead of an exception that can be reported."""
+
+    def __init__(self, device):
+        self.device = device
+        self.fd = os.open(device, os.O_RDONLY)
+        self.size = os.lseek(self.fd, 0, os.SEEK_END)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(self.size)
+        if stop <= start:
+            return b''
+        try:
+            return os.pread(self.fd, stop - start, start)
+        except OSError as e:
+            raise FilesystemError(f"Read error on {self.device} at byte {start}: {e}")
+
+    def close(self):
+        os.close(self.fd)
+
+def read_filesystem(data, prefer="udf"):
+    """Read the file listing from an image, trying the preferred file system first.
+
+    UDF is preferred by default since it is the only one able to describe files
+    larger than 4 GB; ISO9660 (with Joliet or Rock Ridge names) is used otherwise."""
+    readers = [read_udf, read_iso9660] if prefer == "udf" else [read_iso9660, read_udf]
+    errors = []
+    for reader in readers:
+        try:
+            return reader(data)
+        except (FilesystemError, struct.error, IndexError, UnicodeDecodeError) as e:
+            errors.append(str(e))
+    raise FilesystemError("No readable file system found: " + "; ".join(errors))
+
+def list_metadata_extents(data):
+    """Return the metadata extents of every file system present on the image."""
+    extents = []
+    for reader in (read_udf, read_iso9660):
+        try:
+            extents.extend(reader(data).metadata_extents)
+        except (FilesystemError, struct.error, IndexError, UnicodeDecodeError):
+            continue
+    return extents
+
+# ISO9660 / Joliet / Rock Ridge
+
+def read_iso9660(data):
+    """Walk the ISO9660 directory tree, using Rock Ridge or Joliet names when present."""
+    descriptors = []
+    sector = 16
+    while (sector + 1) * SECTOR_SIZE <= len(data):
+        descriptor = data[sector * SECTOR_SIZE:(sector + 1) * SECTOR_SIZE]
+        if descriptor[1:6] != ISO_STANDARD_ID:
+            break
+        descriptors.append(descriptor)
+        sector += 1
+        if descriptor[0] == 255:
+            break
+    primary = next((d for d in descriptors if d[0] == 1), None)
+    if primary is None:
+        raise FilesystemError("No ISO9660 primary volume descriptor found")
+    joliet = next((d for d in descriptors if d[0] == 2 and d[88:91] in JOLIET_ESCAPES), None)
+
+    block_size = struct.unpack_from('<H', primary, 128)[0] or SECTOR_SIZE
+    metadata = [(0, sector * SECTOR_SIZE)]
+    path_table_size = struct.unpack_from('<I', primary, 132)[0]
+    for location in (struct.unpack_from('<I', primary, 140)[0], struct.unpack_from('<I', primary, 144)[0],
+                     struct.unpack_from('>I', primary, 148)[0], struct.unpack_from('>I', primary, 152)[0]):
+        if location and path_table_size:
+            metadata.append((location * block_size, path_table_size))
+
+    root_extent, root_size = struct.unpack_from('<I', primary, 158)[0], struct.unpack_from('<I', primary, 166)[0]
+    root_records = data[root_extent * block_size:root_extent * block_size + min(root_size, block_size)]
+    susp_skip = _rock_ridge_skip(root_records)
+
+    if susp_skip is None and joliet is not None:
+        descriptor, decode = joliet, _decode_joliet_name
+        root_extent, root_size = struct.unpack_from('<I', joliet, 158)[0], struct.unpack_from('<I', joliet, 166)[0]
+        block_size = struct.unpack_from('<H', joliet, 128)[0] or SECTOR_SIZE
+        fs_type = "iso9660+joliet"
+    else:
+        descriptor, decode = primary, _decode_iso_name
+        fs_type = "iso9660+rockridge" if susp_skip is not None else "iso9660"
+
+    volume_id = descriptor[40:72].decode('utf-16-be' if descriptor is joliet else 'ascii', 'replace').strip(' \x00')
+    files = []
+    visited = set()
+    stack = [("", root_extent, root_size)]
+    while stack:
+        parent, extent, size = stack.pop()
+        if extent in visited:
+            continue
+        visited.add(extent)
+        metadata.append((extent * block_size, size))
+        pending = None
+        for record in _iso_directory_records(data[extent * block_size:extent * block_size + size], block_size):
+            rec_extent, rec_size, flags, raw_name, system_use = record
+            if raw_name in (b'\x00', b'\x01') or flags & 0x04:
+                continue
+            name = decode(raw_name)
+            is_dir = bool(flags & 0x02)
+            if susp_skip is not None:
+                rr = _rock_ridge_entries(data, system_use[susp_skip:], block_size, metadata)
+                if rr.get('RE') or rr.get('SL'):
+                    continue
+                name = rr.get('NM') or name
+                if 'CL' in rr:
+                    is_dir = True
+                    rec_extent = rr['CL']
+                    child = data[rec_extent * block_size:(rec_extent + 1) * block_size]
+                    rec_size = struct.unpack_from('<I', child, 10)[0] if child and child[0] else block_size
+            path = f"{parent}/{name}"
+            if is_dir:
+                stack.append((path, rec_extent, rec_size))
+                continue
+            # Files above 4 GB are split into several records, all but the last flagged multi-extent
+            if pending is not None and pending[0] == path:
+                pending[1].append((rec_extent * block_size, rec_size))
+            else:
+                pending = (path, [(rec_extent * block_size, rec_size)] if rec_size else [])
+            if not flags & 0x80:
+                files.append(FileEntry(path, sum(length for _, length in pending[1]), pending[1]))
+                pending = None
+    files.sort(key=lambda entry: entry.path)
+    return Listing(fs_type, volume_id, files, metadata)
+
+def _iso_directory_records(raw, block_size):
+    """Yield (extent, size, flags, name, system_use) for each record in a directory extent."""
+    pos = 0
+    while pos < len(raw):
+        record_length = raw[pos]
+        if record_length == 0:
+            # Records never cross a block boundary; the rest of the block is padding
+            pos = (pos // block_size + 1) * block_size
+            continue
+        record = raw[pos:pos + record_length]
+        pos += record_length
+        if len(record) < 34:
+            break
+        name_length = record[32]
+        system_use_start = 33 + name_length + (0 if name_length % 2 else 1)
+        yield (struct.unpack_from('<I', record, 2)[0], struct.unpack_from('<I', record, 10)[0],
+               record[25], record[33:33 + name_length], record[system_use_start:])
+
+def _decode_iso_name(raw_name):
+    name = raw_name.decode('ascii', 'replace').split(';', 1)[0]
+    return name[:-1] if name.endswith('.') else name
+
+def _decode_joliet_name(raw_name):
+    return raw_name.decode('utf-16-be', 'replace').split(';', 1)[0]
+
+def _rock_ridge_skip(root_records):
+    """Return the SUSP skip length if the root directory announces Rock Ridge, else None."""
+    for _, _, _, raw_name, system_use in _iso_directory_records(root_records, len(root_records) or SECTOR_SIZE):
+        if raw_name == b'\x00':
+            if system_use[:2] == b'SP' and system_use[4:6] == b'\xbe\xef':
+                return system_use[6]
+            return None
+    return None
+
+def _rock_ridge_entries(data, system_use, block_size, metadata):
+    """Collect the Rock Ridge entries of one directory record, following continuation areas."""
+    entries = {}
+    areas = [system_use]
+    while areas:
+        area = areas.pop()
+        pos = 0
+        while pos + 4 <= len(area):
+            signature, length = area[pos:pos + 2], area[pos + 2]
+            if length < 4:
+                break
+            entry = area[pos:pos + length]
+            pos += length
+            if signature == b'ST':
+                break
+            elif signature == b'CE':
+                block, offset, ce_length = (struct.unpack_from('<I', entry, 4)[0], struct.unpack_from('<I', entry, 12)[0],
+                                            struct.unpack_from('<I', entry, 20)[0])
+                start = block * block_size + offset
+                metadata.append((start, ce_length))
+                areas.append(data[start:start + ce_length])
+            elif signature == b'NM':
+                if entry[4] & 0x06:
+                    continue  # "." and ".." aliases
+                entries['NM'] = entries.get('NM', '') + entry[5:].decode('utf-8', 'replace')
+            elif signature == b'CL':
+                entries['CL'] = struct.unpack_from('<I', entry, 4)[0]
+            elif signature in (b'RE', b'SL'):
+                entries[signature.decode()] = True
+    return entries
+
+# UDF
+
+def read_udf(data):
+    """Walk the UDF directory tree starting from the anchor volume descriptor pointer."""
+    return _UdfReader(data).read()
+
+class _UdfReader:
+    def __init__(self, data):
+        self.data = data
+        self.block_size = SECTOR_SIZE
+        self.partitions = {}
+        self.metadata = []
+
+    def read(self):
+        sequence = self._volume_descriptor_sequence()
+        partition_starts = {}
+        logical_volume = None
+        for sector in sequence:
+            raw = self._sector(sector)
+            tag = _udf_tag(raw)
+            if tag == UDF_TAG_PARTITION:
+                number = struct.unpack_from('<H', raw, 22)[0]
+                partition_starts[number] = struct.unpack_from('<I', raw, 188)[0]
+            elif tag == UDF_TAG_LOGICAL_VOLUME:
+                logical_volume = raw
+            elif tag == UDF_TAG_TERMINATOR:
+                break
+        if logical_volume is None or not partition_starts:
+            raise FilesystemError("UDF volume descriptor sequence is incomplete")
+
+        self.block_size = struct.unpack_from('<I', logical_volume, 212)[0] or SECTOR_SIZE
+        volume_id = _decode_dstring(logical_volume[84:212])
+        self._partition_maps(logical_volume, partition_starts)
+
+        fsd_length, fsd_block, fsd_ref = _long_ad(logical_volume, 248)
+        fsd_offset = self._block_offset(fsd_ref, fsd_block)
+        fsd = self.data[fsd_offset:fsd_offset + self.block_size]
+        if _udf_tag(fsd) != UDF_TAG_FILE_SET:
+            raise FilesystemError("UDF file set descriptor not found")
+        self.metadata.append((fsd_offset, self.block_size))
+        _, root_block, root_ref = _long_ad(fsd, 400)
+
+        files = []
+        visited = set()
+        stack = [("", root_ref, root_block)]
+        while stack:
+            parent, ref, block = stack.pop()
+            if (ref, block) in visited:
+                continue
+            visited.add((ref, block))
+            file_type, size, extents = self._file_entry(ref, block)
+            if file_type != UDF_FILE_TYPE_DIRECTORY:
+                continue
+            self.metadata.extend(extent for extent in extents if extent[0] is not None)
+            raw = b''.join(self.data[offset:offset + length] for offset, length in extents if offset is not None)
+            for name, is_dir, child_ref, child_block in _udf_file_identifiers(raw):
+                path = f"{parent}/{name}"
+                if is_dir:
+                    stack.append((path, child_ref, child_block))
+                else:
+                    _, child_size, child_extents = self._file_entry(child_ref, child_block)
+                    files.append(FileEntry(path, child_size, child_extents))
+        files.sort(key=lambda entry: entry.path)
+        return Listing("udf", volume_id, files, self.metadata)
+
+    def _sector(self, sector):
+        return self.data[sector * SECTOR_SIZE:(sector + 1) * SECTOR_SIZE]
+
+    def _volume_descriptor_sequence(self):
+        # Try the primary anchor first, then the backups at N-256 and N-1
+        total_sectors = len(self.data) // SECTOR_SIZE
+        for anchor in (UDF_ANCHOR_SECTOR, total_sectors - 256, total_sectors - 1):
+            if anchor < UDF_ANCHOR_SECTOR:
+                continue
+            raw = self._sector(anchor)
+            if _udf_tag(raw) != 2:
+                continue
+            self.metadata.append((0, (UDF_ANCHOR_SECTOR + 1) * SECTOR_SIZE))
+            self.metadata.append((anchor * SECTOR_SIZE, SECTOR_SIZE))
+            sequence = []
+            for ad_offset in (16, 24):  # main and reserve sequence
+                length, location = struct.unpack_from('<II', raw, ad_offset)
+                count = length // SECTOR_SIZE
+                self.metadata.append((location * SECTOR_SIZE, length))
+                sectors = list(range(location, location + count))
+                if any(_udf_tag(self._sector(s)) == UDF_TAG_LOGICAL_VOLUME for s in sectors):
+                    sequence = sectors
+                    break
+            if sequence:
+                return sequence
+        raise FilesystemError("No UDF anchor volume descriptor pointer found")
+
+    def _partition_maps(self, logical_volume, partition_starts):
+        map_count = struct.unpack_from('<I', logical_volume, 268)[0]
+        pos = 440
+        metadata_maps = []
+        physical_refs = {}
+        for ref in range(map_count):
+            map_type, map_length = logical_volume[pos], logical_volume[pos + 1]
+            if map_type == 1:
+                number = struct.unpack_from('<H', logical_volume, pos + 4)[0]
+                self.partitions[ref] = partition_starts.get(number, 0)
+                physical_refs[number] = ref
+            elif map_type == 2:
+                identifier = logical_volume[pos + 5:pos + 28].rstrip(b'\x00')
+                number = struct.unpack_from('<H', logical_volume, pos + 38)[0]
+                if identifier.startswith(b'*UDF Metadata Partition'):
+                    metadata_maps.append((ref, number, struct.unpack_from('<I', logical_volume, pos + 40)[0]))
+                elif identifier.startswith(b'*UDF Sparable Partition'):
+                    # Sparing tables only matter for rewritable media with remapped packets
+                    self.partitions[ref] = partition_starts.get(number, 0)
+                    physical_refs[number] = ref
+                else:
+                    raise FilesystemError(f"Unsupported UDF partition map: {identifier.decode('ascii', 'replace')}")
+            if map_length == 0:
+                break
+            pos += map_length
+        for ref, number, file_location in metadata_maps:
+            physical_ref = physical_refs.get(number)
+            if physical_ref is None:
+                raise FilesystemError("UDF metadata partition refers to an unknown partition")
+            _, _, extents = self._file_entry(physical_ref, file_location)
+            # The metadata partition is a virtual address space backed by the metadata file
+            self.partitions[ref] = [extent for extent in extents if extent[0] is not None]
+            self.metadata.extend(self.partitions[ref])
+
+    def _block_offset(self, ref, block):
+        start = self.partitions.get(ref)
+        if start is None:
+            raise FilesystemError(f"Unknown UDF partition reference {ref}")
+        if isinstance(start, int):
+            return (start + block) * self.block_size
+        offset = block * self.block_size
+        for extent_offset, extent_length in start:
+            if offset < extent_length:
+                return extent_offset + offset
+            offset -= extent_length
+        raise FilesystemError("UDF block lies outside the metadata partition")
+
+    def _extents(self, ref, block, length):
+        """Translate a logical extent into (offset, length) pieces within the image."""
+        start = self.partitions.get(ref)
+        if isinstance(start, int):
+            return [((start + block) * self.block_size, length)]
+        pieces = []
+        while length > 0:
+            offset = self._block_offset(ref, block)
+            extent_end = next(o + l for o, l in start if o <= offset < o + l)
+            piece = min(length, extent_end - offset)
+            pieces.append((offset, piece))
+            length -= piece
+            block += -(-piece // self.block_size)
+        return pieces
+
+    def _file_entry(self, ref, block):
+        """Return (file_type, size, extents) for the file entry at the given logical block."""
+        offset = self._block_offset(ref, block)
+        raw = self.data[offset:offset + self.block_size]
+        tag = _udf_tag(raw)
+        if tag == UDF_TAG_FILE_ENTRY:
+            lengths_offset = 168
+        elif tag == UDF_TAG_EXTENDED_FILE_ENTRY:
+            lengths_offset = 208
+        else:
+            raise FilesystemError(f"Expected UDF file entry at block {block}, found tag {tag}")
+        self.metadata.append((offset, self.block_size))
+        file_type = raw[27]
+        ad_type = struct.unpack_from('<H', raw, 34)[0] & 0x07
+        size = struct.unpack_from('<Q', raw, 56)[0]
+        ea_length, ad_length = struct.unpack_from('<II', raw, lengths_offset)
+        ad_start = lengths_offset + 8 + ea_length
+        if ad_type == 3:
+            # Data embedded in the file entry itself
+            return file_type, size, [(offset + ad_start, size)] if size else []
+
+        extents = []
+        descriptors = raw[ad_start:ad_start + ad_length]
+        remaining = size
+        while descriptors is not None and remaining > 0:
+            next_descriptors = None
+            step = 8 if ad_type == 0 else 16
+            for pos in range(0, len(descriptors) - step + 1, step):
+                if ad_type == 0:
+                    length, position = struct.unpack_from('<II', descriptors, pos)
+                    extent_ref = ref
+                else:
+                    length, position, extent_ref = _long_ad(descriptors, pos)
+                extent_type, length = length >> 30, length & 0x3FFFFFFF
+                if length == 0:
+                    break
+                if extent_type == 3:
+                    # Continuation: the descriptor list goes on in an allocation extent descriptor
+                    aed_offset = self._block_offset(extent_ref, position)
+                    aed = self.data[aed_offset:aed_offset + self.block_size]
+                    if _udf_tag(aed) == UDF_TAG_ALLOCATION_EXTENT:
+                        self.metadata.append((aed_offset, self.block_size))
+                        next_descriptors = aed[24:24 + struct.unpack_from('<I', aed, 20)[0]]
+                    break
+                length = min(length, remaining)
+                if extent_type == 0:
+                    extents.extend(self._extents(extent_ref, position, length))
+                else:
+                    extents.append((None, length))
+                remaining -= length
+                if remaining <= 0:
+                    break
+            descriptors = next_descriptors
+        return file_type, size, extents
+
+def _udf_tag(raw):
+    """Return the tag identifier of a UDF descriptor, or None if the tag checksum is wrong."""
+    if len(raw) < 16:
+        return None
+    if (sum(raw[0:4]) + sum(raw[5:16])) & 0xFF != raw[4]:
+        return None
+    return struct.unpack_from('<H', raw, 0)[0]
+
+def _long_ad(raw, offset):
+    """Return (length, logical_block, partition_reference) of a long allocation descriptor."""
+    length, block, ref = struct.unpack_from('<IIH', raw, offset)
+    return length, block, ref
+
+def _udf_file_identifiers(raw):
+    """Yield (name, is_dir, partition_reference, block) for each entry of a UDF directory."""
+    pos = 0
+    while pos + 38 <= len(raw):
+        if struct.unpack_from('<H', raw, pos)[0] != UDF_TAG_FILE_IDENTIFIER:
+            break
+        characteristics, name_length = raw[pos + 18], raw[pos + 19]
+        _, block, ref = _long_ad(raw, pos + 20)
+        implementation_length = struct.unpack_from('<H', raw, pos + 36)[0]
+        name_start = pos + 38 + implementation_length
+        raw_name = raw[name_start:name_start + name_length]
+        pos += (38 + implementation_length + name_length + 3) & ~3
+        if characteristics & 0x0C:
+            continue  # deleted or parent entry
+        yield _decode_udf_name(raw_name), bool(characteristics & 0x02), ref, block
+
+def _decode_udf_name(raw_name):
+    if not raw_name:
+        return ""
+    if raw_name[0] in (16, 255):
+        return raw_name[1:].decode('utf-16-be', 'replace')
+    return raw_name[1:].decode('latin-1')
+
+def _decode_dstring(raw):
+    length = raw[-1]
+    return _decode_udf_name(raw[:length]).strip(' \x00') if length else ""
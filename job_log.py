@@ -0,0 +1,244 @@
+import argparse
+import bisect
+import collections
+import glob
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from config import JOB_LOG_DIR_NAME, JOB_LOG_SEGMENT_BYTES, JOB_LOG_MAX_SEGMENTS
+
+# A job log is a series of segments BASE.NNNNNN.log, each with a line index BASE.NNNNNN.idx.
+#   .log  UTF-8 text, one "HH:MM:SS [LEVEL] message" line per entry
+#   .idx  one INDEX record per line: byte offset of the line in the segment, level code
+# A segment is closed once it would grow past JOB_LOG_SEGMENT_BYTES; beyond
+# JOB_LOG_MAX_SEGMENTS the oldest one is deleted. Index records are written after the
+# text, so a reader never sees a line that is not complete.
+INDEX = struct.Struct("<IB")
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+LEVEL_CODES = {level: code for code, level in enumerate(LEVELS)}
+SEGMENT_PATTERN = re.compile(r'\.(\d{6})\.log$')
+
+def job_log_dir(image_path):
+    """Job logs are kept in a directory next to the images."""
+    return os.path.join(os.path.dirname(os.path.abspath(image_path)), JOB_LOG_DIR_NAME)
+
+def segment_paths(base, number):
+    return f"{base}.{number:06d}.log", f"{base}.{number:06d}.idx"
+
+def list_segments(base):
+    """Numbers of the segments of a log that exist, oldest first."""
+    numbers = []
+    for path in glob.glob(glob.escape(base) + ".*.log"):
+        match = SEGMENT_PATTERN.search(path)
+        if match and path[:match.start()] == base:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+class JobLog:
+    """Writes the log of one job to rotating segments. Safe to use from several threads."""
+
+    def __init__(self, base, segment_bytes=JOB_LOG_SEGMENT_BYTES, max_segments=JOB_LOG_MAX_SEGMENTS):
+        self.base = base
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        existing = list_segments(base)
+        self._number = existing[-1] if existing else 1
+        self._open()
+
+    def _open(self):
+        text_path, index_path = segment_paths(self.base, self._number)
+        self._text = open(text_path, 'ab', buffering=0)
+        self._index = open(index_path, 'ab', buffering=0)
+        self._size = self._text.tell()
+
+    def write(self, level, message):
+        line = f"{time.strftime('%H:%M:%S')} [{level}] {message}".replace("\n", " ") + "\n"
+        data = line.encode('utf-8', 'replace')
+        with self._lock:
+            if self._text is None:
+                return
+            if self._size and self._size + len(data) > self.segment_bytes:
+                self._rotate()
+            self._text.write(data)
+            self._index.write(INDEX.pack(self._size, LEVEL_CODES.get(level, LEVEL_CODES["INFO"])))
+            self._size += len(data)
+
+    def _rotate(self):
+        self._text.close()
+        self._index.close()
+        self._number += 1
+        self._open()
+        for number in list_segments(self.base)[:-self.max_segments]:
+            for path in segment_paths(self.base, number):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            if self._text is None:
+                return
+            self._text.close()
+            self._index.close()
+            self._text = self._index = None
+
+def open_job_log(image_path):
+    """Start the log of a new job writing image_path; named like its journal."""
+    directory = job_log_dir(image_path)
+    os.makedirs(directory, exist_ok=True)
+    return JobLog(os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.path.basename(image_path)}"))
+
+class _Offsets:
+    """The line offsets of a segment's index records as a sequence, for bisect."""
+
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records) // INDEX.size
+
+    def __getitem__(self, i):
+        return INDEX.unpack_from(self.records, i * INDEX.size)[0]
+
+class LogReader:
+    """Random access to the lines of a job log by number, without holding them in memory.
+
+    Lines are numbered from the oldest segment still on disk. refresh() picks up
+    lines written since; only the per-segment line counts are kept."""
+
+    def __init__(self, base):
+        self.base = base
+        self.segments = []      # [(number, first line, line count)]
+        self.refresh()
+
+    def refresh(self):
+        """Re-read the segment list and line counts. Returns the number of lines."""
+        segments = []
+        first = 0
+        for number in list_segments(self.base):
+            try:
+                count = os.path.getsize(segment_paths(self.base, number)[1]) // INDEX.size
+            except OSError:
+                continue
+            segments.append((number, first, count))
+            first += count
+        self.segments = segments
+        return len(self)
+
+    def __len__(self):
+        if not self.segments:
+            return 0
+        _, first, count = self.segments[-1]
+        return first + count
+
+    def _segment_of(self, line):
+        index = bisect.bisect_right([first for _, first, _ in self.segments], line) - 1
+        return self.segments[max(0, index)]
+
+    def lines(self, start, count):
+        """Return [(level, text)] for up to count lines from line number start."""
+        result = []
+        while count > 0 and 0 <= start < len(self):
+            number, first, lines = self._segment_of(start)
+            take = min(count, first + lines - start)
+            text_path, index_path = segment_paths(self.base, number)
+            with open(index_path, 'rb') as f:
+                f.seek((start - first) * INDEX.size)
+                # One record past the last line gives its end; the last line of a segment ends with the file
+                records = f.read((take + 1) * INDEX.size)
+            entries = list(INDEX.iter_unpack(records[:len(records) - len(records) % INDEX.size]))
+            with open(text_path, 'rb') as f:
+                f.seek(entries[0][0])
+                end = entries[take][0] if len(entries) > take else None
+                data = f.read(end - entries[0][0]) if end is not None else f.read()
+            base_offset = entries[0][0]
+            for i in range(take):
+                offset, level = entries[i]
+                end = entries[i + 1][0] if i + 1 < len(entries) else len(data) + base_offset
+                # Cut at the newline: text after the last indexed line may belong to lines still being indexed
+                text = data[offset - base_offset:end - base_offset].split(b"\n", 1)[0].decode('utf-8', 'replace')
+                result.append((LEVELS[level] if level < len(LEVELS) else "INFO", text))
+            start += take
+            count -= take
+        return result
+
+    def filter(self, min_level, start=0):
+        """Numbers of the lines from start on at min_level or above, as an array."""
+        threshold = LEVEL_CODES[min_level]
+        matches = array('I')
+        for number, first, count in self.segments:
+            if first + count <= start:
+                continue
+            skip = max(0, start - first)
+            with open(segment_paths(self.base, number)[1], 'rb') as f:
+                f.seek(skip * INDEX.size)
+                levels = f.read((count - skip) * INDEX.size)[4::INDEX.size]
+            matches.extend(first + skip + i for i, level in enumerate(levels) if level >= threshold)
+        return matches
+
+    def search(self, text, start=0, min_level=None):
+        """Number of the first line from start on containing text (case-insensitive), or None."""
+        pattern = re.compile(re.escape(text.encode('utf-8')), re.IGNORECASE)
+        threshold = LEVEL_CODES[min_level] if min_level else 0
+        for number, first, count in self.segments:
+            if first + count <= start or not count:
+                continue
+            text_path, index_path = segment_paths(self.base, number)
+            with open(index_path, 'rb') as f:
+                records = f.read(count * INDEX.size)
+            offsets = _Offsets(records)
+            levels = records[4::INDEX.size]
+            with open(text_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    position = offsets[start - first] if start > first else 0
+                    # Stop at the end of the last indexed line; later text is not indexed yet
+                    end = data.find(b"\n", offsets[count - 1]) + 1 or len(data)
+                    while True:
+                        match = pattern.search(data, position, end)
+                        if match is None:
+                            break
+                        line = bisect.bisect_right(offsets, match.start()) - 1
+                        if levels[line] >= threshold:
+                            return first + line
+                        position = offsets[line + 1] if line + 1 < count else end
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show a job log kept in rotating segments.")
+    parser.add_argument("base", help="Log path without the segment suffix, e.g. logs/20240101-120000-disc.iso")
+    parser.add_argument("--level", choices=LEVELS, help="Only show lines at this level or above")
+    parser.add_argument("--grep", help="Only show lines containing this text (case-insensitive)")
+    parser.add_argument("--tail", type=int, help="Only show the last N matching lines")
+    args = parser.parse_args(argv)
+
+    match = SEGMENT_PATTERN.search(args.base)
+    base = args.base[:match.start()] if match else args.base
+    reader = LogReader(base)
+    if not len(reader):
+        print(f"Error: no log segments for {base}", file=sys.stderr)
+        return 1
+    if args.level:
+        numbers = reader.filter(args.level)
+        lines = (reader.lines(n, 1)[0][1] for n in numbers)
+    else:
+        lines = (text for start in range(0, len(reader), 1000) for _, text in reader.lines(start, 1000))
+    if args.grep:
+        needle = args.grep.lower()
+        lines = (text for text in lines if needle in text.lower())
+    if args.tail:
+        lines = collections.deque(lines, maxlen=args.tail)
+    for text in lines:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
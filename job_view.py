@@ -0,0 +1,127 @@
+import os
+import tkinter as tk
+from tkinter import messagebox, ttk
+from config import JOB_EVENT_POLL_MS, JOB_EVENT_BATCH
+from gui_utils import append_log, ask_choice
+from log_viewer import LogViewer
+from jobs import StateChanged, LogLine, Progress, Dialog, FINAL_STATES
+
+class JobView(tk.Frame):
+    """Table of jobs fed from an EventBus, plus the log, progress bar and Stop
+    button of the main window.
+
+    Workers only publish events. Every JOB_EVENT_POLL_MS the Tk main loop takes
+    up to JOB_EVENT_BATCH of them, appends all new log lines in one insert and
+    updates each job's row once, so many busy jobs cost a few widget calls per
+    tick. Dialogs are shown from after_idle, so the view keeps rendering while a
+    modal dialog waits for the user. The log widget only keeps recent lines of
+    all jobs; open_log() shows the complete log of one job from disk."""
+
+    COLUMNS = (("job", "Job", 40), ("device", "Device", 90), ("output", "Output", 200),
+               ("state", "State", 80), ("progress", "Progress", 70))
+
+    def __init__(self, parent, bus, log_text, progress_bar, stop_button, on_select=None):
+        super().__init__(parent)
+        self.bus = bus
+        self.log_text = log_text
+        self.progress_bar = progress_bar
+        self.stop_button = stop_button
+        self.on_select = on_select
+        self.table = ttk.Treeview(self, columns=[name for name, _, _ in self.COLUMNS], show='headings', height=4)
+        for name, heading, width in self.COLUMNS:
+            self.table.heading(name, text=heading)
+            self.table.column(name, width=width, stretch=name == "output")
+        self.table.pack(fill=tk.X)
+        self.table.bind("<<TreeviewSelect>>", lambda _: self._selection_changed())
+        self.table.bind("<Double-1>", lambda _: self.open_log())
+        stop_button.config(command=self.stop_selected)
+
+        self.jobs = {}          # row id -> job
+        self._lines = []
+        self._dirty = set()
+        bus.subscribe(self._on_event)
+        self.after(JOB_EVENT_POLL_MS, self._poll)
+
+    @property
+    def selected(self):
+        """The job selected in the table, or the most recent one."""
+        selection = self.table.selection()
+        if selection:
+            return self.jobs.get(selection[0])
+        rows = self.table.get_children()
+        return self.jobs.get(rows[-1]) if rows else None
+
+    def active_jobs(self):
+        return [job for job in self.jobs.values() if job.state not in FINAL_STATES]
+
+    def stop_selected(self):
+        job = self.selected
+        if job is not None and not job.finished:
+            job.cancel()
+
+    def open_log(self):
+        """Open the full on-disk log of the selected job in a viewer window."""
+        job = self.selected
+        if job is None or job.log_file is None:
+            messagebox.showinfo("Job Log", "The selected job has no log file.")
+            return
+        LogViewer(self.winfo_toplevel(), job.log_file.base, title=f"Job {job.id}: {job.output}")
+
+    def _on_event(self, event):
+        if isinstance(event, LogLine):
+            self._lines.append(f"[{event.level}] #{event.job.id} {event.message}")
+        elif isinstance(event, (StateChanged, Progress)):
+            self._dirty.add(event.job)
+            if isinstance(event, StateChanged) and event.state in FINAL_STATES:
+                outcome = event.outcome if event.outcome != event.state else ""
+                self._lines.append(f"[INFO] #{event.job.id} Job {event.state} {outcome}".rstrip())
+        elif isinstance(event, Dialog):
+            self.after_idle(self._show_dialog, event)
+
+    def _poll(self):
+        taken = self.bus.dispatch(JOB_EVENT_BATCH)
+        if self._lines:
+            append_log(self.log_text, self._lines)
+            self._lines = []
+        for job in self._dirty:
+            self._render(job)
+        if self._dirty:
+            self._update_controls()
+        self._dirty = set()
+        # A full batch means more events are waiting: come back as soon as Tk is idle
+        self.after(1 if taken >= JOB_EVENT_BATCH else JOB_EVENT_POLL_MS, self._poll)
+
+    def _render(self, job):
+        row = str(job.id)
+        values = (job.id, job.device, os.path.basename(job.output), job.state, f"{job.percent:.1f}%")
+        if row in self.jobs:
+            self.table.item(row, values=values)
+        else:
+            self.jobs[row] = job
+            self.table.insert('', tk.END, iid=row, values=values)
+            if not self.table.selection():
+                self._selection_changed()
+
+    def _update_controls(self):
+        job = self.selected
+        self.progress_bar['value'] = job.percent if job is not None else 0
+        active = job is not None and not job.finished
+        self.stop_button.config(state=tk.NORMAL if active else tk.DISABLED, bg='red' if active else 'light gray')
+
+    def _selection_changed(self):
+        self._update_controls()
+        if self.on_select is not None and self.selected is not None:
+            self.on_select(self.selected)
+
+    def _show_dialog(self, event):
+        title = f"{event.title} (job {event.job.id})"
+        if event.kind == "yesno":
+            answer = messagebox.askyesno(title, event.message)
+        elif event.kind == "choice":
+            answer = ask_choice(self.winfo_toplevel(), title, event.message, event.choices)
+        else:
+            {"info": messagebox.showinfo, "warning": messagebox.showwarning,
+             "error": messagebox.showerror}.get(event.kind, messagebox.showinfo)(title, event.message)
+            answer = None
+        if event.reply is not None:
+            event.reply.set(answer)
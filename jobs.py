@@ -0,0 +1,177 @@
+import itertools
+import queue
+import threading
+from collections import namedtuple
+
+# Job states. A job moves forward through them and ends in one of FINAL_STATES.
+QUEUED = "queued"
+PROBING = "probing"
+COPYING = "copying"
+VERIFYING = "verifying"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+TRANSITIONS = {
+    QUEUED: (PROBING, FAILED, CANCELLED),
+    PROBING: (COPYING, DONE, FAILED, CANCELLED),   # DONE: nothing to copy (duplicate disc skipped or linked)
+    COPYING: (VERIFYING, FAILED, CANCELLED),
+    VERIFYING: (DONE, FAILED, CANCELLED),
+}
+
+# Events published by jobs. Every event carries the job it belongs to.
+#   StateChanged  the job entered state; outcome is set for final states
+#   LogLine       one line for the job log
+#   Progress      percent done of the current phase
+#   Dialog        a message box: kind is "info", "warning" or "error" (no answer),
+#                 "yesno" or "choice" (the worker waits for reply.set())
+StateChanged = namedtuple('StateChanged', ['job', 'state', 'outcome'])
+LogLine = namedtuple('LogLine', ['job', 'message', 'level'])
+Progress = namedtuple('Progress', ['job', 'percent'])
+Dialog = namedtuple('Dialog', ['job', 'kind', 'title', 'message', 'choices', 'reply'])
+
+class Reply:
+    """The answer to a Dialog, handed from the thread showing it to the waiting worker."""
+
+    def __init__(self):
+        self.value = None
+        self._event = threading.Event()
+
+    def set(self, value):
+        self.value = value
+        self._event.set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+class EventBus:
+    """Carries job events from worker threads to the thread that renders them.
+
+    publish() may be called from any thread and never blocks. dispatch() delivers
+    the waiting events to the subscribers on the calling thread; the GUI calls it
+    from the Tk main loop, so subscribers may touch widgets."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, *event_types):
+        """Call callback(event) for events of the given types (all events if none are given)."""
+        with self._lock:
+            self._subscribers.append((callback, event_types))
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(c, types) for c, types in self._subscribers if c != callback]
+
+    def publish(self, event):
+        self._queue.put(event)
+
+    def dispatch(self, limit=None):
+        """Deliver up to limit waiting events in order and return how many were taken.
+
+        Of several Progress events of one job in a batch only the last is delivered,
+        so a busy job costs one progress update per dispatch."""
+        events = []
+        while limit is None or len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        latest_progress = {}
+        for index, event in enumerate(events):
+            if isinstance(event, Progress):
+                latest_progress[event.job] = index
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for index, event in enumerate(events):
+            if isinstance(event, Progress) and latest_progress[event.job] != index:
+                continue
+            for callback, event_types in subscribers:
+                if not event_types or isinstance(event, event_types):
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        print(f"Event subscriber failed: {e}")
+        return len(events)
+
+_job_ids = itertools.count(1)
+
+class Job:
+    """One imaging job as seen by the rest of the program: its state, and the
+    events its worker thread publishes instead of touching the GUI.
+
+    Only the worker calls the methods that publish; cancel() may be called from
+    any thread."""
+
+    def __init__(self, bus, device, output, destination=None):
+        self.id = next(_job_ids)
+        self.bus = bus
+        self.device = device
+        self.output = output                        # where the job writes its image
+        self.destination = destination or output    # where the image ends up (differs in spool mode)
+        self.state = QUEUED
+        self.outcome = None
+        self.percent = 0.0
+        self.stop_event = threading.Event()
+        self.process = None
+        self.log_file = None    # job_log.JobLog receiving every line, set by the worker
+        self._lock = threading.Lock()
+        bus.publish(StateChanged(self, QUEUED, None))
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.device!r}, {self.output!r}, {self.state})"
+
+    @property
+    def finished(self):
+        return self.state in FINAL_STATES
+
+    def transition(self, state, outcome=None):
+        """Move to state. Moving to the current state is a no-op; anything not in
+        TRANSITIONS raises ValueError."""
+        with self._lock:
+            if state == self.state:
+                return
+            if state not in TRANSITIONS.get(self.state, ()):
+                raise ValueError(f"Job {self.id} cannot go from {self.state} to {state}")
+            self.state = state
+            if state in FINAL_STATES:
+                self.outcome = outcome or state
+        if self.log_file is not None:
+            self.log_file.write("INFO", f"Job {state}" + (f" ({self.outcome})" if self.outcome not in (None, state) else ""))
+        self.bus.publish(StateChanged(self, state, self.outcome))
+
+    def finish(self, outcome):
+        """Enter the final state for an outcome: DONE for success or skipped, CANCELLED for
+        stopped or cancelled, FAILED for anything else."""
+        state = DONE if outcome in ("success", "skipped") else CANCELLED if outcome in ("stopped", "cancelled") else FAILED
+        self.transition(state, outcome)
+
+    def log(self, message, level="INFO"):
+        if self.log_file is not None:
+            self.log_file.write(level, message)
+        self.bus.publish(LogLine(self, message, level))
+
+    def progress(self, percent):
+        self.percent = percent
+        self.bus.publish(Progress(self, percent))
+
+    def show(self, kind, title, message):
+        """Publish an info, warning or error message box and carry on."""
+        self.bus.publish(Dialog(self, kind, title, message, None, None))
+
+    def ask(self, kind, title, message, choices=None):
+        """Publish a "yesno" or "choice" dialog and wait for the answer.
+
+        Returns None (no, or no choice) if the job is cancelled while waiting."""
+        reply = Reply()
+        self.bus.publish(Dialog(self, kind, title, message, choices, reply))
+        while not reply.wait(0.2):
+            if self.stop_event.is_set():
+                return None
+        return reply.value
+
+    def cancel(self):
+        """Ask the worker to stop. The job reaches CANCELLED once the worker has cleaned up."""
+        self.stop_event.set()
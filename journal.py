@@ -0,0 +1,210 @@
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from config import JOURNAL_DIR_NAME, JOURNAL_SAMPLE_INTERVAL
+
+# One JSON object per line. Every record has "t" (unix time) and "event":
+#   job_start   job parameters (device, drive, output, ...)
+#   span        a timed phase: phase, start, duration, outcome and phase specific fields
+#   sample      throughput sample: elapsed, percent, rescued_bytes, rate, average_rate (bytes/s),
+#               bad_bytes and read_errors when known
+#   durability  syncs of the image during a copy: level, syncs, sync_seconds
+#   job_end     outcome and total duration
+UNITS = {"B": 1, "kB": 1000, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+         "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4}
+RESCUED_PATTERN = re.compile(r'rescued:\s+([\d.]+)\s*([kKMGT]i?B|B)')
+RATE_PATTERN = re.compile(r'current rate:\s+([\d.]+)\s*([kKMGT]i?B|B)/s')
+AVERAGE_RATE_PATTERN = re.compile(r'average rate:\s+([\d.]+)\s*([kKMGT]i?B|B)/s')
+BAD_SECTOR_PATTERN = re.compile(r'bad-sector:\s+([\d.]+)\s*([kKMGT]i?B|B)')
+READ_ERRORS_PATTERN = re.compile(r'read errors:\s+(\d+)')
+
+# Callables listener(job_id, record) that see every record as it happens, including
+# throughput samples the journal file leaves out. They run on the job's thread and
+# must not block.
+listeners = []
+DD_PATTERN = re.compile(r'^(\d+) bytes .*?([\d.]+) ([kKMGT]i?B|B)/s')
+
+class Journal:
+    """Append-only JSON-lines record of one job, safe to use from several threads."""
+
+    def __init__(self, path, **job):
+        self.path = path
+        self.job_id = os.path.basename(path)[:-len(".jsonl")]
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._last_sample = 0
+        self._finished = False
+        self._file = open(path, 'a', buffering=1)
+        self.event("job_start", **job)
+
+    def event(self, name, write=True, **fields):
+        record = {"t": round(time.time(), 3), "event": name}
+        record.update(fields)
+        for listener in list(listeners):
+            try:
+                listener(self.job_id, record)
+            except Exception as e:
+                print(f"Journal listener failed: {e}")
+        if not write:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+    @contextmanager
+    def span(self, phase, **fields):
+        """Time a phase. The yielded dict can be filled with extra fields, including "outcome"."""
+        start = time.time()
+        outcome = "ok"
+        try:
+            yield fields
+        except BaseException as e:
+            outcome = "error"
+            fields.setdefault("error", str(e))
+            raise
+        finally:
+            outcome = fields.pop("outcome", outcome)
+            self.event("span", phase=phase, start=round(start, 3), duration=round(time.time() - start, 4),
+                       outcome=outcome, **fields)
+
+    def sample(self, force=False, **values):
+        """Record a throughput sample. Listeners see every sample, the file at most one
+        per JOURNAL_SAMPLE_INTERVAL unless forced."""
+        now = time.time()
+        write = force or now - self._last_sample >= JOURNAL_SAMPLE_INTERVAL
+        if write:
+            self._last_sample = now
+        self.event("sample", write=write, elapsed=round(now - self.started, 3), **values)
+
+    def finish(self, outcome, **fields):
+        """Write the final outcome and close the journal. Later calls are ignored."""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        self.event("job_end", outcome=outcome, duration=round(time.time() - self.started, 3), **fields)
+        with self._lock:
+            self._file.close()
+            self._file = None
+
+def journal_dir(image_path):
+    """Journals are kept in a directory next to the images."""
+    return os.path.join(os.path.dirname(os.path.abspath(image_path)), JOURNAL_DIR_NAME)
+
+def open_journal(image_path, **job):
+    """Start the journal of a new job writing image_path."""
+    directory = journal_dir(image_path)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.path.basename(image_path)}.jsonl"
+    return Journal(os.path.join(directory, name), output=image_path, **job)
+
+def span(journal, phase, **fields):
+    """journal.span() that also accepts journal None."""
+    if journal is None:
+        return nullcontext(fields)
+    return journal.span(phase, **fields)
+
+def _to_bytes(value, unit):
+    return int(float(value) * UNITS.get(unit, 1))
+
+def parse_progress_line(line):
+    """Extract rescued bytes, rates (bytes/s), bad-sector bytes and read errors from a
+    ddrescue or dd status line."""
+    values = {}
+    for key, pattern in (("rescued_bytes", RESCUED_PATTERN), ("rate", RATE_PATTERN),
+                         ("average_rate", AVERAGE_RATE_PATTERN), ("bad_bytes", BAD_SECTOR_PATTERN)):
+        match = pattern.search(line)
+        if match:
+            values[key] = _to_bytes(*match.groups())
+    match = READ_ERRORS_PATTERN.search(line)
+    if match:
+        values["read_errors"] = int(match.group(1))
+    match = DD_PATTERN.match(line.strip())
+    if match:
+        values["rescued_bytes"] = int(match.group(1))
+        values["rate"] = _to_bytes(match.group(2), match.group(3))
+    return values
+
+def read_journal(path):
+    """Return the records of one journal, skipping a torn last line."""
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize_journals(paths):
+    """Collect span durations per phase and per (drive, phase), plus outcomes and rates per drive."""
+    durations = defaultdict(list)
+    outcomes = defaultdict(lambda: defaultdict(int))
+    rates = defaultdict(list)
+    for path in paths:
+        drive = "unknown"
+        for record in read_journal(path):
+            event = record.get("event")
+            if event == "job_start":
+                drive = record.get("drive") or record.get("device") or "unknown"
+            elif event == "span":
+                # Probes are reported per tool, e.g. "probe:blkid"
+                phase = record["phase"] + (f":{record['tool']}" if "tool" in record else "")
+                durations[("all", phase)].append(record["duration"])
+                durations[(drive, phase)].append(record["duration"])
+            elif event == "sample" and record.get("rate"):
+                rates[drive].append(record["rate"])
+            elif event == "job_end":
+                outcomes[drive][record.get("outcome", "unknown")] += 1
+    return durations, outcomes, rates
+
+def format_report(durations, outcomes, rates, by_drive=False):
+    lines = [f"{'drive':<24} {'phase':<20} {'count':>6} {'p50 s':>9} {'p95 s':>9} {'total s':>10}"]
+    for drive, phase in sorted(durations):
+        if (drive == "all") == by_drive:
+            continue
+        values = durations[(drive, phase)]
+        lines.append(f"{drive[:24]:<24} {phase[:20]:<20} {len(values):>6} {percentile(values, 0.5):>9.2f} "
+                     f"{percentile(values, 0.95):>9.2f} {sum(values):>10.1f}")
+    for drive in sorted(outcomes):
+        counts = ", ".join(f"{outcome} {count}" for outcome, count in sorted(outcomes[drive].items()))
+        rate = f", median rate {percentile(rates[drive], 0.5) / 1e6:.2f} MB/s" if rates.get(drive) else ""
+        lines.append(f"{drive}: {counts}{rate}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise job journals: where does the time go?")
+    parser.add_argument("paths", nargs="+", help="Journal files or directories containing them")
+    parser.add_argument("--by-drive", action="store_true", help="Break the phase timings down per drive")
+    args = parser.parse_args(argv)
+
+    files = []
+    for path in args.paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path])
+    try:
+        durations, outcomes, rates = summarize_journals(files)
+    except (OSError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if not durations:
+        print("No spans found")
+        return 1
+    print(format_report(durations, outcomes, rates, args.by_drive))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
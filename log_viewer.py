@@ -0,0 +1,181 @@
+import bisect
+import os
+import tkinter as tk
+from tkinter import ttk
+from config import FONT_FAMILY, FONT_SIZE, LOG_VIEW_POLL_MS
+from job_log import LogReader
+
+LEVEL_FILTERS = {"All levels": None, "Warnings and errors": "WARNING", "Errors only": "ERROR"}
+LEVEL_COLORS = {"WARNING": '#b06000', "ERROR": '#c00000'}
+
+class LogViewer(tk.Toplevel):
+    """Window showing a job log from disk, one screenful at a time.
+
+    Only the visible lines are read and kept in the Text widget; scrolling reads
+    the next screenful through the log's line index. With a level filter the
+    viewer keeps the numbers of the matching lines, which are the rare ones.
+    New lines are picked up every LOG_VIEW_POLL_MS, and the view follows the
+    end of the log unless the user scrolled away from it."""
+
+    def __init__(self, parent, base, title=None, height=30):
+        super().__init__(parent)
+        self.title(title or f"Log {os.path.basename(base)}")
+        self.reader = LogReader(base)
+        self.height = height
+        self.top = 0
+        self.found = None           # line number of the last search hit
+        self.min_level = None
+        self.matches = None         # line numbers shown when filtering by level
+        self._scanned = 0           # lines already checked for the level filter
+        self._first_segment = self._oldest_segment()
+
+        toolbar = tk.Frame(self)
+        toolbar.pack(fill=tk.X, padx=5, pady=5)
+        self.level_var = tk.StringVar(value="All levels")
+        level_combobox = ttk.Combobox(toolbar, textvariable=self.level_var, values=list(LEVEL_FILTERS),
+                                      state='readonly', width=20)
+        level_combobox.pack(side=tk.LEFT)
+        level_combobox.bind("<<ComboboxSelected>>", lambda _: self.set_level(LEVEL_FILTERS[self.level_var.get()]))
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(toolbar, textvariable=self.search_var, width=30)
+        search_entry.pack(side=tk.LEFT, padx=(10, 0))
+        search_entry.bind("<Return>", lambda _: self.find_next())
+        tk.Button(toolbar, text="Find Next", command=self.find_next).pack(side=tk.LEFT, padx=5)
+        self.follow_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(toolbar, text="Follow", variable=self.follow_var, command=self._follow_changed).pack(side=tk.LEFT)
+        self.status_label = tk.Label(toolbar, text="", anchor=tk.E)
+        self.status_label.pack(side=tk.RIGHT)
+
+        body = tk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+        self.scrollbar = tk.Scrollbar(body, command=self._scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text = tk.Text(body, wrap=tk.NONE, height=height, width=120, font=(FONT_FAMILY, FONT_SIZE))
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        xscrollbar = tk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.text.xview)
+        xscrollbar.pack(fill=tk.X, padx=5)
+        self.text.config(xscrollcommand=xscrollbar.set)
+        for level, color in LEVEL_COLORS.items():
+            self.text.tag_config(level, foreground=color)
+        self.text.tag_config("found", background='#fff080')
+
+        for sequence, lines in (("<Button-4>", -3), ("<Button-5>", 3), ("<Prior>", -height), ("<Next>", height),
+                                ("<Up>", -1), ("<Down>", 1)):
+            self.text.bind(sequence, lambda _, lines=lines: self.scroll_by(lines) or "break")
+        self.text.bind("<MouseWheel>", lambda event: self.scroll_by(-3 if event.delta > 0 else 3) or "break")
+        self.text.bind("<Home>", lambda _: self.scroll_to(0) or "break")
+        self.text.bind("<End>", lambda _: self.scroll_to(self.total()) or "break")
+
+        self._follow_changed()
+        self.after(LOG_VIEW_POLL_MS, self._poll)
+
+    def total(self):
+        return len(self.matches) if self.matches is not None else len(self.reader)
+
+    def scroll_to(self, top, follow=False):
+        self.top = max(0, min(top, self.total() - self.height))
+        self.follow_var.set(follow or self.top >= self.total() - self.height)
+        self.render()
+
+    def scroll_by(self, lines):
+        self.scroll_to(self.top + lines)
+
+    def set_level(self, min_level):
+        """Show only lines at min_level or above (all lines for None), keeping the view near its current line."""
+        current = self._line_at(self.top)
+        self.min_level = min_level
+        self.matches = None
+        self._scanned = 0
+        self._update_matches()
+        position = current if self.matches is None else bisect.bisect_left(self.matches, current or 0)
+        self.scroll_to(position or 0, self.follow_var.get())
+
+    def find_next(self):
+        """Jump to the next line containing the search text, wrapping around at the end."""
+        text = self.search_var.get()
+        if not text:
+            return
+        start = self.found + 1 if self.found is not None else (self._line_at(self.top) or 0)
+        line = self.reader.search(text, start, self.min_level)
+        if line is None and start:
+            line = self.reader.search(text, 0, self.min_level)
+        self.found = line
+        if line is None:
+            self.status_label.config(text=f"'{text}' not found")
+            self.render()
+            return
+        position = line if self.matches is None else bisect.bisect_left(self.matches, line)
+        self.scroll_to(position - self.height // 2)
+
+    def render(self):
+        if self.matches is None:
+            numbers = range(self.top, min(self.top + self.height, len(self.reader)))
+            entries = self.reader.lines(self.top, len(numbers))
+        else:
+            numbers = self.matches[self.top:self.top + self.height]
+            entries = [entry for n in numbers for entry in self.reader.lines(n, 1)]
+        self.text.config(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        for row, (number, (level, line)) in enumerate(zip(numbers, entries), 1):
+            self.text.insert(tk.END, line + "\n", (level,))
+            if number == self.found:
+                self.text.tag_add("found", f"{row}.0", f"{row}.end")
+        self.text.config(state=tk.DISABLED)
+        total = self.total()
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.height) / total))
+            self.status_label.config(text=f"Lines {self.top + 1}-{min(total, self.top + self.height)} of {total}")
+        else:
+            self.scrollbar.set(0, 1)
+            self.status_label.config(text="No lines")
+
+    def _line_at(self, position):
+        if self.matches is None:
+            return position
+        return self.matches[position] if position < len(self.matches) else None
+
+    def _scroll(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * self.total()))
+        elif unit == "pages":
+            self.scroll_by(int(value) * self.height)
+        else:
+            self.scroll_by(int(value))
+
+    def _follow_changed(self):
+        if self.follow_var.get():
+            self.scroll_to(self.total(), follow=True)
+        else:
+            self.render()
+
+    def _oldest_segment(self):
+        return self.reader.segments[0][0] if self.reader.segments else None
+
+    def _update_matches(self):
+        if self.min_level is None:
+            return
+        if self.matches is None:
+            self.matches = self.reader.filter(self.min_level)
+        else:
+            self.matches.extend(self.reader.filter(self.min_level, self._scanned))
+        self._scanned = len(self.reader)
+
+    def _poll(self):
+        if not self.winfo_exists():
+            return
+        before = len(self.reader)
+        self.reader.refresh()
+        if self._oldest_segment() != self._first_segment:
+            # A segment was rotated away and the line numbers moved: start over
+            self._first_segment = self._oldest_segment()
+            self.found = None
+            self.matches = None
+            self._scanned = 0
+            before = -1
+        if len(self.reader) != before:
+            self._update_matches()
+            if self.follow_var.get():
+                self.scroll_to(self.total(), follow=True)
+            else:
+                self.render()
+        self.after(LOG_VIEW_POLL_MS, self._poll)
@@ -6,10 +6,19 @@ import threading
 from config import *
 from core_functions import check_sudo, check_tool_installed
 from device_detection import detect_dvd_devices
-from gui_utils import disable_gui_elements, reset_gui_state, apply_preset, update_gui_for_media_type, update_progress, update_log
-from iso_creation import create_iso, stop_process
+from gui_utils import disable_gui_elements, reset_gui_state, apply_preset, update_gui_for_media_type, update_progress, update_log, ask_file_selection
+from iso_creation import create_iso
+from backends import ImagingOptions
+from jobs import EventBus, Job
+from job_view import JobView
+from spool import SpoolMover, staging_path, transfer_pending
 from media_detection import detect_media_type
 from iso_utils import try_mount_iso, attempt_iso_recovery
+from sector_map import SectorMap
+from throughput_curve import ThroughputCurve
+from file_rescue import read_disc_listing
+from iso_filesystem import FilesystemError
+from metrics import enable_metrics
 
 # Get the original user who ran sudo
 original_user = check_sudo()
@@ -44,7 +53,7 @@ method_var = tk.StringVar(value="ddrescue")
 method_label = tk.Label(frame, text="Select Method for ISO Creation:")
 method_label.pack(anchor=tk.W)
 
-method_combobox = ttk.Combobox(frame, textvariable=method_var, values=["dd", "ddrescue"], state='readonly')
+method_combobox = ttk.Combobox(frame, textvariable=method_var, values=[BACKEND_AUTO, "dd", "ddrescue"], state='readonly')
 method_combobox.pack(anchor=tk.W)
 
 # Options for ddrescue
@@ -91,21 +100,110 @@ output_path_entry.pack(anchor=tk.W)
 select_output_button = tk.Button(frame, text="Browse...", command=lambda: output_path_var.set(filedialog.asksaveasfilename(defaultextension=".iso", filetypes=[("ISO files", "*.iso")])))
 select_output_button.pack(anchor=tk.W, pady=5)
 
+storage_var = tk.StringVar(value=STORAGE_RAW)
+storage_label = tk.Label(frame, text="Store Finished Image As:")
+storage_label.pack(anchor=tk.W)
+
+storage_combobox = ttk.Combobox(frame, textvariable=storage_var, values=STORAGE_FORMATS, state='readonly', width=35)
+storage_combobox.pack(anchor=tk.W)
+
+video_mode_var = tk.StringVar(value=VIDEO_DVD_IMAGE)
+video_mode_label = tk.Label(frame, text="Video DVD Mode:")
+video_mode_label.pack(anchor=tk.W)
+
+video_mode_combobox = ttk.Combobox(frame, textvariable=video_mode_var, values=VIDEO_DVD_MODES, state='readonly', width=35)
+video_mode_combobox.pack(anchor=tk.W)
+
 # Create a frame for buttons
 button_frame = tk.Frame(frame)
 button_frame.pack(fill=tk.X, pady=5)
 
+# Files chosen for a targeted rescue; empty means the whole disc
+selected_files = []
+
+# Events of all jobs, rendered by the job view on the Tk main loop
+bus = EventBus()
+jobs = []
+workers = {}    # job -> its thread, which queues the spool transfer after the job has finished
+
+# Moves finished spooled jobs to their output directory, including any left from an earlier session
+spool_mover = None
+if SPOOL_ENABLED:
+    spool_mover = SpoolMover(SPOOL_DIR, SPOOL_BANDWIDTH)
+    try:
+        spool_mover.start()
+    except OSError as e:
+        messagebox.showwarning("Spool unavailable", f"Could not use the spool directory {SPOOL_DIR}: {e}")
+        spool_mover = None
+
 def start_iso_creation():
-    # Run the ISO creation process in a separate thread to avoid freezing the GUI
-    threading.Thread(target=create_iso, args=(dvd_device_var, output_path_var, method_var, n_option_var, r3_option_var, b_option_var, d_option_var, c_option_var, log_text, app, stop_button, progress_bar)).start()
+    iso_path = output_path_var.get()
+    if not iso_path:
+        iso_path = filedialog.asksaveasfilename(defaultextension=".iso", filetypes=[("ISO files", "*.iso")])
+        if not iso_path:
+            messagebox.showerror("Error", "Please specify an output path for the ISO file.")
+            return
+        output_path_var.set(iso_path)
+    dvd_device = dvd_device_var.get().split()[0]
+    for job in jobs:
+        if (not job.finished or workers[job].is_alive()) and (job.device == dvd_device or job.destination == iso_path):
+            messagebox.showerror("Error", f"Job {job.id} is still using {job.device} and {job.destination}.")
+            return
+    # A finished job's results may still be waiting in the spool directory a new job would write to
+    if spool_mover and transfer_pending(iso_path):
+        messagebox.showerror("Error", f"The results of an earlier job for {iso_path} are still being moved from "
+                             f"the spool. Wait for the move to finish (or run 'python3 spool.py flush') and try again.")
+        return
+
+    options = ImagingOptions(n_option_var.get(), r3_option_var.get(), b_option_var.get(), d_option_var.get(),
+                             c_option_var.get(), video_mode=video_mode_var.get())
+    # In spool mode the job writes to local staging and the mover copies the results to iso_path
+    job = Job(bus, dvd_device, staging_path(iso_path) if spool_mover else iso_path, destination=iso_path)
+    jobs.append(job)
+    # The job runs on its own thread and only talks to the GUI through the event bus
+    workers[job] = threading.Thread(target=create_iso, args=(job, method_var.get(), options, list(selected_files),
+                                                             storage_var.get(), spool_mover), daemon=True)
+    workers[job].start()
+
+def select_files():
+    """Read the directory structure from the disc in the background and let the user pick files."""
+    dvd_device = dvd_device_var.get().split()[0]
+    update_log(log_text, f"Reading file list from {dvd_device}...")
+
+    def read_listing():
+        try:
+            listing, _, _ = read_disc_listing(dvd_device)
+        except (OSError, FilesystemError) as e:
+            error_message = f"Could not read the file list from the disc: {e}"
+            app.after(0, lambda: messagebox.showerror("Error", error_message))
+            return
+        app.after(0, lambda: choose_files(listing.files))
+
+    def choose_files(files):
+        selection = ask_file_selection(app, files)
+        if selection is not None:
+            selected_files[:] = selection
+            selected_files_label.config(text=f"{len(selected_files)} files selected" if selected_files else "Whole disc")
+
+    threading.Thread(target=read_listing, daemon=True).start()
 
 create_iso_button = tk.Button(button_frame, text="Create ISO", command=start_iso_creation)
 create_iso_button.pack(side=tk.LEFT, padx=(0, 5))
 
-# Define the Stop button
-stop_button = tk.Button(button_frame, text="Stop", command=stop_process, state=tk.DISABLED)
+# Define the Stop button; it stops the job selected in the job table
+stop_button = tk.Button(button_frame, text="Stop", state=tk.DISABLED)
 stop_button.pack(side=tk.LEFT)
 
+select_files_button = tk.Button(button_frame, text="Select Files...", command=select_files)
+select_files_button.pack(side=tk.LEFT, padx=5)
+
+selected_files_label = tk.Label(button_frame, text="Whole disc")
+selected_files_label.pack(side=tk.LEFT)
+
+# Opens the complete log of the selected job (double-clicking a job in the table does the same)
+job_log_button = tk.Button(button_frame, text="Job Log...", command=lambda: job_view.open_log())
+job_log_button.pack(side=tk.LEFT, padx=5)
+
 log_frame = tk.Frame(app)
 log_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
@@ -113,16 +211,41 @@ log_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 progress_bar = ttk.Progressbar(log_frame, orient='horizontal', length=300, mode='determinate')
 progress_bar.pack(fill=tk.X, pady=(0, 5))
 
+# Add a sector map showing the rescue state from the ddrescue mapfile
+sector_map = SectorMap(log_frame)
+sector_map.pack(anchor=tk.W, pady=(0, 5))
+
+# Add the read rate over time from the ddrescue rate log
+throughput_curve = ThroughputCurve(log_frame)
+throughput_curve.pack(anchor=tk.W, pady=(0, 5))
+
 # Set a monospaced font for the log output
 log_font = font.Font(family="Courier", size=10)
 log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=10, font=log_font)
 log_text.pack(fill=tk.BOTH, expand=True)
 
+def show_job(job):
+    """Point the sector map and the throughput curve at the files of the selected job."""
+    sector_map.watch(job.output + ".map")
+    throughput_curve.watch(job.output + ".rates.log")
+
+# Table of jobs; it owns the log, progress bar and Stop button updates
+job_view = JobView(log_frame, bus, log_text, progress_bar, stop_button, on_select=show_job)
+job_view.pack(fill=tk.X, pady=(0, 5), before=progress_bar)
+
 # Check if dvdisaster tool is installed and disable certain options if it's not available
 if not check_tool_installed("dvdisaster"):
     d_option_checkbox.config(state=tk.DISABLED)
     messagebox.showwarning("dvdisaster not installed", "dvdisaster is not installed. Some recovery options are disabled.")
 
+# Export per-drive and per-job metrics for Prometheus, fed from the job journals
+if METRICS_ENABLED:
+    try:
+        enable_metrics()
+        update_log(log_text, f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except OSError as e:
+        update_log(log_text, f"Could not start the metrics endpoint: {e}", level="WARNING")
+
 # Bind the media type update function
 dvd_device_combobox.bind("<<ComboboxSelected>>", lambda _: update_gui_for_media_type(dvd_device_var, method_var, options_frame.winfo_children()))
 
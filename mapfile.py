@@ -0,0 +1,81 @@
+import os
+
+# Block status characters used by GNU ddrescue mapfiles
+NON_TRIED = '?'
+NON_TRIMMED = '*'
+NON_SCRAPED = '/'
+BAD_SECTOR = '-'
+FINISHED = '+'
+
+# Ordered from worst to best, used when several statuses share one region
+STATUS_PRIORITY = [BAD_SECTOR, NON_SCRAPED, NON_TRIMMED, NON_TRIED, FINISHED]
+
+def read_mapfile(mapfile):
+    """Parse a ddrescue mapfile.
+
+    Returns a tuple (current_pos, current_status, blocks) where blocks is a list of
+    (pos, size, status) tuples in the order they appear in the file. Comment lines
+    and malformed lines are ignored. An empty or missing mapfile yields no blocks."""
+    current_pos, current_status, blocks = 0, NON_TRIED, []
+    status_line_seen = False
+    try:
+        with open(mapfile, 'r') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                fields = line.split()
+                try:
+                    if not status_line_seen:
+                        current_pos, current_status = int(fields[0], 0), fields[1]
+                        status_line_seen = True
+                    else:
+                        blocks.append((int(fields[0], 0), int(fields[1], 0), fields[2]))
+                except (IndexError, ValueError):
+                    continue
+    except OSError as e:
+        print(f"Error reading mapfile {mapfile}: {e}")
+    return current_pos, current_status, blocks
+
+def mapfile_size(blocks):
+    """Return the size in bytes covered by the given mapfile blocks."""
+    return max((pos + size for pos, size, _ in blocks), default=0)
+
+def write_mapfile(mapfile, blocks, current_pos=0, current_status=FINISHED, comment=None, sync=False):
+    """Write blocks in ddrescue mapfile format.
+
+    The file is written to a temporary name and renamed into place so readers
+    never see a partially written mapfile. With sync the file and the rename are
+    also on disk when this returns."""
+    tmp_path = f"{mapfile}.tmp"
+    with open(tmp_path, 'w') as f:
+        if comment:
+            for line in comment.splitlines():
+                f.write(f"# {line}\n")
+        f.write("# current_pos  current_status\n")
+        f.write(f"0x{current_pos:08X}     {current_status}\n")
+        f.write("#      pos        size  status\n")
+        for pos, size, status in blocks:
+            f.write(f"0x{pos:08X}  0x{size:08X}  {status}\n")
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, mapfile)
+    if sync:
+        fd = os.open(os.path.dirname(os.path.abspath(mapfile)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def merge_blocks(blocks):
+    """Merge adjacent blocks that share the same status."""
+    merged = []
+    for pos, size, status in blocks:
+        if size <= 0:
+            continue
+        if merged and merged[-1][2] == status and merged[-1][0] + merged[-1][1] == pos:
+            merged[-1] = (merged[-1][0], merged[-1][1] + size, status)
+        else:
+            merged.append((pos, size, status))
+    return merged
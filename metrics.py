@@ -0,0 +1,164 @@
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_HOST, METRICS_PORT
+from buffer_pool import pool
+import journal
+
+PREFIX = "iso_rescue_"
+JOB_DURATION_BUCKETS = (60, 300, 600, 1200, 1800, 3600, 7200, 14400)
+PROBE_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+HELP = {
+    "bytes_rescued": ("gauge", "Bytes rescued so far by the running or last job on the drive"),
+    "bytes_rescued_total": ("counter", "Bytes rescued by finished jobs"),
+    "throughput_bytes_per_second": ("gauge", "Current read rate"),
+    "average_throughput_bytes_per_second": ("gauge", "Average read rate of the running or last job"),
+    "read_errors": ("gauge", "Read errors reported for the running or last job"),
+    "bad_area_bytes": ("gauge", "Bytes in bad areas for the running or last job"),
+    "stalls_total": ("counter", "Times the read rate dropped to zero"),
+    "jobs_active": ("gauge", "Jobs started and not yet finished"),
+    "jobs_total": ("counter", "Finished jobs by outcome"),
+    "job_duration_seconds": ("histogram", "Duration of finished jobs"),
+    "probe_duration_seconds": ("histogram", "Latency of media detection probes per tool"),
+    "buffer_pool_bytes": ("gauge", "Bytes of the shared buffer pool in use per consumer"),
+    "buffer_pool_peak_bytes": ("gauge", "Most bytes of the shared buffer pool in use at once per consumer"),
+    "buffer_pool_allocated_bytes": ("gauge", "Bytes held by the shared buffer pool, in use or free"),
+    "buffer_pool_waits_total": ("counter", "Times a consumer had to wait for the buffer pool"),
+}
+
+def _labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class StationMetrics:
+    """Per-drive and per-job metrics fed from journal records.
+
+    observe() only updates a few dicts under a lock, so it is cheap enough to be
+    called from the imaging thread; render() works on the same lock-protected data."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)     # (name, labels) -> value
+        self._histograms = {}                 # (name, labels) -> [bucket counts, sum, count, buckets]
+        self._jobs = {}                       # job id -> {"drive": ..., "rate": ..., "rescued": ...}
+        self._values[("jobs_active", ())] = 0
+
+    def observe(self, job_id, record):
+        event = record.get("event")
+        with self._lock:
+            if event == "job_start":
+                drive = record.get("drive") or record.get("device") or "unknown"
+                self._jobs[job_id] = {"drive": drive, "rate": None, "rescued": 0}
+                self._values[("jobs_active", ())] += 1
+                for name in ("bytes_rescued", "read_errors", "bad_area_bytes", "throughput_bytes_per_second",
+                             "average_throughput_bytes_per_second"):
+                    self._values[(name, (("drive", drive),))] = 0
+                return
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            labels = (("drive", job["drive"]),)
+            if event == "sample":
+                self._observe_sample(job, labels, record)
+            elif event == "span" and record.get("phase") == "probe":
+                self._observe_histogram("probe_duration_seconds", (("tool", record.get("tool", "unknown")),),
+                                        record["duration"], PROBE_DURATION_BUCKETS)
+            elif event == "job_end":
+                del self._jobs[job_id]
+                self._values[("jobs_active", ())] -= 1
+                self._values[("jobs_total", labels + (("outcome", record.get("outcome", "unknown")),))] += 1
+                self._values[("bytes_rescued_total", labels)] += job["rescued"]
+                self._values[("throughput_bytes_per_second", labels)] = 0
+                self._observe_histogram("job_duration_seconds", labels, record.get("duration", 0), JOB_DURATION_BUCKETS)
+
+    def _observe_sample(self, job, labels, record):
+        if "rescued_bytes" in record:
+            job["rescued"] = record["rescued_bytes"]
+            self._values[("bytes_rescued", labels)] = record["rescued_bytes"]
+            if "average_rate" not in record and record.get("elapsed"):
+                self._values[("average_throughput_bytes_per_second", labels)] = record["rescued_bytes"] / record["elapsed"]
+        if "rate" in record:
+            # A zero current rate after a non-zero one counts as a stall
+            if record["rate"] == 0 and job["rate"]:
+                self._values[("stalls_total", labels)] += 1
+            job["rate"] = record["rate"]
+            self._values[("throughput_bytes_per_second", labels)] = record["rate"]
+        if "average_rate" in record:
+            self._values[("average_throughput_bytes_per_second", labels)] = record["average_rate"]
+        if "read_errors" in record:
+            self._values[("read_errors", labels)] = record["read_errors"]
+        if "bad_bytes" in record:
+            self._values[("bad_area_bytes", labels)] = record["bad_bytes"]
+
+    def _observe_histogram(self, name, labels, value, buckets):
+        histogram = self._histograms.setdefault((name, labels), [[0] * len(buckets), 0.0, 0, buckets])
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: (list(counts), total, count, buckets)
+                          for key, (counts, total, count, buckets) in self._histograms.items()}
+        for consumer, (current, peak) in pool.usage().items():
+            values[("buffer_pool_bytes", (("consumer", consumer),))] = current
+            values[("buffer_pool_peak_bytes", (("consumer", consumer),))] = peak
+        values[("buffer_pool_allocated_bytes", ())] = pool.allocated()
+        values[("buffer_pool_waits_total", ())] = pool.waits
+        lines = []
+        for name, (metric_type, help_text) in HELP.items():
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+            if metric_type == "histogram":
+                for (key, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+                    if key != name:
+                        continue
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', bound),))} {bucket_count}")
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+            else:
+                for (key, labels), value in sorted(values.items()):
+                    if key == name:
+                        lines.append(f"{PREFIX}{name}{_labels(labels)} {value:.15g}")
+        return "\n".join(lines) + "\n"
+
+def start_metrics_server(metrics, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve metrics.render() on http://host:port/metrics from a daemon thread. Returns the server."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def enable_metrics(host=METRICS_HOST, port=METRICS_PORT):
+    """Start the endpoint and feed it from every job journal. Returns the StationMetrics."""
+    metrics = StationMetrics()
+    start_metrics_server(metrics, host, port)
+    journal.listeners.append(metrics.observe)
+    return metrics
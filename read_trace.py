@@ -0,0 +1,222 @@
+import argparse
+import math
+import os
+import struct
+import sys
+import time
+from array import array
+from config import SECTOR_SIZE
+from throughput_profile import RatesLog, ReadsLog, rates_log_path, reads_log_path, build_profile
+
+# Binary read trace: a header followed by one fixed-size record per read request.
+#   header  magic, disc size, sector size, version, flags
+#   record  position, size, copied bytes, error bytes, latency in microseconds
+# FLAG_MEASURED is set when latencies were timed per read, and clear when they were
+# estimated from the rate log.
+MAGIC = b"IRTRACE\0"
+VERSION = 1
+FLAG_MEASURED = 1
+HEADER = struct.Struct("<8sQIHH")
+RECORD = struct.Struct("<QIIII")
+UNTRACED_RATE = 10e6  # bytes/s for sectors a trace never read and no rate is known
+
+def trace_path(image_path):
+    return image_path + ".trace"
+
+class TraceRecorder:
+    """Append read records to a trace file. The header is rewritten on close, so a
+    recorder can be fed while a copy is running."""
+
+    def __init__(self, path, size, sector_size=SECTOR_SIZE, measured=True):
+        self.path = path
+        self.size = size
+        self.sector_size = sector_size
+        self.flags = FLAG_MEASURED if measured else 0
+        self.count = 0
+        self._file = open(path + ".tmp", 'wb')
+        self._file.write(HEADER.pack(MAGIC, size, sector_size, VERSION, self.flags))
+
+    def record(self, pos, size, copied, error, latency):
+        self._file.write(RECORD.pack(pos, size, copied, error, min(0xFFFFFFFF, max(0, round(latency * 1e6)))))
+        self.count += 1
+
+    def close(self):
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, self.size, self.sector_size, VERSION, self.flags))
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+def read_trace_header(path):
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a read trace")
+    magic, size, sector_size, version, flags = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} read trace")
+    return {"size": size, "sector_size": sector_size, "measured": bool(flags & FLAG_MEASURED)}
+
+def read_trace(path):
+    """Return the header and the records as typed arrays: pos, size, copied, error, latency (seconds)."""
+    header = read_trace_header(path)
+    records = {"pos": array('Q'), "size": array('I'), "copied": array('I'), "error": array('I'), "latency": array('d')}
+    with open(path, 'rb') as f:
+        f.seek(HEADER.size)
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size  # ignore a torn last record
+    for pos, size, copied, error, latency in RECORD.iter_unpack(data[:usable]):
+        records["pos"].append(pos)
+        records["size"].append(size)
+        records["copied"].append(copied)
+        records["error"].append(error)
+        records["latency"].append(latency / 1e6)
+    return header, records
+
+def record_trace(image_path, size=None, sector_size=SECTOR_SIZE):
+    """Turn the ddrescue --log-reads (and --log-rates) files of a job into a read trace
+    next to the image. Returns the trace path, or None without a reads log.
+
+    Latencies come from the time column of the reads log when it has one. Otherwise
+    reads are timed at the measured rate of their position, and failed reads share
+    the seconds in which the rate log shows no progress."""
+    reads = ReadsLog(reads_log_path(image_path))
+    reads.poll()
+    if not len(reads):
+        return None
+    rates = RatesLog(rates_log_path(image_path))
+    rates.poll()
+    times = reads.data["time"]
+    measured = not any(math.isnan(t) for t in times)
+    if not size:
+        size = max(pos + length for pos, length in zip(reads.data["pos"], reads.data["size"]))
+
+    if not measured:
+        profile = build_profile(rates, reads, size) if len(rates) else None
+        rated = [rate for rate in (profile["position_rate"] if profile else []) if rate]
+        fallback_rate = sorted(rated)[len(rated) // 2] if rated else UNTRACED_RATE
+        stall_seconds = sum(1 for rate in rates.data["rate"] if rate == 0)
+        failures = sum(1 for error in reads.data["error"] if error)
+        failure_latency = stall_seconds / failures if failures else 0
+
+    path = trace_path(image_path)
+    recorder = TraceRecorder(path, size, sector_size, measured)
+    previous = 0.0
+    try:
+        for i in range(len(reads)):
+            pos, length, copied, error = (reads.data[name][i] for name in ("pos", "size", "copied", "error"))
+            if measured:
+                latency, previous = max(0.0, times[i] - previous), times[i]
+            elif error:
+                latency = failure_latency
+            else:
+                rate = profile["position_rate"][min(pos // profile["bin_size"], profile["bins"] - 1)] if profile else None
+                latency = length / (rate or fallback_rate)
+            recorder.record(pos, length, copied, error, latency)
+    finally:
+        recorder.close()
+    return path
+
+class TraceDrive:
+    """Serves a stored image with the timing and read errors of a recorded trace.
+
+    Every sector remembers the outcomes of all reads that covered it in the trace.
+    The n-th read of a sector during replay gets the n-th recorded outcome (the last
+    one once they run out), so a sector that failed twice and then read fine does the
+    same under a different engine. Sectors the trace never read are served at the
+    median traced rate."""
+
+    def __init__(self, source, trace):
+        header, records = read_trace(trace)
+        self.size = header["size"]
+        self.sector_size = header["sector_size"]
+        self.fd = os.open(source, os.O_RDONLY)
+        sectors = -(-self.size // self.sector_size)
+        self.sector_latency = array('d', [math.nan]) * sectors
+        self.outcomes = {}      # sector -> [(ok, latency), ...] for sectors that ever failed
+        self.attempts = {}      # sector -> reads served so far
+        good_time = good_bytes = 0
+        for pos, size, copied, error, latency in zip(*(records[name] for name in ("pos", "size", "copied", "error", "latency"))):
+            first = pos // self.sector_size
+            count = max(1, -(-size // self.sector_size))
+            per_sector = latency / count
+            good_sectors = count if not error else copied // self.sector_size
+            for offset in range(count):
+                sector = first + offset
+                if sector >= sectors:
+                    break
+                ok = offset < good_sectors
+                if ok and math.isnan(self.sector_latency[sector]):
+                    self.sector_latency[sector] = per_sector
+                if not ok or sector in self.outcomes:
+                    self.outcomes.setdefault(sector, []).append((ok, per_sector))
+            if not error:
+                good_time += latency
+                good_bytes += size
+        self.default_latency = self.sector_size / (good_bytes / good_time if good_time else UNTRACED_RATE)
+
+    def read(self, pos, length, retry=False):
+        """Return (data, bad_sectors) like SimulatedDrive.read."""
+        first, last = pos // self.sector_size, (pos + length - 1) // self.sector_size
+        delay = 0.0
+        bad = []
+        for sector in range(first, last + 1):
+            history = self.outcomes.get(sector)
+            if history:
+                attempt = self.attempts.get(sector, 0)
+                self.attempts[sector] = attempt + 1
+                ok, latency = history[min(attempt, len(history) - 1)]
+                if not ok:
+                    bad.append(sector)
+            else:
+                latency = self.sector_latency[sector]
+            delay += self.default_latency if math.isnan(latency) else latency
+        time.sleep(delay)
+        if bad:
+            return None, bad
+        return os.pread(self.fd, length, pos), []
+
+def summarize_trace(header, records):
+    failed = [i for i, error in enumerate(records["error"]) if error]
+    good_time = sum(latency for latency, error in zip(records["latency"], records["error"]) if not error)
+    good_bytes = sum(size for size, error in zip(records["size"], records["error"]) if not error)
+    return {
+        "size": header["size"], "reads": len(records["pos"]), "failed_reads": len(failed),
+        "error_bytes": sum(records["error"][i] for i in failed), "read_bytes": sum(records["size"]),
+        "time": sum(records["latency"]), "failed_time": sum(records["latency"][i] for i in failed),
+        "rate": good_bytes / good_time if good_time else 0, "measured": header["measured"],
+    }
+
+def format_summary(summary):
+    timing = "measured" if summary["measured"] else "estimated"
+    return (f"{summary['reads']} reads of {summary['read_bytes']} bytes on a {summary['size']} byte disc, "
+            f"{summary['time']:.1f} s ({timing})\n"
+            f"{summary['failed_reads']} failed reads, {summary['error_bytes']} error bytes, "
+            f"{summary['failed_time']:.1f} s spent on failures, {summary['rate'] / 1e6:.2f} MB/s on good reads")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and inspect read traces for replaying damaged discs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="Build IMAGE.trace from the ddrescue read and rate logs of IMAGE")
+    record_parser.add_argument("image")
+    record_parser.add_argument("--size", type=int, help="Disc size in bytes (default: taken from the logs)")
+    info_parser = subparsers.add_parser("info", help="Summarise a trace")
+    info_parser.add_argument("trace")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "record":
+            path = record_trace(args.image, args.size)
+            if path is None:
+                print(f"Error: no reads log for {args.image}", file=sys.stderr)
+                return 1
+            print(f"Wrote {path}")
+        else:
+            path = args.trace
+        print(format_summary(summarize_trace(*read_trace(path))))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import os
+import threading
+import tkinter as tk
+from config import SECTOR_MAP_COLUMNS, SECTOR_MAP_ROWS, SECTOR_MAP_CELL_SIZE, SECTOR_MAP_POLL_MS, SECTOR_MAP_COLORS
+from mapfile import read_mapfile, mapfile_size, STATUS_PRIORITY, FINISHED, NON_TRIED
+
+def bin_blocks(blocks, bin_count, total_size=None):
+    """Distribute mapfile blocks over a fixed number of equally sized bins.
+
+    Returns a dict mapping each status character to a list with the number of
+    bytes of that status in every bin. Each block only touches the bins it
+    overlaps, so the cost is proportional to blocks + bins, not to disc size."""
+    if total_size is None:
+        total_size = mapfile_size(blocks)
+    counts = {status: [0] * bin_count for status in STATUS_PRIORITY}
+    if total_size <= 0:
+        return counts
+    bin_size = -(-total_size // bin_count)
+    for pos, size, status in blocks:
+        status_counts = counts.get(status)
+        if status_counts is None:
+            continue
+        end = min(pos + size, total_size)
+        while pos < end:
+            index = pos // bin_size
+            bin_end = min((index + 1) * bin_size, end)
+            status_counts[index] += bin_end - pos
+            pos = bin_end
+    return counts
+
+def aggregate_bins(counts, bin_count):
+    """Reduce per-status byte counts to one status per bin.
+
+    The worst status present in a bin wins, so a single bad sector stays visible
+    in an otherwise finished region. Empty bins are reported as non-tried."""
+    statuses = [NON_TRIED] * bin_count
+    for index in range(bin_count):
+        for status in STATUS_PRIORITY:
+            if counts[status][index]:
+                statuses[index] = status
+                break
+    return statuses
+
+class SectorMap(tk.Frame):
+    """Canvas grid showing the rescue state of a disc as recorded in a ddrescue mapfile.
+
+    The mapfile is parsed and binned in a background thread whenever its
+    modification time changes. The Tk main loop only picks up the finished
+    status array and recolours the cells whose status actually changed."""
+
+    def __init__(self, parent, columns=SECTOR_MAP_COLUMNS, rows=SECTOR_MAP_ROWS, cell_size=SECTOR_MAP_CELL_SIZE):
+        super().__init__(parent)
+        self.columns = columns
+        self.rows = rows
+        self.bin_count = columns * rows
+        self.canvas = tk.Canvas(self, width=columns * cell_size, height=rows * cell_size,
+                                highlightthickness=0, bg='white')
+        self.canvas.pack(side=tk.LEFT)
+        self.summary_label = tk.Label(self, text="", justify=tk.LEFT, anchor=tk.NW)
+        self.summary_label.pack(side=tk.LEFT, fill=tk.Y, padx=5)
+
+        self.cells = []
+        for index in range(self.bin_count):
+            row, column = divmod(index, columns)
+            x, y = column * cell_size, row * cell_size
+            self.cells.append(self.canvas.create_rectangle(
+                x, y, x + cell_size - 1, y + cell_size - 1,
+                fill=SECTOR_MAP_COLORS[NON_TRIED], outline=''))
+        self.statuses = [NON_TRIED] * self.bin_count
+
+        self.mapfile = None
+        self._mtime = None
+        self._pending = None
+        self._worker = None
+        self._lock = threading.Lock()
+        self.after(SECTOR_MAP_POLL_MS, self._poll)
+
+    def watch(self, mapfile):
+        """Start following the given mapfile, resetting the grid."""
+        self.mapfile = mapfile
+        self._mtime = None
+        self.render([NON_TRIED] * self.bin_count)
+        self.summary_label.config(text="")
+
+    def render(self, statuses):
+        """Recolour only the cells whose status differs from the current one."""
+        for index, status in enumerate(statuses):
+            if status != self.statuses[index]:
+                self.canvas.itemconfig(self.cells[index], fill=SECTOR_MAP_COLORS.get(status, SECTOR_MAP_COLORS[NON_TRIED]))
+                self.statuses[index] = status
+
+    def _poll(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            statuses, summary = pending
+            self.render(statuses)
+            self.summary_label.config(text=summary)
+
+        if self.mapfile and (self._worker is None or not self._worker.is_alive()):
+            try:
+                mtime = os.stat(self.mapfile).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != self._mtime:
+                self._mtime = mtime
+                self._worker = threading.Thread(target=self._load, args=(self.mapfile,), daemon=True)
+                self._worker.start()
+        self.after(SECTOR_MAP_POLL_MS, self._poll)
+
+    def _load(self, mapfile):
+        _, _, blocks = read_mapfile(mapfile)
+        total_size = mapfile_size(blocks)
+        counts = bin_blocks(blocks, self.bin_count, total_size)
+        statuses = aggregate_bins(counts, self.bin_count)
+        rescued = sum(size for _, size, status in blocks if status == FINISHED)
+        percent = (rescued / total_size * 100) if total_size else 0.0
+        summary = f"Rescued: {percent:.2f}%\nSize: {total_size // (1024 * 1024)} MB\nBins: {self.bin_count}"
+        with self._lock:
+            if mapfile == self.mapfile:
+                self._pending = (statuses, summary)
@@ -0,0 +1,295 @@
+import argparse
+import errno
+import hashlib
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from config import SPOOL_DIR, SPOOL_BANDWIDTH, SPOOL_RETRIES, SPOOL_RETRY_DELAY, SPOOL_CHUNK_SIZE
+from iosched import scheduler, background, advise_sequential, advise_done, TRANSFER
+from buffer_pool import pool
+
+# Spool mode: a job writes its image and sidecars to a directory of its own under
+# SPOOL_DIR on fast local storage. When the job has succeeded, TRANSFER_FILENAME is
+# written into that directory and the SpoolMover copies everything else in it to the
+# destination directory, keeping relative paths (journals/, logs/, rip directories).
+# Failed and stopped jobs stay in the spool, so they can be resumed.
+TRANSFER_FILENAME = ".transfer.json"
+PART_SUFFIX = ".part"
+UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF)
+
+def print_log(message, level="INFO"):
+    print(f"[{level}] {message}")
+
+def staging_dir(final_path, spool_dir=SPOOL_DIR):
+    """The spool directory of the job writing final_path; the same path always gets the same one."""
+    key = hashlib.sha1(os.path.abspath(final_path).encode()).hexdigest()[:12]
+    return os.path.join(spool_dir, f"{key}-{os.path.basename(final_path)}")
+
+def staging_path(final_path, spool_dir=SPOOL_DIR):
+    """Where a job writes final_path in spool mode."""
+    return os.path.join(staging_dir(final_path, spool_dir), os.path.basename(final_path))
+
+def transfer_pending(final_path, spool_dir=SPOOL_DIR):
+    """True while the staging directory of final_path waits for or is in a transfer.
+
+    Every job writing final_path uses that directory, so no new job may start
+    there until the mover has removed it."""
+    return os.path.exists(os.path.join(staging_dir(final_path, spool_dir), TRANSFER_FILENAME))
+
+def final_path(path, staging, destination_dir):
+    """Where a file written under staging ends up, or path itself if it is outside the spool."""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(staging))
+    if relative.startswith(os.pardir):
+        return path
+    return os.path.join(destination_dir, relative)
+
+def queue_transfer(staging, destination_dir, primary=None):
+    """Mark a staging directory as finished and ready to move. primary is moved last,
+    so its appearance at the destination means everything else is there too."""
+    record = {"destination": os.path.abspath(destination_dir), "primary": primary, "queued": time.time()}
+    path = os.path.join(staging, TRANSFER_FILENAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(record, f)
+    os.replace(path + ".tmp", path)
+
+def pending_transfers(spool_dir=SPOOL_DIR):
+    """Staging directories marked for transfer, oldest first."""
+    pending = []
+    try:
+        names = os.listdir(spool_dir)
+    except OSError:
+        return []
+    for name in names:
+        path = os.path.join(spool_dir, name, TRANSFER_FILENAME)
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        pending.append((record.get("queued", 0), os.path.join(spool_dir, name), record))
+    return [(staging, record) for _, staging, record in sorted(pending)]
+
+def staged_files(staging, primary=None):
+    """Relative paths of the files to move, primary last."""
+    files = []
+    for root, _, names in os.walk(staging):
+        for name in names:
+            relative = os.path.relpath(os.path.join(root, name), staging)
+            if relative != TRANSFER_FILENAME and not relative.endswith(".tmp"):
+                files.append(relative)
+    return sorted(files, key=lambda relative: (relative == primary, relative))
+
+class Throttle:
+    """Sleeps just enough to keep a transfer at or below rate bytes/s (no limit for 0),
+    and leaves the local disk to live imaging jobs through the shared I/O scheduler."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.sent = 0
+
+    def __call__(self, count):
+        scheduler.take(TRANSFER, count)
+        self.sent += count
+        if self.rate:
+            delay = self.sent / self.rate - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+
+def _copy_range(src, dst, count, offset, method, buffer):
+    """Copy count bytes at offset with the given kernel copy, or through buffer for
+    "readwrite"; returns the bytes copied."""
+    if method == "copy_file_range":
+        return os.copy_file_range(src, dst, count, offset, offset)
+    if method == "sendfile":
+        os.lseek(dst, offset, os.SEEK_SET)
+        return os.sendfile(dst, src, offset, count)
+    read = os.preadv(src, [buffer[:count]], offset)
+    return os.pwrite(dst, buffer[:read], offset)
+
+def copy_file(source, target, throttle=None, chunk_size=SPOOL_CHUNK_SIZE):
+    """Copy source to target in the kernel where possible: copy_file_range, then
+    sendfile, then read/write. Returns the SHA-256 of the source data."""
+    digest = hashlib.sha256()
+    methods = [name for name in ("copy_file_range", "sendfile") if hasattr(os, name)] + ["readwrite"]
+    src = os.open(source, os.O_RDONLY)
+    try:
+        dst = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            size = os.fstat(src).st_size
+            advise_sequential(src)
+            offset = 0
+            with pool.lease(chunk_size, TRANSFER) as buffer:
+                while offset < size:
+                    count = min(chunk_size, size - offset)
+                    try:
+                        copied = _copy_range(src, dst, count, offset, methods[0], buffer)
+                    except OSError as e:
+                        if e.errno not in UNSUPPORTED or len(methods) == 1:
+                            raise
+                        methods.pop(0)
+                        continue
+                    if copied <= 0:
+                        raise OSError(errno.EIO, f"Short copy at {offset} of {source}")
+                    # The source is local and was just read by the copy, so this comes from the page cache
+                    digest.update(buffer[:os.preadv(src, [buffer[:copied]], offset)])
+                    advise_done(src, offset, copied)
+                    offset += copied
+                    if throttle is not None:
+                        throttle(copied)
+            os.fsync(dst)
+        finally:
+            os.close(dst)
+    finally:
+        os.close(src)
+    return digest.hexdigest()
+
+def file_digest(path, chunk_size=SPOOL_CHUNK_SIZE):
+    """SHA-256 of a file as stored, dropping it from the page cache first so a
+    network file system is actually read back."""
+    digest = hashlib.sha256()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        with pool.lease(chunk_size, TRANSFER) as buffer:
+            while True:
+                count = os.readv(fd, [buffer])
+                if not count:
+                    break
+                scheduler.take(TRANSFER, count)
+                digest.update(buffer[:count])
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # not supported by every network file system
+    finally:
+        os.close(fd)
+
+def move_file(source, target, throttle=None):
+    """Copy source next to target, confirm the copy by checksum, rename it into place
+    and remove the source. Returns the number of bytes moved."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    part = target + PART_SUFFIX
+    try:
+        expected = copy_file(source, part, throttle)
+        actual = file_digest(part)
+        if actual != expected:
+            raise OSError(errno.EIO, f"Checksum mismatch for {target}: {actual} instead of {expected}")
+        size = os.path.getsize(part)
+        os.replace(part, target)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(os.path.dirname(target))
+    os.remove(source)
+    return size
+
+def move_staged(staging, record, log=print_log, bandwidth=SPOOL_BANDWIDTH, retries=SPOOL_RETRIES,
+                retry_delay=SPOOL_RETRY_DELAY, stop_event=None):
+    """Move the files of one staging directory to its destination, retrying each file.
+
+    Returns True when everything was moved and the staging directory removed."""
+    destination = record["destination"]
+    throttle = Throttle(bandwidth)
+    started = time.monotonic()
+    moved = 0
+    for relative in staged_files(staging, record.get("primary")):
+        source, target = os.path.join(staging, relative), os.path.join(destination, relative)
+        for attempt in range(1, retries + 1):
+            try:
+                moved += move_file(source, target, throttle)
+                break
+            except OSError as e:
+                if attempt == retries:
+                    log(f"Moving {relative} to {destination} failed after {retries} attempts: {e}. "
+                        f"It stays in {staging}.", "ERROR")
+                    return False
+                delay = retry_delay * attempt
+                log(f"Moving {relative} to {destination} failed: {e}. Retrying in {delay} s", "WARNING")
+                if stop_event is None:
+                    time.sleep(delay)
+                elif stop_event.wait(delay):
+                    return False
+    seconds = time.monotonic() - started
+    log(f"Moved {moved / 1e6:.0f} MB from the spool to {destination} in {seconds:.0f} s "
+        f"({moved / seconds / 1e6 if seconds else 0:.1f} MB/s)", "INFO")
+    shutil.rmtree(staging, ignore_errors=True)
+    return True
+
+class SpoolMover:
+    """Background thread that moves finished jobs from the spool to their destination,
+    one at a time. Transfers queued before a restart are picked up by start()."""
+
+    def __init__(self, spool_dir=SPOOL_DIR, bandwidth=SPOOL_BANDWIDTH, log=None):
+        self.spool_dir = spool_dir
+        self.bandwidth = bandwidth
+        self.log = log or print_log
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for staging, record in pending_transfers(self.spool_dir):
+            self._queue.put((staging, record, None))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, staging, destination_dir, primary=None, log=None):
+        """Queue a finished staging directory. log(message, level) receives the result."""
+        queue_transfer(staging, destination_dir, primary)
+        self._queue.put((staging, {"destination": os.path.abspath(destination_dir), "primary": primary}, log))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        self._stop_event.set()
+        self._queue.put(None)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            item = self._queue.get()
+            if item is None:
+                break
+            staging, record, log = item
+            if not os.path.isdir(staging):
+                continue
+            with background(TRANSFER):
+                move_staged(staging, record, log or self.log, self.bandwidth, stop_event=self._stop_event)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List or move finished jobs waiting in the spool.")
+    parser.add_argument("command", choices=["list", "flush"])
+    parser.add_argument("--spool", default=SPOOL_DIR, help=f"Spool directory (default: {SPOOL_DIR})")
+    parser.add_argument("--bandwidth", type=float, default=SPOOL_BANDWIDTH, help="Limit in bytes/s (0: no limit)")
+    args = parser.parse_args(argv)
+
+    transfers = pending_transfers(args.spool)
+    if args.command == "list":
+        for staging, record in transfers:
+            size = sum(os.path.getsize(os.path.join(staging, relative)) for relative in staged_files(staging))
+            print(f"{staging} -> {record['destination']} ({size / 1e6:.0f} MB)")
+        return 0
+    failed = 0
+    for staging, record in transfers:
+        if not move_staged(staging, record, print_log, args.bandwidth):
+            failed += 1
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,730 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import struct
+import sys
+import time
+from binascii import crc_hqx
+from collections import namedtuple
+from config import SECTOR_SIZE
+from mapfile import write_mapfile, FINISHED, BAD_SECTOR
+
+# A file to put on the image. content is "random" (a deterministic pattern seeded from
+# the path, every sector stamped with the file number and its offset), "zero",
+# "mpeg" or "mpeg-css" (MPEG program stream packs, in the clear or with the CSS
+# scrambling bits set), or the literal bytes of the file.
+FileSpec = namedtuple('FileSpec', ['path', 'size', 'content'])
+
+DEFAULT_TIMESTAMP = 946684800  # 2000-01-01, so the same arguments always give the same image
+CHUNK_SIZE = 1024 * 1024
+ISO_MAX_EXTENT = 0xFFFFF800    # larger files get multi-extent directory records
+UDF_MAX_EXTENT = 0x3FFFF800    # largest short_ad extent
+VOB_MAX_SIZE = 1024 ** 3       # DVD-Video splits titles into VOBs of at most 1 GiB
+IFO_SIZE = 16 * 1024
+MENU_VOB_SIZE = 256 * 1024
+DAMAGE_SECTORS = 16
+FILES_PER_DIRECTORY = 100
+UDF_PARTITION_START = 257
+UDF_MAIN_VDS, UDF_RESERVE_VDS, UDF_INTEGRITY_SEQUENCE = 32, 48, 64
+UDF_VDS_SECTORS = 16
+UDF_FIRST_UNIQUE_ID = 16       # 0-15 are reserved, 0 is the root directory
+UDF_DIR_PERMISSIONS = 0x14A5   # r-x for owner, group and other
+UDF_FILE_PERMISSIONS = 0x1084  # r-- for owner, group and other
+PACK_HEADER = bytes.fromhex("000001ba4400040004010189c3f8" "000001e007ec")
+PES_CLEAR, PES_SCRAMBLED = 0x81, 0x91
+APPLICATION_ID = "ISO RESCUE SYNTHETIC IMAGE"
+
+class _Dir:
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent or self
+        self.path = f"{parent.path}/{name}" if parent and parent.path != "/" else f"/{name}"
+        self.dirs = {}
+        self.files = []
+
+class _File:
+    def __init__(self, spec, number):
+        self.spec = spec
+        self.number = number
+        self.name = spec.path.rsplit('/', 1)[1]
+
+def _both16(value):
+    return struct.pack('<H', value) + struct.pack('>H', value)
+
+def _both32(value):
+    return struct.pack('<I', value) + struct.pack('>I', value)
+
+def _sectors(length):
+    return -(-length // SECTOR_SIZE)
+
+def _text(value, length, joliet=False):
+    if joliet:
+        return value[:length // 2].ljust(length // 2).encode('utf-16-be').ljust(length, b'\x00')
+    return value.encode('ascii', 'replace')[:length].ljust(length, b' ')
+
+def _iso_identifier(name, is_dir, taken):
+    """ISO9660 level 2 identifier (d-characters, at most 30 characters), unique within its directory."""
+    clean = "".join(c if c.isascii() and (c.isalnum() or c == '_') else '_' for c in name.upper())
+    if not is_dir:
+        base, _, extension = name.upper().rpartition('.') if '.' in name else (name.upper(), '', '')
+        clean_base = "".join(c if c.isascii() and (c.isalnum() or c == '_') else '_' for c in base) or "_"
+        clean_ext = "".join(c if c.isascii() and (c.isalnum() or c == '_') else '_' for c in extension)[:8]
+        clean = f"{clean_base[:29 - len(clean_ext)]}.{clean_ext}"
+    else:
+        clean = clean[:31] or "_"
+    candidate, counter = clean, 1
+    while candidate in taken:
+        suffix = f"_{counter}"
+        if is_dir:
+            candidate = clean[:31 - len(suffix)] + suffix
+        else:
+            base, extension = clean.split('.')
+            candidate = f"{base[:29 - len(extension) - len(suffix)]}{suffix}.{extension}"
+        counter += 1
+    taken.add(candidate)
+    return candidate.encode('ascii') + (b'' if is_dir else b';1')
+
+def _joliet_identifier(name, is_dir):
+    return name[:64].encode('utf-16-be') + (b'' if is_dir else ';1'.encode('utf-16-be'))
+
+def _udf_name(name):
+    """OSTA compressed unicode: 8-bit when every character fits, 16-bit otherwise."""
+    if all(ord(c) < 256 for c in name):
+        return b'\x08' + name.encode('latin-1')[:254]
+    return b'\x10' + name.encode('utf-16-be')[:254]
+
+def _dstring(value, length):
+    encoded = _udf_name(value)[:length - 1] if value else b''
+    return encoded.ljust(length - 1, b'\x00') + bytes([len(encoded)])
+
+def _charspec():
+    return b'\x00' + b'OSTA Compressed Unicode'.ljust(63, b'\x00')
+
+def _regid(identifier, suffix=b''):
+    return b'\x00' + identifier.ljust(23, b'\x00') + suffix.ljust(8, b'\x00')
+
+def _timestamp(seconds):
+    t = time.gmtime(seconds)
+    return struct.pack('<HhBBBBBBBB', 0x1000, t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, 0, 0, 0)
+
+def _long_ad(length, block):
+    return struct.pack('<IIH', length, block, 0) + bytes(6)
+
+def _tag(raw, identifier, location, crc_length=None):
+    """Fill in the 16-byte UDF descriptor tag, including CRC and checksum."""
+    crc_length = len(raw) - 16 if crc_length is None else crc_length
+    struct.pack_into('<HHBBHHHI', raw, 0, identifier, 2, 0, 0, 1, crc_hqx(bytes(raw[16:16 + crc_length]), 0),
+                     crc_length, location)
+    raw[4] = (sum(raw[0:4]) + sum(raw[5:16])) & 0xFF
+    return bytes(raw)
+
+def _pack_records(records):
+    """Lay out ISO9660 directory records so that none crosses a sector boundary."""
+    out = bytearray()
+    for record in records:
+        if len(out) % SECTOR_SIZE + len(record) > SECTOR_SIZE:
+            out.extend(bytes(SECTOR_SIZE - len(out) % SECTOR_SIZE))
+        out.extend(record)
+    return bytes(out) + bytes(-len(out) % SECTOR_SIZE)
+
+def _record_length(identifier):
+    return 33 + len(identifier) + (1 - len(identifier) % 2)
+
+class ImageBuilder:
+    """Lays out an ISO9660 (+ Joliet) / UDF 1.02 bridge image and streams it sector by sector.
+
+    All positions are computed up front from the file sizes, so nothing is staged on disk:
+    file systems structures are generated as they are written and file contents are
+    produced from their FileSpec. Both file systems share one copy of the file data,
+    as on DVDs."""
+
+    def __init__(self, files, directories=(), volume_id="SYNTHETIC", joliet=True, udf=True, seed=0,
+                 timestamp=DEFAULT_TIMESTAMP):
+        self.volume_id = volume_id
+        self.joliet = joliet
+        self.udf = udf
+        self.seed = seed
+        self.timestamp = timestamp
+        self._pattern = None
+        self.root = _Dir("", None)
+        self.root.path = "/"
+        self.files = []
+        for path in directories:
+            self._directory(path.strip('/').split('/'))
+        for spec in sorted(files, key=lambda spec: spec.path):
+            if isinstance(spec.content, bytes) and len(spec.content) != spec.size:
+                raise ValueError(f"{spec.path}: content is {len(spec.content)} bytes, size is {spec.size}")
+            parts = spec.path.strip('/').split('/')
+            if not all(parts):
+                raise ValueError(f"Invalid path: {spec.path}")
+            parent = self._directory(parts[:-1])
+            entry = _File(spec._replace(path='/' + '/'.join(parts)), len(self.files))
+            parent.files.append(entry)
+            self.files.append(entry)
+        self.by_path = {entry.spec.path: entry for entry in self.files}
+        self._name_entries()
+        self._layout()
+
+    def _directory(self, parts):
+        node = self.root
+        for part in parts:
+            if not part:
+                continue
+            node = node.dirs.setdefault(part, _Dir(part, node))
+        return node
+
+    def _all_dirs(self, key):
+        """Directories breadth first, children ordered by key, as in a path table."""
+        order = [self.root]
+        for node in order:
+            order.extend(sorted(node.dirs.values(), key=key))
+        return order
+
+    def _name_entries(self):
+        for node in self._all_dirs(lambda d: d.name):
+            taken = set()
+            for child in sorted(node.dirs.values(), key=lambda d: d.name):
+                child.iso_id = _iso_identifier(child.name, True, taken)
+                child.joliet_id = _joliet_identifier(child.name, True)
+            for entry in node.files:
+                entry.iso_id = _iso_identifier(entry.name, False, taken)
+                entry.joliet_id = _joliet_identifier(entry.name, False)
+        self.root.iso_id = self.root.joliet_id = b'\x00'
+
+    def _iso_children(self, node, joliet):
+        key = 'joliet_id' if joliet else 'iso_id'
+        return sorted(list(node.dirs.values()) + node.files, key=lambda child: getattr(child, key))
+
+    def _iso_dir_size(self, node, joliet):
+        lengths = [34, 34]
+        for child in self._iso_children(node, joliet):
+            identifier = child.joliet_id if joliet else child.iso_id
+            parts = max(1, -(-child.spec.size // ISO_MAX_EXTENT)) if isinstance(child, _File) else 1
+            lengths.extend([_record_length(identifier)] * parts)
+        return len(_pack_records(bytes(length) for length in lengths))
+
+    def _fid_bytes(self, node, base_block):
+        """The file identifier descriptors of a UDF directory whose data starts at base_block."""
+        out = bytearray()
+        entries = [(0x0A, b'', node.parent.udf_fe)]
+        entries += [(0x02, _udf_name(child.name), child.udf_fe) for child in sorted(node.dirs.values(), key=lambda d: d.name)]
+        entries += [(0x00, _udf_name(entry.name), entry.udf_fe) for entry in node.files]
+        for characteristics, name, block in entries:
+            raw = bytearray((38 + len(name) + 3) & ~3)
+            struct.pack_into('<HBB', raw, 16, 1, characteristics, len(name))
+            raw[20:36] = _long_ad(SECTOR_SIZE, block)
+            raw[38:38 + len(name)] = name
+            out.extend(_tag(raw, 257, base_block + len(out) // SECTOR_SIZE))
+        return bytes(out)
+
+    def _layout(self):
+        sector = 16
+        self.pvd_sector = sector
+        sector += 1
+        if self.joliet:
+            self.svd_sector = sector
+            sector += 1
+        self.terminator_sector = sector
+        sector += 1
+        if self.udf:
+            self.vrs_sector = sector
+            sector = self.partition_start = UDF_PARTITION_START
+            sector += 2  # file set descriptor and its terminator
+        self.iso_dirs = self._all_dirs(lambda d: d.iso_id)
+        self.joliet_dirs = self._all_dirs(lambda d: d.joliet_id) if self.joliet else []
+        if self.udf:
+            self.udf_dirs = self._all_dirs(lambda d: d.name)
+            for node in self.udf_dirs + self.files:
+                node.udf_fe = sector - self.partition_start
+                sector += 1
+            for node in self.udf_dirs:
+                node.fid_block = sector - self.partition_start
+                node.fid_length = len(self._fid_bytes(node, node.fid_block))
+                sector += _sectors(node.fid_length)
+            self.unique_ids = UDF_FIRST_UNIQUE_ID + len(self.udf_dirs) + len(self.files)
+
+        self.path_tables = {}
+        for joliet, dirs in ((False, self.iso_dirs), (True, self.joliet_dirs)):
+            if not dirs:
+                continue
+            size = len(self._path_table(dirs, joliet, '<', placeholder=True))
+            self.path_tables[joliet] = (sector, sector + _sectors(size), size)
+            sector += 2 * _sectors(size)
+        for joliet, dirs in ((False, self.iso_dirs), (True, self.joliet_dirs)):
+            for node in dirs:
+                size = self._iso_dir_size(node, joliet)
+                if joliet:
+                    node.joliet_extent, node.joliet_size = sector, size
+                else:
+                    node.iso_extent, node.iso_size = sector, size
+                sector += size // SECTOR_SIZE
+
+        for entry in self.files:
+            entry.sector = sector if entry.spec.size else 0
+            sector += _sectors(entry.spec.size)
+        if self.udf:
+            self.partition_length = sector - self.partition_start
+            self.backup_anchor = sector
+            sector += 1
+        self.total_sectors = sector
+        self.size = sector * SECTOR_SIZE
+
+    def _path_table(self, dirs, joliet, order, placeholder=False):
+        numbers = {id(node): number for number, node in enumerate(dirs, 1)}
+        out = bytearray()
+        for node in dirs:
+            identifier = b'\x00' if node is self.root else (node.joliet_id if joliet else node.iso_id)
+            extent = 0 if placeholder else (node.joliet_extent if joliet else node.iso_extent)
+            out.extend(struct.pack(f'{order}BBIH', len(identifier), 0, extent, numbers[id(node.parent)]))
+            out.extend(identifier + bytes(len(identifier) % 2))
+        return bytes(out)
+
+    def _iso_record(self, extent, size, flags, identifier):
+        t = time.gmtime(self.timestamp)
+        record = bytearray(_record_length(identifier))
+        record[0] = len(record)
+        record[2:10] = _both32(extent)
+        record[10:18] = _both32(size)
+        record[18:25] = bytes([t.tm_year - 1900, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, 0])
+        record[25] = flags
+        record[28:32] = _both16(1)
+        record[32] = len(identifier)
+        record[33:33 + len(identifier)] = identifier
+        return bytes(record)
+
+    def _iso_directory(self, node, joliet):
+        extent = (lambda d: (d.joliet_extent, d.joliet_size)) if joliet else (lambda d: (d.iso_extent, d.iso_size))
+        records = [self._iso_record(*extent(node), 0x02, b'\x00'), self._iso_record(*extent(node.parent), 0x02, b'\x01')]
+        for child in self._iso_children(node, joliet):
+            identifier = child.joliet_id if joliet else child.iso_id
+            if isinstance(child, _Dir):
+                records.append(self._iso_record(*extent(child), 0x02, identifier))
+                continue
+            size, position = child.spec.size, child.sector
+            while True:
+                part = min(size, ISO_MAX_EXTENT)
+                records.append(self._iso_record(position, part, 0x80 if size > part else 0x00, identifier))
+                size -= part
+                position += part // SECTOR_SIZE
+                if size <= 0:
+                    break
+        return _pack_records(records)
+
+    def _volume_descriptor(self, joliet):
+        root = self.root
+        descriptor = bytearray(SECTOR_SIZE)
+        descriptor[0:7] = (b'\x02' if joliet else b'\x01') + b'CD001\x01'
+        descriptor[8:40] = _text("LINUX", 32, joliet)
+        descriptor[40:72] = _text(self.volume_id if joliet else self.volume_id.upper(), 32, joliet)
+        descriptor[80:88] = _both32(self.total_sectors)
+        if joliet:
+            descriptor[88:91] = b'%/E'
+        descriptor[120:124] = _both16(1)
+        descriptor[124:128] = _both16(1)
+        descriptor[128:132] = _both16(SECTOR_SIZE)
+        l_table, m_table, table_size = self.path_tables[joliet]
+        descriptor[132:140] = _both32(table_size)
+        struct.pack_into('<I', descriptor, 140, l_table)
+        struct.pack_into('>I', descriptor, 148, m_table)
+        descriptor[156:190] = self._iso_record(*((root.joliet_extent, root.joliet_size) if joliet
+                                                else (root.iso_extent, root.iso_size)), 0x02, b'\x00')
+        for offset, length in ((190, 128), (318, 128), (446, 128)):
+            descriptor[offset:offset + length] = _text("", length, joliet)
+        descriptor[574:702] = _text(APPLICATION_ID, 128, joliet)
+        for offset in (702, 739, 776):
+            descriptor[offset:offset + 37] = _text("", 37, joliet)
+        created = time.strftime("%Y%m%d%H%M%S00", time.gmtime(self.timestamp)).encode() + b'\x00'
+        descriptor[813:830] = created
+        descriptor[830:847] = created
+        descriptor[847:864] = b'0' * 16 + b'\x00'
+        descriptor[864:881] = b'0' * 16 + b'\x00'
+        descriptor[881] = 1
+        return bytes(descriptor)
+
+    def _udf_volume_descriptors(self, base):
+        """Main or reserve volume descriptor sequence starting at sector base."""
+        stamp = _timestamp(self.timestamp)
+        descriptors = []
+        primary = bytearray(512)
+        struct.pack_into('<II', primary, 16, 0, 0)
+        primary[24:56] = _dstring(self.volume_id, 32)
+        struct.pack_into('<HHHHII', primary, 56, 1, 1, 2, 2, 1, 1)
+        primary[72:200] = _dstring(f"{self.timestamp:08X}{self.volume_id}", 128)
+        primary[200:264] = _charspec()
+        primary[264:328] = _charspec()
+        primary[344:376] = _regid(APPLICATION_ID.encode()[:23])
+        primary[376:388] = stamp
+        primary[388:420] = _regid(b'*ISO Rescue')
+        descriptors.append((1, primary))
+
+        implementation_use = bytearray(512)
+        struct.pack_into('<I', implementation_use, 16, 1)
+        implementation_use[20:52] = _regid(b'*UDF LV Info', struct.pack('<H', 0x0102))
+        implementation_use[52:116] = _charspec()
+        implementation_use[116:244] = _dstring(self.volume_id, 128)
+        implementation_use[352:384] = _regid(b'*ISO Rescue')
+        descriptors.append((4, implementation_use))
+
+        partition = bytearray(512)
+        struct.pack_into('<IHH', partition, 16, 2, 1, 0)
+        partition[24:56] = _regid(b'+NSR02')
+        struct.pack_into('<III', partition, 184, 1, self.partition_start, self.partition_length)
+        partition[196:228] = _regid(b'*ISO Rescue')
+        descriptors.append((5, partition))
+
+        logical_volume = bytearray(446)
+        struct.pack_into('<I', logical_volume, 16, 3)
+        logical_volume[20:84] = _charspec()
+        logical_volume[84:212] = _dstring(self.volume_id, 128)
+        struct.pack_into('<I', logical_volume, 212, SECTOR_SIZE)
+        logical_volume[216:248] = _regid(b'*OSTA UDF Compliant', struct.pack('<HB', 0x0102, 0))
+        logical_volume[248:264] = _long_ad(SECTOR_SIZE, 0)
+        struct.pack_into('<II', logical_volume, 264, 6, 1)
+        logical_volume[272:304] = _regid(b'*ISO Rescue')
+        struct.pack_into('<II', logical_volume, 432, 2 * SECTOR_SIZE, UDF_INTEGRITY_SEQUENCE)
+        struct.pack_into('<BBHH', logical_volume, 440, 1, 6, 1, 0)
+        descriptors.append((6, logical_volume))
+
+        unallocated = bytearray(24)
+        struct.pack_into('<II', unallocated, 16, 4, 0)
+        descriptors.append((7, unallocated))
+        descriptors.append((8, bytearray(512)))
+        return [_tag(raw, identifier, base + i) for i, (identifier, raw) in enumerate(descriptors)]
+
+    def _udf_integrity_sequence(self):
+        integrity = bytearray(134)
+        integrity[16:28] = _timestamp(self.timestamp)
+        struct.pack_into('<I', integrity, 28, 1)  # closed
+        struct.pack_into('<Q', integrity, 40, self.unique_ids)
+        struct.pack_into('<IIII', integrity, 72, 1, 46, 0, self.partition_length)
+        integrity[88:120] = _regid(b'*ISO Rescue')
+        struct.pack_into('<IIHHH', integrity, 120, len(self.files), len(self.udf_dirs), 0x0102, 0x0102, 0x0102)
+        return [_tag(integrity, 9, UDF_INTEGRITY_SEQUENCE), _tag(bytearray(512), 8, UDF_INTEGRITY_SEQUENCE + 1)]
+
+    def _anchor(self, sector):
+        anchor = bytearray(512)
+        struct.pack_into('<IIII', anchor, 16, UDF_VDS_SECTORS * SECTOR_SIZE, UDF_MAIN_VDS,
+                         UDF_VDS_SECTORS * SECTOR_SIZE, UDF_RESERVE_VDS)
+        return _tag(anchor, 2, sector)
+
+    def _file_set(self):
+        file_set = bytearray(512)
+        file_set[16:28] = _timestamp(self.timestamp)
+        struct.pack_into('<HHIIII', file_set, 28, 3, 3, 1, 1, 0, 0)
+        file_set[48:112] = _charspec()
+        file_set[112:240] = _dstring(self.volume_id, 128)
+        file_set[240:304] = _charspec()
+        file_set[304:336] = _dstring(self.volume_id, 32)
+        file_set[400:416] = _long_ad(SECTOR_SIZE, self.root.udf_fe)
+        file_set[416:448] = _regid(b'*OSTA UDF Compliant', struct.pack('<HB', 0x0102, 0))
+        return [_tag(file_set, 256, 0), _tag(bytearray(512), 8, 1)]
+
+    def _file_entry(self, node, unique_id):
+        if isinstance(node, _Dir):
+            file_type, size, permissions = 4, node.fid_length, UDF_DIR_PERMISSIONS
+            links = 1 + len(node.dirs)
+            ads = struct.pack('<II', size, node.fid_block)
+        else:
+            file_type, size, permissions, links = 5, node.spec.size, UDF_FILE_PERMISSIONS, 1
+            ads = bytearray()
+            block, remaining = node.sector - self.partition_start, size
+            while remaining > 0:
+                part = min(remaining, UDF_MAX_EXTENT)
+                ads.extend(struct.pack('<II', part, block))
+                block += part // SECTOR_SIZE
+                remaining -= part
+        if 176 + len(ads) > SECTOR_SIZE:
+            raise ValueError(f"{node.spec.path} is too large for a single UDF file entry")
+        stamp = _timestamp(self.timestamp)
+        raw = bytearray(176 + len(ads))
+        struct.pack_into('<IHHHBB', raw, 16, 0, 4, 0, 1, 0, file_type)
+        struct.pack_into('<IIIHBBIQQ', raw, 36, 0xFFFFFFFF, 0xFFFFFFFF, permissions, links, 0, 0, 0, size, _sectors(size))
+        raw[72:84] = raw[84:96] = raw[96:108] = stamp
+        struct.pack_into('<I', raw, 108, 1)
+        raw[128:160] = _regid(b'*ISO Rescue')
+        struct.pack_into('<QII', raw, 160, unique_id, 0, len(ads))
+        raw[176:] = ads
+        return _tag(raw, 261, node.udf_fe)
+
+    def metadata(self):
+        """Yield (sector, data) for every file system structure, in sector order."""
+        yield self.pvd_sector, self._volume_descriptor(False)
+        if self.joliet:
+            yield self.svd_sector, self._volume_descriptor(True)
+        yield self.terminator_sector, b'\xffCD001\x01'.ljust(SECTOR_SIZE, b'\x00')
+        if self.udf:
+            for i, identifier in enumerate((b'BEA01', b'NSR02', b'TEA01')):
+                yield self.vrs_sector + i, (b'\x00' + identifier + b'\x01').ljust(SECTOR_SIZE, b'\x00')
+            for base in (UDF_MAIN_VDS, UDF_RESERVE_VDS):
+                for i, descriptor in enumerate(self._udf_volume_descriptors(base)):
+                    yield base + i, descriptor
+            for i, descriptor in enumerate(self._udf_integrity_sequence()):
+                yield UDF_INTEGRITY_SEQUENCE + i, descriptor
+            yield UDF_PARTITION_START - 1, self._anchor(UDF_PARTITION_START - 1)
+            for i, descriptor in enumerate(self._file_set()):
+                yield self.partition_start + i, descriptor
+            unique_id = UDF_FIRST_UNIQUE_ID
+            for node in self.udf_dirs + self.files:
+                yield self.partition_start + node.udf_fe, self._file_entry(node, 0 if node is self.root else unique_id)
+                unique_id += node is not self.root
+            for node in self.udf_dirs:
+                yield self.partition_start + node.fid_block, self._fid_bytes(node, node.fid_block)
+        for joliet, dirs in ((False, self.iso_dirs), (True, self.joliet_dirs)):
+            if dirs:
+                l_table, m_table, _ = self.path_tables[joliet]
+                yield l_table, self._path_table(dirs, joliet, '<')
+                yield m_table, self._path_table(dirs, joliet, '>')
+        for joliet, dirs in ((False, self.iso_dirs), (True, self.joliet_dirs)):
+            for node in dirs:
+                yield (node.joliet_extent if joliet else node.iso_extent), self._iso_directory(node, joliet)
+
+    def _file_by_path(self, path):
+        entry = self.by_path.get('/' + path.strip('/'))
+        if entry is None:
+            raise ValueError(f"{path} is not a file in the image")
+        return entry
+
+    def file_range(self, path, offset=0, length=None):
+        """Byte range (image offset, length) of part of a file's data."""
+        entry = self._file_by_path(path)
+        length = entry.spec.size - offset if length is None else length
+        if offset < 0 or length < 0 or offset + length > entry.spec.size:
+            raise ValueError(f"Range {offset}+{length} lies outside {path} ({entry.spec.size} bytes)")
+        return entry.sector * SECTOR_SIZE + offset, length
+
+    def damage_range(self, path, sectors=DAMAGE_SECTORS):
+        """A hole of the given number of sectors in the middle of a file."""
+        entry = self._file_by_path(path)
+        count = min(sectors, _sectors(entry.spec.size))
+        first = (_sectors(entry.spec.size) - count) // 2
+        return (entry.sector + first) * SECTOR_SIZE, count * SECTOR_SIZE
+
+    def chunks(self, entry):
+        """Yield the content of a file in chunks of at most CHUNK_SIZE bytes."""
+        spec = entry.spec
+        if isinstance(spec.content, bytes):
+            for offset in range(0, spec.size, CHUNK_SIZE):
+                yield spec.content[offset:offset + CHUNK_SIZE]
+            return
+        if spec.content == "zero":
+            for offset in range(0, spec.size, CHUNK_SIZE):
+                yield bytes(min(CHUNK_SIZE, spec.size - offset))
+            return
+        if spec.content not in ("random", "mpeg", "mpeg-css"):
+            raise ValueError(f"{spec.path}: unknown content {spec.content!r}")
+        if self._pattern is None:
+            self._pattern = random.Random(self.seed).randbytes(2 * CHUNK_SIZE)
+        # Each file starts at its own place in one shared pattern; the stamps make every sector unique
+        start = random.Random(f"{self.seed}:{spec.path}").randrange(CHUNK_SIZE)
+        base = self._pattern[start:start + CHUNK_SIZE]
+        header = b''
+        if spec.content != "random":
+            header = PACK_HEADER + bytes([PES_SCRAMBLED if spec.content == "mpeg-css" else PES_CLEAR, 0, 0])
+        stamp = len(header)
+        for offset in range(0, spec.size, CHUNK_SIZE):
+            chunk = bytearray(base[:min(CHUNK_SIZE, spec.size - offset)])
+            for pos in range(0, len(chunk) - stamp - 16 + 1, SECTOR_SIZE):
+                chunk[pos:pos + stamp] = header
+                struct.pack_into('<QQ', chunk, pos + stamp, entry.number, offset + pos)
+            yield chunk
+
+    def write(self, out, holes=(), hash_files=False):
+        """Stream the image to a binary file object, leaving the hole ranges unwritten.
+
+        Unwritten ranges (holes, zero content, gaps) are seeked over when the output is
+        seekable, so they cost nothing and stay sparse. Returns {path: sha256 hex} of the
+        intended file contents when hash_files is set."""
+        writer = _Writer(out, holes)
+        for sector, data in self.metadata():
+            writer.write_at(sector * SECTOR_SIZE, data)
+        digests = {}
+        for entry in self.files:
+            digest = hashlib.sha256() if hash_files else None
+            writer.skip_to(entry.sector * SECTOR_SIZE)
+            for chunk in self.chunks(entry):
+                if digest:
+                    digest.update(chunk)
+                if entry.spec.content == "zero":
+                    writer.skip_to(writer.pos + len(chunk))
+                else:
+                    writer.write_at(writer.pos, chunk)
+            if digest:
+                digests[entry.spec.path] = digest.hexdigest()
+        if self.udf:
+            writer.write_at(self.backup_anchor * SECTOR_SIZE, self._anchor(self.backup_anchor))
+        writer.finish(self.size)
+        return digests
+
+class _Writer:
+    def __init__(self, out, holes):
+        self.out = out
+        self.pos = 0
+        self.holes = sorted(holes)
+        try:
+            self.seekable = out.seekable()
+        except (AttributeError, OSError):
+            self.seekable = False
+
+    def skip_to(self, pos):
+        if pos <= self.pos:
+            return
+        if self.seekable:
+            self.out.seek(pos)
+        else:
+            zeros = bytes(min(CHUNK_SIZE, pos - self.pos))
+            remaining = pos - self.pos
+            while remaining:
+                self.out.write(zeros[:remaining])
+                remaining -= min(remaining, len(zeros))
+        self.pos = pos
+
+    def write_at(self, pos, data):
+        """Write data at pos (never before the current position), skipping over holes."""
+        if pos < self.pos:
+            raise ValueError(f"Overlapping writes at byte {pos}")
+        self.skip_to(pos)
+        end = pos + len(data)
+        while self.holes and self.holes[0][0] + self.holes[0][1] <= pos:
+            self.holes.pop(0)
+        for hole_start, hole_length in self.holes:
+            if hole_start >= end:
+                break
+            if hole_start > self.pos:
+                self.out.write(data[self.pos - pos:hole_start - pos])
+                self.pos = hole_start
+            self.skip_to(min(end, hole_start + hole_length))
+        if self.pos < end:
+            self.out.write(data[self.pos - pos:])
+            self.pos = end
+
+    def finish(self, size):
+        if self.seekable:
+            self.out.truncate(size)
+        else:
+            self.skip_to(size)
+
+def hole_blocks(size, holes):
+    """Mapfile blocks for an image of the given size: holes are bad sectors, the rest finished."""
+    blocks = []
+    pos = 0
+    for start, length in sorted(holes):
+        start = max(start, pos)
+        end = min(size, start + length)
+        if end <= start:
+            continue
+        if start > pos:
+            blocks.append((pos, start - pos, FINISHED))
+        blocks.append((start, end - start, BAD_SECTOR))
+        pos = end
+    if pos < size:
+        blocks.append((pos, size - pos, FINISHED))
+    return blocks
+
+def align_holes(holes):
+    """Widen holes to whole sectors, as a drive loses whole sectors."""
+    aligned = []
+    for start, length in holes:
+        first = start // SECTOR_SIZE * SECTOR_SIZE
+        aligned.append((first, _sectors(start + length) * SECTOR_SIZE - first))
+    return aligned
+
+def video_dvd_files(size, titles=1, scrambled=False):
+    """A VIDEO_TS tree with about size bytes of title VOBs spread over the given number of titles."""
+    content = "mpeg-css" if scrambled else "mpeg"
+    files = [FileSpec("/VIDEO_TS/VIDEO_TS.IFO", IFO_SIZE, b'DVDVIDEO-VMG'.ljust(IFO_SIZE, b'\x00')),
+             FileSpec("/VIDEO_TS/VIDEO_TS.BUP", IFO_SIZE, b'DVDVIDEO-VMG'.ljust(IFO_SIZE, b'\x00')),
+             FileSpec("/VIDEO_TS/VIDEO_TS.VOB", MENU_VOB_SIZE, content)]
+    per_title = max(SECTOR_SIZE, size // titles // SECTOR_SIZE * SECTOR_SIZE)
+    for title in range(1, titles + 1):
+        name = f"/VIDEO_TS/VTS_{title:02d}"
+        files += [FileSpec(f"{name}_0.IFO", IFO_SIZE, b'DVDVIDEO-VTS'.ljust(IFO_SIZE, b'\x00')),
+                  FileSpec(f"{name}_0.BUP", IFO_SIZE, b'DVDVIDEO-VTS'.ljust(IFO_SIZE, b'\x00')),
+                  FileSpec(f"{name}_0.VOB", MENU_VOB_SIZE, content)]
+        for part, offset in enumerate(range(0, per_title, VOB_MAX_SIZE), 1):
+            files.append(FileSpec(f"{name}_{part}.VOB", min(VOB_MAX_SIZE, per_title - offset), content))
+    return files
+
+def data_disc_files(size, count, content="random", per_directory=FILES_PER_DIRECTORY):
+    """count files sharing about size bytes, FILES_PER_DIRECTORY to a directory."""
+    file_size = size // max(1, count)
+    return [FileSpec(f"/DIR{i // per_directory:04d}/FILE{i:06d}.BIN",
+                     file_size + (size - file_size * count if i == count - 1 else 0), content)
+            for i in range(count)]
+
+def build_image(output, builder, holes=(), manifest=False):
+    """Write the image to output ('-' for stdout). Holes also produce output.map, and
+    manifest output.manifest.json with the offset, size, sha256 and damage of every file."""
+    holes = align_holes(holes)
+    if output == '-':
+        digests = builder.write(sys.stdout.buffer, holes, manifest)
+    else:
+        with open(output, 'wb') as f:
+            digests = builder.write(f, holes, manifest)
+    if output != '-' and holes:
+        write_mapfile(output + ".map", hole_blocks(builder.size, holes), comment="Synthetic image: bad sectors are punched holes")
+    if output != '-' and manifest:
+        files = {}
+        for entry in builder.files:
+            start, length = entry.sector * SECTOR_SIZE, entry.spec.size
+            files[entry.spec.path] = {"offset": start, "size": length, "sha256": digests[entry.spec.path],
+                                      "damaged": any(h < start + length and start < h + l for h, l in holes)}
+        path = output + ".manifest.json"
+        with open(path + ".tmp", 'w') as f:
+            json.dump({"volume_id": builder.volume_id, "size": builder.size, "holes": holes, "files": files}, f, indent=1)
+        os.replace(path + ".tmp", path)
+    return digests
+
+def parse_size(text):
+    """Parse a byte count with an optional K, M or G (binary) suffix."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a synthetic ISO9660/Joliet/UDF disc image for testing.")
+    parser.add_argument("output", help="Image to write, or - for stdout")
+    parser.add_argument("--layout", choices=["data", "video"], default="data",
+                        help="Numbered files in directories, or a DVD-Video VIDEO_TS tree")
+    parser.add_argument("--size", type=parse_size, default=parse_size("64M"), help="Bytes of file data, e.g. 4G")
+    parser.add_argument("--files", type=int, default=100, help="Number of files (data layout)")
+    parser.add_argument("--titles", type=int, default=1, help="Number of titles (video layout)")
+    parser.add_argument("--content", choices=["random", "zero"], default="random", help="File contents (data layout)")
+    parser.add_argument("--css", action="store_true", help="Set the CSS scrambling bits in title VOBs")
+    parser.add_argument("--volume-id", default="SYNTHETIC")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-joliet", action="store_true")
+    parser.add_argument("--no-udf", action="store_true")
+    parser.add_argument("--hole", action="append", default=[], metavar="OFFSET:LENGTH",
+                        help="Leave a byte range unwritten and mark it bad in OUTPUT.map")
+    parser.add_argument("--damage", action="append", default=[], metavar="PATH",
+                        help=f"Punch a {DAMAGE_SECTORS} sector hole in the middle of a file")
+    parser.add_argument("--manifest", action="store_true", help="Write OUTPUT.manifest.json with file hashes")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.layout == "video":
+            files = video_dvd_files(args.size, args.titles, args.css)
+            directories = ["AUDIO_TS"]
+        else:
+            files = data_disc_files(args.size, args.files, args.content)
+            directories = []
+        builder = ImageBuilder(files, directories, args.volume_id, not args.no_joliet, not args.no_udf, args.seed)
+        holes = [tuple(parse_size(value) for value in hole.split(":", 1)) for hole in args.hole]
+        holes += [builder.damage_range(path) for path in args.damage]
+        started = time.time()
+        build_image(args.output, builder, holes, args.manifest)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.output != '-':
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"Wrote {args.output}: {builder.size} bytes, {len(builder.files)} files in {elapsed:.1f} s "
+              f"({builder.size / elapsed / 1e6:.0f} MB/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
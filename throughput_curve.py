@@ -0,0 +1,71 @@
+import threading
+import tkinter as tk
+from config import THROUGHPUT_CURVE_WIDTH, THROUGHPUT_CURVE_HEIGHT, SECTOR_MAP_POLL_MS
+from throughput_profile import RatesLog
+
+def curve_points(times, rates, width, height):
+    """Scale a rate-over-time series to canvas coordinates, at most one point per pixel column."""
+    if len(times) < 2:
+        return []
+    duration = times[-1] or 1
+    top = max(rates) or 1
+    columns = {}
+    for t, rate in zip(times, rates):
+        columns[min(width - 1, int(t / duration * (width - 1)))] = rate
+    points = []
+    for x in sorted(columns):
+        points.extend((x, height - 1 - columns[x] / top * (height - 2)))
+    return points
+
+class ThroughputCurve(tk.Frame):
+    """Live read rate over time from a ddrescue --log-rates file.
+
+    Like the sector map, new log lines are parsed incrementally in a background
+    thread; the Tk main loop only moves the points of a single line item."""
+
+    def __init__(self, parent, width=THROUGHPUT_CURVE_WIDTH, height=THROUGHPUT_CURVE_HEIGHT):
+        super().__init__(parent)
+        self.width = width
+        self.height = height
+        self.canvas = tk.Canvas(self, width=width, height=height, highlightthickness=0, bg='white')
+        self.canvas.pack(side=tk.LEFT)
+        self.line = self.canvas.create_line(0, height - 1, 0, height - 1, fill='blue')
+        self.summary_label = tk.Label(self, text="", justify=tk.LEFT, anchor=tk.NW)
+        self.summary_label.pack(side=tk.LEFT, fill=tk.Y, padx=5)
+
+        self.reader = None
+        self._pending = None
+        self._worker = None
+        self._lock = threading.Lock()
+        self.after(SECTOR_MAP_POLL_MS, self._poll)
+
+    def watch(self, rates_log):
+        """Start following the given rate log, clearing the curve."""
+        self.reader = RatesLog(rates_log)
+        self.canvas.coords(self.line, 0, self.height - 1, 0, self.height - 1)
+        self.summary_label.config(text="")
+
+    def _poll(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            points, summary = pending
+            if points:
+                self.canvas.coords(self.line, *points)
+            self.summary_label.config(text=summary)
+
+        if self.reader is not None and (self._worker is None or not self._worker.is_alive()):
+            self._worker = threading.Thread(target=self._load, args=(self.reader,), daemon=True)
+            self._worker.start()
+        self.after(SECTOR_MAP_POLL_MS, self._poll)
+
+    def _load(self, reader):
+        if not reader.poll():
+            return
+        data = reader.data
+        points = curve_points(data["time"], data["rate"], self.width, self.height)
+        summary = (f"Current: {data['rate'][-1] / 1e6:.2f} MB/s\nAverage: {data['average_rate'][-1] / 1e6:.2f} MB/s\n"
+                   f"Peak: {max(data['rate']) / 1e6:.2f} MB/s")
+        with self._lock:
+            if reader is self.reader:
+                self._pending = (points, summary)
@@ -0,0 +1,281 @@
+import argparse
+import functools
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from array import array
+from config import THROUGHPUT_PROFILE_BINS, THROUGHPUT_TIME_POINTS, SLOW_ZONE_FRACTION, WEAK_DRIVE_FRACTION, DRIVE_PROFILES_FILENAME
+
+LOG_OPTIONS = ("--log-rates", "--log-reads")
+SPARK_CHARACTERS = " ▁▂▃▄▅▆▇█"
+DRIVE_HISTORY = 50
+
+@functools.lru_cache(maxsize=1)
+def ddrescue_log_support():
+    """True if the installed ddrescue understands --log-rates and --log-reads."""
+    try:
+        result = subprocess.run(['ddrescue', '--help'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return all(option in result.stdout for option in LOG_OPTIONS)
+
+def rates_log_path(image_path):
+    return image_path + ".rates.log"
+
+def reads_log_path(image_path):
+    return image_path + ".reads.log"
+
+def profile_path(image_path):
+    return image_path + ".profile.json"
+
+def drive_profiles_path(image_path):
+    """Drive profiles live next to the images they were measured on."""
+    return os.path.join(os.path.dirname(os.path.abspath(image_path)), DRIVE_PROFILES_FILENAME)
+
+class LogReader:
+    """Follow a growing ddrescue log, parsing only the complete lines added since the last poll.
+
+    Parsed values are appended to compact typed arrays in self.data."""
+    columns = ()
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self._partial = b''
+        self.data = {name: array(typecode) for name, typecode in self.columns}
+
+    def __len__(self):
+        return len(self.data[self.columns[0][0]])
+
+    def poll(self):
+        """Parse new lines. Returns the number of records added."""
+        try:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self.offset:
+                    self.reset()  # a new ddrescue run rewrote the log
+                f.seek(self.offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return 0
+        self.offset += len(chunk)
+        lines = (self._partial + chunk).split(b'\n')
+        self._partial = lines.pop()
+        added = 0
+        for line in lines:
+            values = self.parse_line(line.decode('ascii', 'replace').split())
+            if values is None:
+                continue
+            for (name, _), value in zip(self.columns, values):
+                self.data[name].append(value)
+            added += 1
+        return added
+
+    @staticmethod
+    def _hex_index(tokens):
+        if not tokens or tokens[0].startswith('#'):
+            return None
+        return next((i for i, token in enumerate(tokens) if token.lower().startswith('0x')), None)
+
+class RatesLog(LogReader):
+    """ddrescue --log-rates: one line per second with time, ipos, current and average rate, bad areas and size."""
+    columns = (("time", 'd'), ("pos", 'Q'), ("rate", 'd'), ("average_rate", 'd'), ("bad_areas", 'Q'), ("bad_size", 'Q'))
+
+    def parse_line(self, tokens):
+        i = self._hex_index(tokens)
+        if not i or len(tokens) < i + 5:
+            return None
+        try:
+            return (float(tokens[i - 1]), int(tokens[i], 16), float(tokens[i + 1]), float(tokens[i + 2]),
+                    int(tokens[i + 3]), int(tokens[i + 4]))
+        except ValueError:
+            return None
+
+class ReadsLog(LogReader):
+    """ddrescue --log-reads: one line per read with ipos, size, copied size and error size.
+
+    A leading time column (seconds since the start), when present, ends up in "time"; it is NaN otherwise."""
+    columns = (("pos", 'Q'), ("size", 'Q'), ("copied", 'Q'), ("error", 'Q'), ("time", 'd'))
+
+    def parse_line(self, tokens):
+        i = self._hex_index(tokens)
+        if i is None or len(tokens) < i + 4:
+            return None
+        try:
+            seconds = float(tokens[i - 1]) if i else math.nan
+            return (int(tokens[i], 16), int(tokens[i + 1]), int(tokens[i + 2]), int(tokens[i + 3]), seconds)
+        except ValueError:
+            return None
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0
+
+def build_profile(rates, reads=None, total_size=None, bins=THROUGHPUT_PROFILE_BINS):
+    """Reduce parsed rate and read logs to a compact throughput profile.
+
+    The rate is averaged per position bin, errors are summed per bin, and the
+    rate over time is thinned to at most THROUGHPUT_TIME_POINTS points. Bins
+    slower than SLOW_ZONE_FRACTION of the median rate are reported as slow zones."""
+    positions, rate_values = rates.data["pos"], rates.data["rate"]
+    if not total_size:
+        ends = [max(positions, default=0)]
+        if reads is not None and len(reads):
+            ends.append(max(pos + size for pos, size in zip(reads.data["pos"], reads.data["size"])))
+        total_size = max(ends) or 1
+    bin_size = -(-total_size // bins)
+
+    rate_sum = [0.0] * bins
+    rate_count = [0] * bins
+    for pos, rate in zip(positions, rate_values):
+        if pos < total_size:
+            rate_sum[pos // bin_size] += rate
+            rate_count[pos // bin_size] += 1
+    position_rate = [round(rate_sum[i] / rate_count[i]) if rate_count[i] else None for i in range(bins)]
+
+    position_errors = [0] * bins
+    read_count = 0
+    if reads is not None:
+        read_count = len(reads)
+        for pos, error in zip(reads.data["pos"], reads.data["error"]):
+            if error and pos < total_size:
+                position_errors[pos // bin_size] += error
+
+    measured = [rate for rate in position_rate if rate is not None]
+    median_rate = _percentile(measured, 0.5)
+    slow_zones = []
+    for i, rate in enumerate(position_rate):
+        if rate is not None and rate < median_rate * SLOW_ZONE_FRACTION:
+            start, end = i * bin_size, min((i + 1) * bin_size, total_size)
+            if slow_zones and slow_zones[-1][1] == start:
+                slow_zones[-1][1] = end
+            else:
+                slow_zones.append([start, end])
+
+    step = max(1, -(-len(rates) // THROUGHPUT_TIME_POINTS))
+    times = rates.data["time"]
+    summary = {
+        "duration": times[-1] if len(times) else 0,
+        "average_rate": rates.data["average_rate"][-1] if len(rates) else 0,
+        "median_rate": median_rate,
+        "p10_rate": _percentile(measured, 0.1),
+        "error_bytes": sum(position_errors),
+        "read_count": read_count,
+        "slow_zone_bytes": sum(end - start for start, end in slow_zones),
+    }
+    return {"size": total_size, "bins": bins, "bin_size": bin_size, "position_rate": position_rate,
+            "position_errors": position_errors, "time": list(times[::step]), "time_rate": list(rate_values[::step]),
+            "slow_zones": slow_zones, "summary": summary}
+
+def profile_from_logs(image_path, total_size=None):
+    """Parse the rate and read logs written next to an image into a profile."""
+    rates = RatesLog(rates_log_path(image_path))
+    reads = ReadsLog(reads_log_path(image_path))
+    rates.poll()
+    reads.poll()
+    if not len(rates):
+        return None
+    return build_profile(rates, reads, total_size)
+
+def save_profile(image_path, profile):
+    path = profile_path(image_path)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(profile, f)
+    os.replace(path + ".tmp", path)
+
+def load_profile(image_path):
+    with open(profile_path(image_path), 'r') as f:
+        return json.load(f)
+
+def update_drive_profile(path, drive, profile):
+    """Add the summary of one job to the drive's tuning profile. Returns the updated drive entry."""
+    try:
+        with open(path, 'r') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+    summary = profile["summary"]
+    entry = profiles.setdefault(drive, {"jobs": 0, "median_rates": [], "error_bytes": 0, "slow_zone_bytes": 0})
+    entry["jobs"] += 1
+    entry["median_rates"] = (entry["median_rates"] + [summary["median_rate"]])[-DRIVE_HISTORY:]
+    entry["median_rate"] = _percentile(entry["median_rates"], 0.5)
+    entry["error_bytes"] += summary["error_bytes"]
+    entry["slow_zone_bytes"] += summary["slow_zone_bytes"]
+    entry["updated"] = time.time()
+    with open(path + ".tmp", 'w') as f:
+        json.dump(profiles, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    return entry
+
+def weak_drives(profiles):
+    """Drives whose typical rate is below WEAK_DRIVE_FRACTION of the station median."""
+    rates = [entry["median_rate"] for entry in profiles.values() if entry.get("median_rate")]
+    station = _percentile(rates, 0.5)
+    return sorted(drive for drive, entry in profiles.items() if entry.get("median_rate", 0) < station * WEAK_DRIVE_FRACTION)
+
+def format_curve(values, width=64):
+    """One-line sparkline of a list of rates (None for unmeasured)."""
+    if not values:
+        return ""
+    group = -(-len(values) // width)
+    columns = []
+    for i in range(0, len(values), group):
+        measured = [value for value in values[i:i + group] if value is not None]
+        columns.append(sum(measured) / len(measured) if measured else None)
+    top = max((value for value in columns if value is not None), default=0) or 1
+    levels = len(SPARK_CHARACTERS) - 1
+    return "".join(" " if value is None else SPARK_CHARACTERS[max(1, round(value / top * levels))] for value in columns)
+
+def format_profile(profile):
+    summary = profile["summary"]
+    lines = [f"Position: |{format_curve(profile['position_rate'])}|",
+             f"Time:     |{format_curve(profile['time_rate'])}|",
+             f"Median {summary['median_rate'] / 1e6:.2f} MB/s, p10 {summary['p10_rate'] / 1e6:.2f} MB/s, "
+             f"average {summary['average_rate'] / 1e6:.2f} MB/s over {summary['duration']:.0f} s",
+             f"{summary['read_count']} reads, {summary['error_bytes']} error bytes"]
+    for start, end in profile["slow_zones"]:
+        lines.append(f"Slow zone: {start / profile['size'] * 100:.1f}%-{end / profile['size'] * 100:.1f}% "
+                     f"(bytes {start}-{end})")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput profiles from ddrescue --log-rates/--log-reads.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="Show the throughput curve of an image (building the profile if needed)")
+    show_parser.add_argument("image")
+    show_parser.add_argument("--size", type=int, help="Disc size in bytes (default: taken from the logs)")
+    drives_parser = subparsers.add_parser("drives", help="Show the drive profiles in a directory of images")
+    drives_parser.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "show":
+            if os.path.exists(profile_path(args.image)) and not args.size:
+                profile = load_profile(args.image)
+            else:
+                profile = profile_from_logs(args.image, args.size)
+                if profile is None:
+                    print(f"Error: no rate log for {args.image}", file=sys.stderr)
+                    return 1
+                save_profile(args.image, profile)
+            print(format_profile(profile))
+        else:
+            with open(os.path.join(args.directory, DRIVE_PROFILES_FILENAME), 'r') as f:
+                profiles = json.load(f)
+            weak = weak_drives(profiles)
+            for drive, entry in sorted(profiles.items()):
+                flag = "  (weak)" if drive in weak else ""
+                print(f"{drive}: {entry['jobs']} jobs, median {entry['median_rate'] / 1e6:.2f} MB/s, "
+                      f"{entry['error_bytes']} error bytes, {entry['slow_zone_bytes']} bytes in slow zones{flag}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+from config import SECTOR_SIZE
+from iso_filesystem import open_image, read_filesystem, FilesystemError
+from iso_extract import extract_files, UNRESCUED_COPY, UNRESCUED_ZERO, UNRESCUED_SKIP
+
+VIDEO_DIRECTORIES = ["VIDEO_TS", "AUDIO_TS"]
+CSS_SAMPLE_SECTORS = 64
+PACK_START_CODE = b'\x00\x00\x01\xba'
+
+def video_output_dir(image_path):
+    """VIDEO_TS and AUDIO_TS are extracted next to the image, into a directory named like it."""
+    return os.path.splitext(image_path)[0]
+
+def find_video_files(listing):
+    """Return the FileEntry objects below VIDEO_TS and AUDIO_TS (case-insensitive, as on the disc)."""
+    return [entry for entry in listing.files
+            if entry.path.lstrip('/').split('/', 1)[0].upper() in VIDEO_DIRECTORIES]
+
+def is_scrambled(sector):
+    """True if an MPEG program stream sector has its PES scrambling bits set (CSS-encrypted)."""
+    return sector[:4] == PACK_START_CODE and len(sector) > 0x14 and bool(sector[0x14] & 0x30)
+
+def css_scrambled(data, listing, samples=CSS_SAMPLE_SECTORS):
+    """Check the first sectors of the title VOBs for CSS scrambling.
+
+    Only the pack and PES headers are read, which CSS leaves in the clear."""
+    vobs = [entry for entry in find_video_files(listing)
+            if entry.path.upper().endswith(".VOB") and not entry.path.upper().endswith("VIDEO_TS.VOB")]
+    for entry in vobs:
+        checked = 0
+        for offset, length in entry.extents:
+            if offset is None:
+                continue
+            for pos in range(offset, offset + length, SECTOR_SIZE):
+                if checked >= samples:
+                    break
+                if is_scrambled(data[pos:pos + SECTOR_SIZE]):
+                    return True
+                checked += 1
+    return False
+
+def extract_video_ts(image_path, destination=None, mapfile=None, unrescued=UNRESCUED_COPY):
+    """Extract VIDEO_TS and AUDIO_TS from a DVD image with the in-process UDF reader.
+
+    Returns (destination, results, scrambled) where results are the tuples
+    returned by iso_extract.extract_files."""
+    destination = destination or video_output_dir(image_path)
+    data = open_image(image_path)
+    try:
+        listing = read_filesystem(data, prefer="udf")
+        paths = sorted({'/' + entry.path.lstrip('/').split('/', 1)[0] for entry in find_video_files(listing)})
+        if not paths:
+            raise FilesystemError("No VIDEO_TS or AUDIO_TS directory in the image")
+        scrambled = css_scrambled(data, listing)
+    finally:
+        data.close()
+    return destination, extract_files(image_path, destination, paths, mapfile, unrescued), scrambled
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract VIDEO_TS and AUDIO_TS from a DVD image without mounting it.")
+    parser.add_argument("image", help="Path to the DVD image")
+    parser.add_argument("destination", nargs="?", help="Directory to extract into (default: image name without extension)")
+    parser.add_argument("--mapfile", help="ddrescue mapfile describing the unrescued areas")
+    parser.add_argument("--unrescued", choices=[UNRESCUED_COPY, UNRESCUED_ZERO, UNRESCUED_SKIP], default=UNRESCUED_COPY)
+    args = parser.parse_args(argv)
+
+    try:
+        destination, results, scrambled = extract_video_ts(args.image, args.destination, args.mapfile, args.unrescued)
+    except (OSError, FilesystemError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    errors = [(entry, error) for entry, _, error in results if error is not None]
+    for entry, error in errors:
+        print(f"Error extracting {entry.path}: {error}", file=sys.stderr)
+    print(f"Extracted {len(results) - len(errors)} of {len(results)} files to {destination}")
+    if scrambled:
+        print("The title VOBs are CSS-encrypted; they are kept as stored on the disc.")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
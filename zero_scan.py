@@ -0,0 +1,149 @@
+import argparse
+import mmap
+import os
+import sys
+from config import SECTOR_SIZE
+from iosched import scheduler, background, advise_sequential, advise_done, VERIFY
+from mapfile import write_mapfile, merge_blocks, FINISHED, BAD_SECTOR
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Sector classes
+DATA = 0
+ZERO = 1
+FILLER = 2
+
+SCAN_CHUNK_SIZE = 64 * 1024 * 1024
+ZERO_SECTOR = bytes(SECTOR_SIZE)
+
+def filler_sector(pattern):
+    """Tile a fill pattern (as written by e.g. ddrescue --fill-mode) to one sector."""
+    if not pattern:
+        return None
+    return (pattern * (SECTOR_SIZE // len(pattern) + 1))[:SECTOR_SIZE]
+
+def classify_chunk(buf, filler=None):
+    """Classify each whole sector of buf as DATA, ZERO or FILLER.
+
+    A sector is FILLER if it consists of a single repeated 8-byte word (0xFF fill,
+    DEADBEEF markers and the like) or matches the given filler sector.
+    Returns a bytes object with one class code per sector."""
+    count = len(buf) // SECTOR_SIZE
+    if numpy is not None:
+        words = numpy.frombuffer(buf, dtype=numpy.uint64, count=count * SECTOR_SIZE // 8).reshape(count, SECTOR_SIZE // 8)
+        uniform = (words == words[:, :1]).all(axis=1)
+        zero = uniform & (words[:, 0] == 0)
+        classes = numpy.zeros(count, dtype=numpy.uint8)
+        classes[uniform] = FILLER
+        if filler is not None:
+            classes[(words == numpy.frombuffer(filler, dtype=numpy.uint64)).all(axis=1)] = FILLER
+        classes[zero] = ZERO
+        return classes.tobytes()
+
+    classes = bytearray(count)
+    view = memoryview(buf)
+    for index in range(count):
+        sector = bytes(view[index * SECTOR_SIZE:(index + 1) * SECTOR_SIZE])
+        if sector == ZERO_SECTOR:
+            classes[index] = ZERO
+        elif sector == sector[:8] * (SECTOR_SIZE // 8) or sector == filler:
+            classes[index] = FILLER
+    return bytes(classes)
+
+def scan_image(image_path, filler_pattern=None):
+    """Classify every sector of an image.
+
+    Returns a bytes object with one class code per sector. A trailing partial
+    sector is counted as data."""
+    filler = filler_sector(filler_pattern)
+    size = os.path.getsize(image_path)
+    if size < SECTOR_SIZE:
+        return b''
+    classes = bytearray()
+    with background(VERIFY), open(image_path, 'rb') as f:
+        advise_sequential(f.fileno())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            whole = size // SECTOR_SIZE * SECTOR_SIZE
+            for start in range(0, whole, SCAN_CHUNK_SIZE):
+                end = min(start + SCAN_CHUNK_SIZE, whole)
+                scheduler.take(VERIFY, end - start)
+                chunk = memoryview(data)[start:end]
+                try:
+                    classes += classify_chunk(chunk, filler)
+                finally:
+                    chunk.release()
+                advise_done(f.fileno(), start, end - start)
+    return bytes(classes)
+
+def suspect_blocks(classes, image_size):
+    """Turn per-sector classes into ddrescue mapfile blocks.
+
+    Zero and filler sectors are marked bad ('-'), everything else finished ('+')."""
+    blocks = []
+    run_start, run_class = 0, None
+    for index, sector_class in enumerate(classes):
+        status = FINISHED if sector_class == DATA else BAD_SECTOR
+        if status != run_class:
+            if run_class is not None:
+                blocks.append((run_start * SECTOR_SIZE, (index - run_start) * SECTOR_SIZE, run_class))
+            run_start, run_class = index, status
+    if run_class is not None:
+        blocks.append((run_start * SECTOR_SIZE, (len(classes) - run_start) * SECTOR_SIZE, run_class))
+    tail = image_size - len(classes) * SECTOR_SIZE
+    if tail > 0:
+        blocks.append((len(classes) * SECTOR_SIZE, tail, FINISHED))
+    return merge_blocks(blocks)
+
+def scan_summary(classes):
+    """Return sector counts per class plus the number and size of suspect runs."""
+    zero, filler = classes.count(ZERO), classes.count(FILLER)
+    runs, longest, current = 0, 0, 0
+    for sector_class in classes:
+        if sector_class == DATA:
+            current = 0
+        else:
+            if current == 0:
+                runs += 1
+            current += 1
+            longest = max(longest, current)
+    return {"sectors": len(classes), "data": len(classes) - zero - filler, "zero": zero, "filler": filler,
+            "suspect_runs": runs, "longest_run": longest}
+
+def format_scan_summary(summary):
+    total = summary["sectors"] or 1
+    return (f"{summary['zero']} zero and {summary['filler']} filler sectors out of {summary['sectors']} "
+            f"({(summary['zero'] + summary['filler']) / total * 100:.2f}% suspect, "
+            f"{summary['suspect_runs']} runs, longest {summary['longest_run']} sectors)")
+
+def write_suspect_mapfile(image_path, suspect_mapfile, filler_pattern=None):
+    """Scan an image and write a ddrescue-format mapfile marking zero/filler sectors as bad.
+
+    Legitimately empty areas (the system area, padding between files) are reported
+    too; combine the mapfile with damage_report.py to see which files are affected.
+    Returns the scan summary."""
+    classes = scan_image(image_path, filler_pattern)
+    write_mapfile(suspect_mapfile, suspect_blocks(classes, os.path.getsize(image_path)),
+                  comment=f"Zero/filler sector scan of {image_path}")
+    return scan_summary(classes)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find zero-filled and filler sectors in a disc image.")
+    parser.add_argument("image", help="Path to the image")
+    parser.add_argument("suspect_mapfile", nargs="?", help="Mapfile to write (default: <image>.suspect.map)")
+    parser.add_argument("--filler", help="Fill pattern used for unreadable sectors, e.g. 'BAD SECTOR '")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = write_suspect_mapfile(args.image, args.suspect_mapfile or args.image + ".suspect.map",
+                                        args.filler.encode() if args.filler else None)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(format_scan_summary(summary))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())